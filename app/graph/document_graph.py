@@ -1,28 +1,53 @@
 # app/graph/workflow_graph.py
+import operator
 from langgraph.graph import StateGraph, START, END
 from app.graph.nodes.pm_agent import fetch_pm_data_node
+from app.graph.nodes.clean_agent import clean_pm_data_node
 from app.graph.nodes.doc_agent import create_docs_node  # import doc node
-from typing import TypedDict, List, Dict
+from app.graph.nodes.section_agent import (
+    route_generation,
+    generate_section_node,
+    merge_sections_node
+)
+from typing import TypedDict, List, Dict, Annotated
 
 class WorkflowState(TypedDict):
     project_id: str
+    project_name: str
     user_trello_key: str
     user_trello_token: str
     uploaded_pdf_bytes: bytes
     pdf_headings: List[str]
     selected_headings: List[str]
     pm_data: Dict
+    cleaned_pm_data: str
+    pm_token_budget: int
+    pm_token_stats: Dict
     generated_docs: str
+    template_name: str
+    bypass_cache: bool
+    cache_hit: bool
+    generation_mode: str            # "single" | "sections"
+    section_group_size: int
+    sections: Annotated[List[Dict], operator.add]  # section fan-out results
+    generation_error: str           # set when no section could be generated
 
 graph = StateGraph(WorkflowState)
 
 # Add nodes
 graph.add_node("pm_agent", fetch_pm_data_node)
+graph.add_node("clean_pm", clean_pm_data_node)
 graph.add_node("doc_agent", create_docs_node)  # add doc node
+graph.add_node("section_agent", generate_section_node)  # one branch per heading group
+graph.add_node("merge_sections", merge_sections_node)
 
 # Add edges
 graph.add_edge(START, "pm_agent")
-graph.add_edge("pm_agent", "doc_agent")  # flow pm_agent → doc_agent
+graph.add_edge("pm_agent", "clean_pm")
+# clean_pm → doc_agent (single call) or → section_agent × N (fan-out)
+graph.add_conditional_edges("clean_pm", route_generation, ["doc_agent", "section_agent"])
+graph.add_edge("section_agent", "merge_sections")
+graph.add_edge("merge_sections", END)
 graph.add_edge("doc_agent", END)          # doc_agent → END
 
 workflow = graph.compile()
@@ -0,0 +1,151 @@
+# app/graph/nodes/clean_agent.py
+import os
+import asyncio
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import RunnableConfig
+
+from app.graph.nodes.doc_agent import get_llm, llm_timeout, DOC_LLM_MODEL, DOC_LLM_TIMEOUT
+from app.langsmith.load_prompt import get_prompt_version
+from app.services.pm_serializer import (
+    serialize_pm_data,
+    chunk_pm_data,
+    full_detail_tokens,
+    estimate_tokens
+)
+from app.services.generation_cache import (
+    compute_chunk_key,
+    get_chunk_summaries,
+    store_chunk_summary
+)
+
+# Boards above this many (full-detail) tokens are summarized map-reduce style
+MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv("MAP_REDUCE_THRESHOLD_TOKENS", 60000))
+MAP_REDUCE_CHUNK_TOKENS = int(os.getenv("MAP_REDUCE_CHUNK_TOKENS", 8000))
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", 4))
+MAP_REDUCE_MAX_ATTEMPTS = int(os.getenv("MAP_REDUCE_MAX_ATTEMPTS", 2))
+MAP_REDUCE_RETRY_DELAY = float(os.getenv("MAP_REDUCE_RETRY_DELAY", 1))  # seconds, doubled per attempt
+
+CHUNK_SUMMARY_PROMPT = PromptTemplate.from_template(
+    "You are summarizing part of a project-management board for a documentation writer.\n"
+    "List: {list_name} (part {part})\n\n"
+    "Summarize the cards below into concise bullet points. Keep every feature, "
+    "requirement, decision, owner label, due date and open checklist item; drop "
+    "repetition and chatter. Do not invent anything.\n\n"
+    "{chunk}"
+)
+
+
+# --------------------------------------------------
+# Map-reduce summarization
+# --------------------------------------------------
+async def summarize_pm_data(pm_data: dict, db=None, timeout: float = None) -> tuple:
+    """
+    Map: summarize each list / card-batch chunk concurrently (cached per chunk hash).
+    Reduce: join the summaries, grouped by list, as the doc prompt input.
+    A chunk that still fails after retries is passed through unsummarized,
+    so one bad call does not fail the whole generation.
+    Returns (text, stats).
+    """
+    chunks = chunk_pm_data(pm_data, MAP_REDUCE_CHUNK_TOKENS)
+    prompt_version = get_prompt_version(CHUNK_SUMMARY_PROMPT)
+    keys = [compute_chunk_key(c["text"], prompt_version, DOC_LLM_MODEL) for c in chunks]
+
+    cached = await get_chunk_summaries(db, keys) if db is not None else {}
+
+    chain = CHUNK_SUMMARY_PROMPT | get_llm()
+    semaphore = asyncio.Semaphore(MAP_REDUCE_CONCURRENCY)
+    failed = []
+
+    async def _summarize(chunk, key):
+        if key in cached:
+            return cached[key]
+
+        for attempt in range(1, MAP_REDUCE_MAX_ATTEMPTS + 1):
+            try:
+                async with semaphore:
+                    result = await asyncio.wait_for(
+                        chain.ainvoke({
+                            "list_name": chunk["list_name"],
+                            "part": chunk["part"],
+                            "chunk": chunk["text"]
+                        }),
+                        timeout=timeout or DOC_LLM_TIMEOUT
+                    )
+                break
+            except Exception as e:
+                print(f"⚠️ [clean_pm_data_node] chunk {chunk['list_name']} #{chunk['part']} failed (attempt {attempt}): {e}")
+                if attempt == MAP_REDUCE_MAX_ATTEMPTS:
+                    # Not cached: the next run tries to summarize it again
+                    failed.append(key)
+                    return chunk["text"]
+                await asyncio.sleep(MAP_REDUCE_RETRY_DELAY * (2 ** (attempt - 1)))
+
+        summary = result.content if hasattr(result, "content") else str(result)
+        if db is not None:
+            await store_chunk_summary(db, key, summary)
+        return summary
+
+    summaries = await asyncio.gather(*(_summarize(c, k) for c, k in zip(chunks, keys)))
+
+    sections = []
+    current_list = None
+    for chunk, summary in zip(chunks, summaries):
+        if chunk["list_name"] != current_list:
+            current_list = chunk["list_name"]
+            sections.append(f"## {current_list}")
+        sections.append(summary.strip())
+
+    text = "\n\n".join(sections)
+    stats = {
+        "chunks": len(chunks),
+        "chunks_cached": sum(1 for k in keys if k in cached),
+        "chunks_failed": len(failed),
+        "tokens": estimate_tokens(text),
+    }
+    return text, stats
+
+
+# --------------------------------------------------
+# Node
+# --------------------------------------------------
+async def clean_pm_data_node(state: dict, config: RunnableConfig = None) -> dict:
+    """
+    LangGraph node: turn raw pm_data into the compact, token-budgeted text
+    the doc prompt receives as `cleaned_pm_data`. Very large boards are
+    reduced with map-reduce summarization first.
+    """
+    pm_data = state.get("pm_data", {})
+    if not pm_data:
+        return {"cleaned_pm_data": "", "pm_token_stats": {}}
+
+    configurable = (config or {}).get("configurable") or {}
+    full_tokens = full_detail_tokens(pm_data)
+
+    if full_tokens > MAP_REDUCE_THRESHOLD_TOKENS:
+        cleaned, mr_stats = await summarize_pm_data(
+            pm_data,
+            db=configurable.get("db"),
+            timeout=llm_timeout(config)
+        )
+        stats = {
+            "cards": len(pm_data.get("cards", [])),
+            "raw_tokens": estimate_tokens(str(pm_data)),
+            "full_detail_tokens": full_tokens,
+            "mode": "map_reduce",
+            **mr_stats,
+        }
+        print(
+            f"🗜️ [clean_pm_data_node] map-reduce: {stats['chunks']} chunks "
+            f"({stats['chunks_cached']} cached), {full_tokens} → {stats['tokens']} tokens"
+        )
+        return {"cleaned_pm_data": cleaned, "pm_token_stats": stats}
+
+    cleaned, stats = serialize_pm_data(pm_data, state.get("pm_token_budget"))
+    stats["mode"] = "compact"
+
+    print(
+        f"🧹 [clean_pm_data_node] {stats['cards']} cards in {stats['lists']} lists: "
+        f"{stats['raw_tokens']} → {stats['tokens']} tokens (budget {stats['budget']})"
+    )
+
+    return {"cleaned_pm_data": cleaned, "pm_token_stats": stats}
@@ -1,41 +1,170 @@
 # app/graph/nodes/doc_agent.py
+import os
+import asyncio
+from langchain_core.runnables import RunnableConfig
 from langchain_google_genai import ChatGoogleGenerativeAI
-from app.langsmith.load_prompt import load_prompt_from_langsmith  
+from app.langsmith.load_prompt import (
+    load_prompt_from_langsmith,
+    get_cached_prompt,
+    get_prompt_version
+)
+from app.services.pm_serializer import serialize_pm_data
+from app.services.generation_cache import (
+    compute_cache_key,
+    get_cached_output,
+    store_output,
+    record_bypass
+)
 
-def generate_documentation(cleaned_pm_data: str, pdf_headings: list, selected_headings: list):
+DOC_PROMPT_NAME = "doc_prompt_pdf_selected"
+DOC_LLM_MODEL = os.getenv("DOC_LLM_MODEL", "gemini-2.5-flash")
+DOC_LLM_TIMEOUT = float(os.getenv("DOC_LLM_TIMEOUT", 180))  # seconds per LLM call
+DOC_LLM_MAX_RETRIES = int(os.getenv("DOC_LLM_MAX_RETRIES", 2))
+
+# Process-wide LLM client and prebuilt chains (rebuilt only when the prompt changes)
+_llm = None
+_chains = {}
+
+
+def get_llm():
+    global _llm
+    if _llm is None:
+        _llm = ChatGoogleGenerativeAI(
+            model=DOC_LLM_MODEL,
+            timeout=DOC_LLM_TIMEOUT,
+            max_retries=DOC_LLM_MAX_RETRIES
+        )
+    return _llm
+
+
+async def load_prompt(prompt_name: str = DOC_PROMPT_NAME):
+    # Cold-start lookups may hit disk or the network; keep those off the event loop
+    prompt = get_cached_prompt(prompt_name)
+    if prompt is None:
+        prompt = await asyncio.to_thread(load_prompt_from_langsmith, prompt_name)
+    return prompt
+
+
+async def get_doc_chain(prompt_name: str = DOC_PROMPT_NAME):
+    prompt = await load_prompt(prompt_name)
+    cached = _chains.get(prompt_name)
+    if cached and cached[0] is prompt:
+        return cached[1]
+
+    chain = prompt | get_llm()
+    _chains[prompt_name] = (prompt, chain)
+    return chain
+
+
+def _configurable(config: RunnableConfig = None) -> dict:
+    return (config or {}).get("configurable") or {}
+
+
+def llm_timeout(config: RunnableConfig = None) -> float:
+    """
+    Per-request LLM timeout. Capped at DOC_LLM_TIMEOUT, the shared client's
+    own timeout, which a longer value could not extend anyway.
+    """
+    requested = _configurable(config).get("llm_timeout")
+    if not requested:
+        return DOC_LLM_TIMEOUT
+    return min(float(requested), DOC_LLM_TIMEOUT)
+
+
+async def generate_documentation(
+    cleaned_pm_data: str,
+    pdf_headings: list,
+    selected_headings: list,
+    timeout: float = None,
+    metadata: dict = None
+):
     """
     Generate clean, professional documentation from PM data
-    using a prompt fetched from LangSmith Prompt Hub 
+    using a prompt fetched from LangSmith Prompt Hub.
+    `metadata` is attached to the LLM run (and to its streamed messages).
     """
-    prompt = load_prompt_from_langsmith("doc_prompt_pdf_selected")
-    llm = ChatGoogleGenerativeAI(model='gemini-2.5-flash')
-    chain = prompt | llm
+    chain = await get_doc_chain()
 
     # Pass all variables expected by your LangSmith prompt
-    result = chain.invoke({
-        "cleaned_pm_data": cleaned_pm_data,
-        "pdf_headings": pdf_headings,
-        "selected_headings": selected_headings
-    })
+    try:
+        result = await asyncio.wait_for(
+            chain.ainvoke({
+                "cleaned_pm_data": cleaned_pm_data,
+                "pdf_headings": pdf_headings,
+                "selected_headings": selected_headings
+            }, config={"metadata": metadata} if metadata else None),
+            timeout=timeout or DOC_LLM_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Documentation generation timed out after {timeout or DOC_LLM_TIMEOUT}s")
 
     return result.content if hasattr(result, "content") else str(result)
 
-def create_docs_node(state):
+async def generate_with_cache(state: dict, selected_headings: list, config: RunnableConfig = None):
     """
-    LangGraph node to generate documentation from pm_data.
+    Generate documentation for `selected_headings`, reusing a cached output
+    when the inputs are unchanged. Returns (docs, cache_hit).
     """
     pm_data = state.get("pm_data", {})
     pdf_headings = state.get("pdf_headings", [])
-    selected_headings = state.get("selected_headings", [])
 
-    print("\n📝 [create_docs_node] PM data received:")
-    print(pm_data)
+    # Compact text from the clean_pm stage (serialize here if the graph skipped it)
+    cleaned_pm_data = state.get("cleaned_pm_data")
+    if not cleaned_pm_data:
+        cleaned_pm_data, _ = serialize_pm_data(pm_data, state.get("pm_token_budget"))
+
+    # -------------------- Generation cache --------------------
+    db = _configurable(config).get("db")
+    cache_key = None
+
+    if db is not None:
+        prompt = await load_prompt(DOC_PROMPT_NAME)
+        cache_key = compute_cache_key(
+            cleaned_pm_data,
+            pdf_headings,
+            selected_headings,
+            state.get("template_name", ""),
+            get_prompt_version(prompt),
+            DOC_LLM_MODEL
+        )
+
+        if state.get("bypass_cache"):
+            record_bypass()
+        else:
+            cached = await get_cached_output(db, cache_key)
+            if cached is not None:
+                print("⚡ [doc_agent] generation cache hit")
+                return cached, True
+
+    docs = await generate_documentation(
+        cleaned_pm_data,
+        pdf_headings,
+        selected_headings,
+        timeout=llm_timeout(config),
+        # Lets streaming consumers tell interleaved section outputs apart
+        metadata={"section_index": state["section_index"]} if "section_index" in state else None
+    )
+
+    if cache_key:
+        await store_output(
+            db,
+            cache_key,
+            docs,
+            template_name=state.get("template_name", ""),
+            model=DOC_LLM_MODEL
+        )
+
+    return docs, False
+
+
+async def create_docs_node(state, config: RunnableConfig = None):
+    """
+    LangGraph node to generate documentation from pm_data.
+    """
+    pm_data = state.get("pm_data", {})
 
     if not pm_data:
         return {"generated_docs": "⚠️ PM data is empty. Please check the Trello fetch step."}
 
-    # Convert pm_data dict to cleaned string (or real cleaning logic later)
-    cleaned_pm_data = str(pm_data)
-
-    docs = generate_documentation(cleaned_pm_data, pdf_headings, selected_headings)
-    return {"generated_docs": docs}
+    docs, cache_hit = await generate_with_cache(state, state.get("selected_headings", []), config)
+    return {"generated_docs": docs, "cache_hit": cache_hit}
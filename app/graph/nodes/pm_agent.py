@@ -1,6 +1,10 @@
 # backend/app/graph/nodes/pm_agent.py
 
-import httpx
+from langchain_core.runnables import RunnableConfig
+
+from app.services.board_cache import get_member_boards
+from app.services.board_mirror import get_mirrored_pm_data
+from app.services.pm_connector import get_pm_data
 
 
 # --------------------------------------------------
@@ -14,22 +18,22 @@ async def get_board_id_from_name(
     if not board_name or board_name == "undefined":
         raise ValueError("Board name is empty or undefined")
 
-    url = "https://api.trello.com/1/members/me/boards"
-    params = {
-        "key": trello_key,
-        "token": trello_token,
-        "fields": "id,name"
-    }
-
-    async with httpx.AsyncClient(timeout=30) as client:
-        res = await client.get(url, params=params)
+    def _match(boards):
+        for board in boards:
+            if board["name"].strip().lower() == board_name.strip().lower():
+                return board["id"]
+        return None
 
-    if res.status_code != 200:
-        raise ValueError(f"Trello API error {res.status_code}: {res.text}")
+    try:
+        board_id = _match(await get_member_boards(trello_token))
+        if not board_id:
+            # Cached list may predate a new / renamed board
+            board_id = _match(await get_member_boards(trello_token, force_refresh=True))
+    except RuntimeError as e:
+        raise ValueError(str(e))
 
-    for board in res.json():
-        if board["name"].strip().lower() == board_name.strip().lower():
-            return board["id"]
+    if board_id:
+        return board_id
 
     raise ValueError(f"No Trello board found with name '{board_name}'")
 
@@ -37,7 +41,7 @@ async def get_board_id_from_name(
 # --------------------------------------------------
 # PM Agent Node
 # --------------------------------------------------
-async def fetch_pm_data_node(state: dict) -> dict:
+async def fetch_pm_data_node(state: dict, config: RunnableConfig = None) -> dict:
     trello_key = state.get("user_trello_key")
     trello_token = state.get("user_trello_token")
 
@@ -69,24 +73,14 @@ async def fetch_pm_data_node(state: dict) -> dict:
         raise ValueError("Unable to resolve Trello board")
 
     # --------------------------------------------------
-    # Fetch cards
+    # Fetch cards (local webhook-fed mirror when a DB is available)
     # --------------------------------------------------
-    url = f"https://api.trello.com/1/boards/{board_id}/cards"
-    params = {
-        "key": trello_key,
-        "token": trello_token,
-        "fields": "id,name,desc,idList"
-    }
-
-    async with httpx.AsyncClient(timeout=30) as client:
-        res = await client.get(url, params=params)
-
-    if res.status_code != 200:
-        raise ValueError(f"Trello cards fetch failed: {res.text}")
-
-    state["pm_data"] = {
-        "board_id": board_id,
-        "cards": res.json()
-    }
+    db = ((config or {}).get("configurable") or {}).get("db")
+
+    if db is not None:
+        state["pm_data"] = await get_mirrored_pm_data(db, board_id, trello_key, trello_token)
+    else:
+        # Single nested fetch: lists, cards, labels, checklists
+        state["pm_data"] = await get_pm_data(board_id, trello_key, trello_token)
 
     return state
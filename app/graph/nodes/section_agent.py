@@ -0,0 +1,134 @@
+# app/graph/nodes/section_agent.py
+import os
+import asyncio
+from langgraph.types import Send
+from langchain_core.runnables import RunnableConfig
+from app.graph.nodes.doc_agent import generate_with_cache
+
+SECTION_CONCURRENCY = int(os.getenv("SECTION_CONCURRENCY", 4))
+SECTION_MAX_ATTEMPTS = int(os.getenv("SECTION_MAX_ATTEMPTS", 3))
+SECTION_RETRY_DELAY = float(os.getenv("SECTION_RETRY_DELAY", 2))  # seconds, doubled per attempt
+SECTION_GROUP_SIZE = int(os.getenv("SECTION_GROUP_SIZE", 1))
+DOC_GENERATION_MODE = os.getenv("DOC_GENERATION_MODE", "single")  # "single" | "sections"
+
+_semaphore = None
+
+
+def _section_semaphore() -> asyncio.Semaphore:
+    # Created lazily so it binds to the running event loop
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(SECTION_CONCURRENCY)
+    return _semaphore
+
+
+# --------------------------------------------------
+# Router: single call or one branch per heading group
+# --------------------------------------------------
+def _ordered_groups(pdf_headings: list, selected_headings: list, group_size: int) -> list:
+    """
+    Selected headings in template order, chunked into groups.
+    """
+    order = {h: i for i, h in enumerate(pdf_headings or [])}
+    ordered = sorted(
+        selected_headings,
+        key=lambda h: order.get(h, len(order) + selected_headings.index(h))
+    )
+    size = max(1, group_size)
+    return [ordered[i:i + size] for i in range(0, len(ordered), size)]
+
+
+def route_generation(state: dict):
+    mode = state.get("generation_mode") or DOC_GENERATION_MODE
+    selected_headings = state.get("selected_headings", [])
+
+    if mode != "sections" or not selected_headings or not state.get("pm_data"):
+        return "doc_agent"
+
+    groups = _ordered_groups(
+        state.get("pdf_headings", []),
+        selected_headings,
+        state.get("section_group_size") or SECTION_GROUP_SIZE
+    )
+
+    return [
+        Send("section_agent", {
+            "pm_data": state["pm_data"],
+            "cleaned_pm_data": state.get("cleaned_pm_data", ""),
+            "pdf_headings": state.get("pdf_headings", []),
+            "template_name": state.get("template_name", ""),
+            "bypass_cache": state.get("bypass_cache", False),
+            "section_index": index,
+            "section_headings": group,
+        })
+        for index, group in enumerate(groups)
+    ]
+
+
+# --------------------------------------------------
+# Section branch
+# --------------------------------------------------
+async def generate_section_node(state: dict, config: RunnableConfig = None):
+    """
+    Generate one heading group, retrying only this section on failure.
+    """
+    headings = state.get("section_headings", [])
+    index = state.get("section_index", 0)
+    last_error = None
+
+    for attempt in range(1, SECTION_MAX_ATTEMPTS + 1):
+        try:
+            async with _section_semaphore():
+                content, cache_hit = await generate_with_cache(state, headings, config)
+            return {"sections": [{
+                "index": index,
+                "headings": headings,
+                "content": content,
+                "cache_hit": cache_hit,
+                "ok": True,
+            }]}
+        except Exception as e:
+            last_error = e
+            print(f"⚠️ [section_agent] section {index} {headings} failed (attempt {attempt}): {e}")
+            if attempt < SECTION_MAX_ATTEMPTS:
+                await asyncio.sleep(SECTION_RETRY_DELAY * (2 ** (attempt - 1)))
+
+    # Reported through ok/error only: a placeholder would be saved into the
+    # document and, once its heading exists, never regenerated by the merge
+    print(f"❌ [section_agent] giving up on section {index} {headings}: {last_error}")
+    return {"sections": [{
+        "index": index,
+        "headings": headings,
+        "content": "",
+        "cache_hit": False,
+        "ok": False,
+        "error": str(last_error),
+    }]}
+
+
+# --------------------------------------------------
+# Merge
+# --------------------------------------------------
+def merge_sections_node(state: dict):
+    """
+    Reassemble section outputs in template order, leaving out failed sections.
+    When no section succeeded the run fails like a failed single call
+    (generation_error is set and generated_docs stays empty).
+    """
+    sections = sorted(state.get("sections", []), key=lambda s: s["index"])
+    failed = [s for s in sections if not s.get("ok", True)]
+    if sections and len(failed) == len(sections):
+        return {
+            "generated_docs": "",
+            "cache_hit": False,
+            "generation_error": f"All {len(sections)} sections failed: {failed[-1].get('error')}",
+        }
+
+    merged = "\n\n".join(
+        s["content"].strip() for s in sections if s.get("ok", True) and s.get("content")
+    )
+
+    return {
+        "generated_docs": merged,
+        "cache_hit": bool(sections) and all(s.get("cache_hit") for s in sections),
+    }
@@ -1,27 +1,173 @@
 # app/langsmith/load_prompt.py
 
 import os
+import json
+import re
+import time
+import hashlib
+import threading
 from langsmith import Client
+from langchain_core.load import dumpd, load
 from langchain_core.prompts import PromptTemplate
 
-def load_prompt_from_langsmith(prompt_name: str):
-    """
-    Load a prompt template directly from LangSmith Prompt Hub using the LangSmith Client.
-    Falls back to a local default prompt if loading fails.
-    """
-    try:
+PROMPT_CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", 600))  # seconds
+PROMPT_CACHE_DIR = os.getenv("PROMPT_CACHE_DIR", ".prompt_cache")
+
+# (prompt_name, commit) -> (prompt, fetched_at)
+_cache = {}
+_refreshing = set()
+_lock = threading.Lock()
+_client = None
+
+
+def _get_client() -> Client:
+    global _client
+    if _client is None:
         LANGSMITH_API_KEY = os.getenv("LANGSMITH_API_KEY")
         if not LANGSMITH_API_KEY:
             raise EnvironmentError("Missing LANGSMITH_API_KEY in environment variables.")
+        _client = Client(api_key=LANGSMITH_API_KEY)
+    return _client
+
+
+def _fallback_prompt():
+    return PromptTemplate.from_template(
+        "You are a helpful document generator. Clean and organize the following PM data:\n\n{sections}"
+    )
+
+
+# --------------------------------------------------
+# Remote pull
+# --------------------------------------------------
+def _pull(prompt_name: str, commit: str = None):
+    identifier = f"{prompt_name}:{commit}" if commit else prompt_name
+    prompt = _get_client().pull_prompt(identifier, include_model=False)
+    if not prompt:
+        raise ValueError("LangSmith returned empty or invalid prompt.")
+    return prompt
+
+
+# --------------------------------------------------
+# On-disk last-known-good copy
+# --------------------------------------------------
+def _disk_path(prompt_name: str, commit: str = None) -> str:
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{prompt_name}__{commit or 'latest'}")
+    return os.path.join(PROMPT_CACHE_DIR, f"{safe}.json")
 
-        # Initialize LangSmith client
-        client = Client(api_key=LANGSMITH_API_KEY)
 
-        # Pull the prompt from LangSmith
-        prompt = client.pull_prompt(prompt_name, include_model=False)
+def _save_to_disk(prompt_name: str, commit: str, prompt):
+    try:
+        os.makedirs(PROMPT_CACHE_DIR, exist_ok=True)
+        path = _disk_path(prompt_name, commit)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(dumpd(prompt), f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"⚠️ Could not persist prompt '{prompt_name}' to disk: {e}")
+
+
+def _load_from_disk(prompt_name: str, commit: str = None):
+    path = _disk_path(prompt_name, commit)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return load(json.load(f))
+    except Exception as e:
+        print(f"⚠️ Could not read cached prompt '{prompt_name}' from disk: {e}")
+        return None
+
+
+# --------------------------------------------------
+# Background refresh
+# --------------------------------------------------
+def _refresh(prompt_name: str, commit: str = None):
+    key = (prompt_name, commit)
+    try:
+        prompt = _pull(prompt_name, commit)
+        with _lock:
+            _cache[key] = (prompt, time.monotonic())
+        _save_to_disk(prompt_name, commit, prompt)
+        print(f"✅ Refreshed prompt '{prompt_name}' from LangSmith.")
+    except Exception as e:
+        print(f"⚠️ Background refresh of prompt '{prompt_name}' failed, keeping cached copy: {e}")
+    finally:
+        with _lock:
+            _refreshing.discard(key)
+
 
-        if not prompt:
-            raise ValueError("LangSmith returned empty or invalid prompt.")
+def _schedule_refresh(prompt_name: str, commit: str = None):
+    key = (prompt_name, commit)
+    with _lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    threading.Thread(target=_refresh, args=(prompt_name, commit), daemon=True).start()
+
+
+# --------------------------------------------------
+# Public API
+# --------------------------------------------------
+def get_prompt_version(prompt) -> str:
+    """
+    Short content hash of a prompt, so caches can tell prompt revisions apart.
+    """
+    try:
+        raw = json.dumps(dumpd(prompt), sort_keys=True, default=str)
+    except Exception:
+        raw = repr(prompt)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def get_cached_prompt(prompt_name: str, commit: str = None):
+    """
+    In-memory prompt without any I/O (None on a cold cache), so async
+    callers can skip the worker thread on the hot path.
+    """
+    with _lock:
+        cached = _cache.get((prompt_name, commit))
+    if not cached:
+        return None
+
+    prompt, fetched_at = cached
+    if time.monotonic() - fetched_at >= PROMPT_CACHE_TTL:
+        _schedule_refresh(prompt_name, commit)
+    return prompt
+
+
+def load_prompt_from_langsmith(prompt_name: str, commit: str = None):
+    """
+    Load a prompt template from LangSmith Prompt Hub, cached in-process for
+    PROMPT_CACHE_TTL seconds and refreshed in the background when stale.
+    A copy is kept on disk, so a cold start or a LangSmith outage serves the
+    last known-good prompt; the generic fallback is only used when neither exists.
+    """
+    key = (prompt_name, commit)
+
+    with _lock:
+        cached = _cache.get(key)
+
+    if cached:
+        prompt, fetched_at = cached
+        if time.monotonic() - fetched_at >= PROMPT_CACHE_TTL:
+            _schedule_refresh(prompt_name, commit)
+        return prompt
+
+    # Cold start: serve the disk copy right away and refresh behind it
+    prompt = _load_from_disk(prompt_name, commit)
+    if prompt is not None:
+        with _lock:
+            _cache[key] = (prompt, float("-inf"))
+        _schedule_refresh(prompt_name, commit)
+        print(f"✅ Loaded prompt '{prompt_name}' from local cache.")
+        return prompt
+
+    try:
+        prompt = _pull(prompt_name, commit)
+        with _lock:
+            _cache[key] = (prompt, time.monotonic())
+        _save_to_disk(prompt_name, commit, prompt)
 
         print(f"✅ Successfully loaded prompt '{prompt_name}' from LangSmith.")
         return prompt
@@ -29,9 +175,4 @@ def load_prompt_from_langsmith(prompt_name: str):
     except Exception as e:
         print(f"❌ Error loading prompt '{prompt_name}': {e}")
         print("⚠️ Using fallback prompt instead.")
-
-        # Fallback prompt template
-        fallback = PromptTemplate.from_template(
-            "You are a helpful document generator. Clean and organize the following PM data:\n\n{sections}"
-        )
-        return fallback
+        return _fallback_prompt()
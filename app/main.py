@@ -1,13 +1,13 @@
 import os
 import re
+import json
 import asyncio
 import motor.motor_asyncio
 import uvicorn
-import httpx
 from fastapi import HTTPException
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from dotenv import load_dotenv
 
 # ------------------ Load ENV ------------------
@@ -47,7 +47,7 @@ from app.routes import auth as auth_router
 from app.routes import user as user_router
 from app.routes import templates as templates_router
 from app.routes import generated_docs as generated_docs_router
-from app.routes.trello_webhook import router as trello_webhook_router
+from app.routes.trello_webhook import router as trello_webhook_router, process_event
 
 app.include_router(auth_router.router, prefix="/auth")
 app.include_router(user_router.router, prefix="/api")
@@ -60,12 +60,51 @@ from app.services.trello_service import (
     connect_to_trello,
     register_trello_webhook
 )
+from app.services.trello_client import (
+    init_trello_client,
+    close_trello_client,
+    get_pool_stats
+)
+from app.services.board_cache import get_member_boards, get_board_cache_stats
 from app.models.user_token_model import (
-    get_all_user_tokens,
     get_user_token,
     save_user_token
 )
-from app.services.workflow_service import execute_workflow
+from app.services.webhook_registry import (
+    start_webhook_reconciler,
+    reconcile_user_webhooks,
+    map_user_boards,
+    get_reconcile_status
+)
+from app.services.board_mirror import run_mirror_sync_loop
+from app.services.workflow_service import execute_workflow, stream_workflow
+from app.services.generation_cache import get_generation_cache_stats
+from app.services.single_flight import get_single_flight_stats
+from app.services.job_queue import submit_job, get_job, start_job_workers
+from app.services.auto_regen import run_auto_regen_loop
+from app.services.webhook_queue import (
+    start_webhook_consumers,
+    get_webhook_queue_stats
+)
+from app.services.event_bus import (
+    subscribe,
+    unsubscribe,
+    run_push_fanout_loop,
+    get_push_stats,
+    PUSH_HEARTBEAT
+)
+from app.services.notification_retention import run_notification_compaction
+from app.services.index_registry import (
+    ensure_indexes,
+    explain_hot_queries,
+    run_index_diagnostics,
+    INDEX_DIAGNOSTICS
+)
+from app.services.notification_ingest import (
+    run_notification_flush_loop,
+    flush_notifications,
+    get_ingest_stats
+)
 
 # ------------------ MongoDB Startup ------------------
 # ------------------ MongoDB Startup ------------------
@@ -75,106 +114,70 @@ async def startup():
     client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URI)
     app.state.mongo_client = client
     app.state.db = client[DB_NAME]
+    app.state.user_reconciles = set()
     db = app.state.db
 
     print("✅ MongoDB connected")
 
-    # ✅ IMPORTANT: Prevent duplicate notifications
-    await db["notifications"].create_index(
-        "action_id",
-        unique=True,
-        sparse=True
-    )
-    print("✅ Notification index ensured")
+    # ------------------ Shared Trello HTTP client ------------------
+    await init_trello_client()
 
-    # ------------------ Fetch all users with Trello tokens ------------------
-    users = await get_all_user_tokens(db)
-    if not users:
-        print("⚠️ No users with Trello tokens found")
-        return
+    # ------------------ Indexes (declared in services/index_registry.py) ------------------
+    await ensure_indexes(db)
+    if INDEX_DIAGNOSTICS:
+        app.state.index_diagnostics = asyncio.create_task(run_index_diagnostics(db))
+
+    # ------------------ Periodic board mirror delta sync ------------------
+    app.state.mirror_sync = asyncio.create_task(run_mirror_sync_loop(db))
+
+    # ------------------ Generation job workers ------------------
+    app.state.job_workers = start_job_workers(db)
+
+    # ------------------ Webhook event consumers ------------------
+    app.state.webhook_consumers = start_webhook_consumers(db, process_event)
+
+    # ------------------ One-off raw_event compaction ------------------
+    app.state.notification_compaction = asyncio.create_task(run_notification_compaction(db))
+
+    # ------------------ Batched notification writes ------------------
+    app.state.notification_flush = asyncio.create_task(run_notification_flush_loop())
+
+    # ------------------ Push fan-out from other workers ------------------
+    app.state.push_fanout = asyncio.create_task(run_push_fanout_loop(db))
+
+    # ------------------ Debounced auto-regeneration ------------------
+    app.state.auto_regen = asyncio.create_task(run_auto_regen_loop(db))
 
     # ------------------ Prevent multiple startup runs ------------------
     if getattr(app.state, "webhooks_registered", False):
         return
     app.state.webhooks_registered = True
 
-    async with httpx.AsyncClient(timeout=20) as client_http:
-
-        for user in users:
-            token = user.get("trello_token")
-            user_id = user.get("user_id")
-
-            if not token:
-                continue
-
-            # ------------------ Fetch all boards for this user ------------------
-            try:
-                res = await client_http.get(
-                    "https://api.trello.com/1/members/me/boards",
-                    params={
-                        "key": TRELLO_API_KEY,
-                        "token": token,
-                        "fields": "id,name"
-                    }
-                )
-                res.raise_for_status()
-                boards = res.json()
-            except Exception as e:
-                print(f"❌ Failed to fetch boards for user {user_id}: {e}")
-                continue
-
-            for board in boards:
-                board_id = board["id"]
-                board_name = board["name"]
-
-                # ------------------ Map board to user in DB ------------------
-                await db["board_user_map"].update_one(
-                    {"board_id": board_id},
-                    {"$set": {"user_id": user_id, "board_name": board_name}},
-                    upsert=True
-                )
-
-                # ------------------ Safe webhook registration ------------------
-                try:
-                    check_res = await client_http.get(
-                        f"https://api.trello.com/1/tokens/{token}/webhooks",
-                        params={"key": TRELLO_API_KEY, "token": token}
-                    )
-                    check_res.raise_for_status()
-                    existing_hooks = check_res.json()
-
-                    if any(
-                        hook.get("idModel") == board_id and hook.get("callbackURL") == TRELLO_CALLBACK_URL
-                        for hook in existing_hooks
-                    ):
-                        print(f"⚡ Webhook already exists for board {board_id}")
-                        continue
-
-                    create_res = await client_http.post(
-                        "https://api.trello.com/1/webhooks",
-                        params={"key": TRELLO_API_KEY, "token": token},
-                        json={
-                            "idModel": board_id,
-                            "callbackURL": TRELLO_CALLBACK_URL,
-                            "description": "AutoDocGen Webhook"
-                        }
-                    )
-                    create_res.raise_for_status()
-                    print(f"✅ Webhook registered for board {board_id}")
-
-                except httpx.HTTPStatusError as e:
-                    print(
-                        f"❌ Failed to create webhook for board {board_id}: "
-                        f"{e.response.status_code}, {e.response.text}"
-                    )
-                except Exception as e:
-                    print(
-                        f"❌ Unexpected error registering webhook for board {board_id}: {e}"
-                    )
+    # ------------------ Webhook reconcile (background, non-blocking) ------------------
+    app.state.webhook_reconciler = start_webhook_reconciler(db)
 
 # ------------------ Shutdown ------------------
 @app.on_event("shutdown")
 async def shutdown():
+    for task_name in (
+        "webhook_reconciler", "mirror_sync", "auto_regen", "notification_flush", "push_fanout",
+        "notification_compaction", "index_diagnostics",
+    ):
+        task = getattr(app.state, task_name, None)
+        if task and not task.done():
+            task.cancel()
+
+    for task in (
+        getattr(app.state, "job_workers", [])
+        + getattr(app.state, "webhook_consumers", [])
+        + list(getattr(app.state, "user_reconciles", ()))
+    ):
+        task.cancel()
+
+    # Write out any buffered notifications before the connection goes away
+    await flush_notifications()
+
+    await close_trello_client()
     app.state.mongo_client.close()
 
 # ------------------ Trello Connect ------------------
@@ -188,6 +191,13 @@ def trello_callback():
     return RedirectResponse(f"{FRONTEND_URL}/boards")
 
 # ------------------ Save Trello Token ------------------
+async def _reconcile_new_user(db, user_id: str, trello_token: str, boards: list):
+    try:
+        await reconcile_user_webhooks(db, user_id, trello_token, boards=boards)
+    except Exception as e:
+        print(f"❌ Webhook reconcile failed for user {user_id}: {e}")
+
+
 @app.post("/trello/save_token")
 async def trello_save_token(request: Request):
     data = await request.json()
@@ -197,45 +207,27 @@ async def trello_save_token(request: Request):
 
     await save_user_token(user_id, trello_token, db)
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        res = await client.get(
-            "https://api.trello.com/1/members/me/boards",
-            params={
-                "key": TRELLO_API_KEY,
-                "token": trello_token,
-                "fields": "id,name,desc",
-                "filter": "open"
-            }
-        )
-        boards = res.json()
-
-    for board in boards:
-        await db["board_user_map"].update_one(
-            {"board_id": board["id"]},
-            {"$set": {
-                "user_id": user_id,
-                "board_name": board["name"],
-                "board_desc": board.get("desc", "")
-            }},
-            upsert=True
-        )
+    # One fresh listing, shared with the webhook reconcile below
+    boards = await get_member_boards(trello_token, force_refresh=True)
+    await map_user_boards(db, user_id, boards)
+
+    # Register webhooks for the newly connected account without blocking the response.
+    # Keep a reference so the task is not garbage-collected mid-run.
+    task = asyncio.create_task(_reconcile_new_user(db, user_id, trello_token, boards))
+    app.state.user_reconciles.add(task)
+    task.add_done_callback(app.state.user_reconciles.discard)
 
     return {"status": "success"}
 
 # ------------------ Boards with Headings ------------------
 @app.get("/trello/boards_with_headings")
-async def boards_with_headings(user_id: str):
+async def boards_with_headings(user_id: str, refresh: bool = False):
     db = app.state.db
     token = await get_user_token(user_id, db)
     if not token:
         return {"status": "error", "boards": []}
 
-    async with httpx.AsyncClient(timeout=15) as client:
-        res = await client.get(
-            "https://api.trello.com/1/members/me/boards",
-            params={"key": TRELLO_API_KEY, "token": token, "fields": "id,name,desc"}
-        )
-        boards = res.json()
+    boards = await get_member_boards(token, force_refresh=refresh, db=db, user_id=user_id)
 
     docs = await db["generated_docs"].find({"user_id": user_id}).to_list(None)
     doc_map = {d["project_id"]: d for d in docs}
@@ -254,6 +246,21 @@ async def boards_with_headings(user_id: str):
 
     return {"status": "success", "boards": result}
 
+# ------------------ Trello HTTP pool stats ------------------
+@app.get("/trello/pool-stats")
+async def trello_pool_stats():
+    return {"status": "success", "pool": get_pool_stats(), "board_cache": get_board_cache_stats()}
+
+# ------------------ Webhook reconcile status ------------------
+@app.get("/trello/webhooks/status")
+async def trello_webhooks_status():
+    return {
+        "status": "success",
+        "reconcile": get_reconcile_status(),
+        "queue": await get_webhook_queue_stats(app.state.db),
+        "ingest": get_ingest_stats()
+    }
+
 # ------------------ Workflow ------------------
 @app.post("/workflow/run")
 async def run_workflow(request: Request):
@@ -262,6 +269,11 @@ async def run_workflow(request: Request):
     if not all(k in data for k in ("user_id", "project_id", "template")):
         raise HTTPException(status_code=400, detail="Missing required fields")
 
+    # Queue it instead of holding the request open for the whole run
+    if data.get("async"):
+        job_id = await submit_job(request.app.state.db, data["user_id"], data["project_id"], data)
+        return {"status": "queued", "job_id": job_id}
+
     return await execute_workflow(
         data["user_id"],
         data["project_id"],
@@ -270,6 +282,123 @@ async def run_workflow(request: Request):
     )
 
 
+@app.post("/workflow/stream")
+async def run_workflow_stream(request: Request):
+    """
+    Streaming variant of /workflow/run: progress and LLM text as Server-Sent Events.
+    """
+    data = await request.json()
+
+    if not all(k in data for k in ("user_id", "project_id", "template")):
+        raise HTTPException(status_code=400, detail="Missing required fields")
+
+    async def event_source():
+        async for item in stream_workflow(
+            data["user_id"],
+            data["project_id"],
+            data,
+            db=request.app.state.db
+        ):
+            yield f"event: {item['event']}\ndata: {json.dumps(item['data'], default=str)}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/workflow/jobs")
+async def submit_workflow_job(request: Request):
+    """
+    Queue a generation run; poll /workflow/jobs/{job_id} for progress.
+    """
+    data = await request.json()
+
+    if not all(k in data for k in ("user_id", "project_id", "template")):
+        raise HTTPException(status_code=400, detail="Missing required fields")
+
+    job_id = await submit_job(request.app.state.db, data["user_id"], data["project_id"], data)
+    return {"status": "queued", "job_id": job_id}
+
+
+@app.get("/workflow/jobs/{job_id}")
+async def workflow_job_status(job_id: str):
+    job = await get_job(app.state.db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"status": "success", "job": job}
+
+
+@app.get("/workflow/jobs/{job_id}/result")
+async def workflow_job_result(job_id: str):
+    job = await get_job(app.state.db, job_id, include_result=True)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job["status"] in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"Job is still {job['status']}")
+
+    if job["status"] == "failed":
+        return {"status": "error", "message": job.get("error") or "Generation failed", "job_id": job_id}
+
+    return job["result"]
+
+
+@app.get("/events/stats")
+async def push_event_stats():
+    return {"status": "success", "push": get_push_stats()}
+
+
+@app.get("/events/{user_id}")
+async def push_events(user_id: str, request: Request):
+    """
+    Server-Sent Events push channel: `notification` for new Trello events,
+    `document_ready` when a generated document is saved, plus heartbeats.
+    """
+    queue = subscribe(user_id)
+
+    async def event_source():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=PUSH_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield "event: heartbeat\ndata: {}\n\n"
+                    continue
+                yield f"event: {item['event']}\ndata: {json.dumps(item['data'], default=str)}\n\n"
+        finally:
+            unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/db/index-diagnostics")
+async def index_diagnostics():
+    report = await explain_hot_queries(app.state.db)
+    return {
+        "status": "success",
+        "collscans": [r["query"] for r in report if r.get("collscan")],
+        "queries": report
+    }
+
+
+@app.get("/workflow/cache-stats")
+async def workflow_cache_stats():
+    return {
+        "status": "success",
+        "generation_cache": get_generation_cache_stats(),
+        "single_flight": get_single_flight_stats()
+    }
+
+
 @app.get("/workflow/generated")
 async def get_generated_doc(user_id: str, project_id: str, template_name: str):
     db = app.state.db
@@ -1,5 +1,7 @@
 from fastapi import APIRouter, HTTPException, Request
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime
+from bson import ObjectId
 
 router = APIRouter(
     tags=["Generated Documents"]
@@ -68,3 +70,125 @@ async def get_docs_by_board(
         "count": len(docs),
         "documents": docs
     }
+
+
+# -------------------------------------------------
+# Paginated metadata-only listing (no document bodies)
+# -------------------------------------------------
+DOCS_PAGE_SIZE = 50
+DOCS_MAX_PAGE_SIZE = 200
+
+DOC_LIST_PROJECTION = {
+    "project_id": 1,
+    "template_name": 1,
+    "version": 1,
+    "board_name": 1,
+    "created_at": 1,
+    # Older versions were saved without a size
+    "size": {"$ifNull": ["$size", {"$strLenBytes": {"$ifNull": ["$generated_docs", ""]}}]},
+}
+
+
+@router.get("/list")
+async def list_generated_docs(
+    request: Request,
+    user_id: str,
+    project_id: str = None,
+    template_name: str = None,
+    limit: int = DOCS_PAGE_SIZE,
+    before: str = None,
+    before_id: str = None
+):
+    """
+    Newest-first document versions for a user, metadata only.
+    Pass the returned `next_cursor` as `before` / `before_id` for the next page;
+    fetch a body with /generated-docs/{id}.
+    """
+    db: AsyncIOMotorDatabase = request.app.state.db
+    limit = max(1, min(limit, DOCS_MAX_PAGE_SIZE))
+
+    query = {"user_id": user_id}
+    if project_id:
+        query["project_id"] = project_id
+    if template_name:
+        query["template_name"] = template_name
+
+    if before:
+        try:
+            before_at = datetime.fromisoformat(before)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid 'before' timestamp")
+
+        if before_id and ObjectId.is_valid(before_id):
+            query["$or"] = [
+                {"created_at": {"$lt": before_at}},
+                {"created_at": before_at, "_id": {"$lt": ObjectId(before_id)}},
+            ]
+        else:
+            query["created_at"] = {"$lt": before_at}
+
+    rows = await db["generated_docs"] \
+        .find(query, DOC_LIST_PROJECTION) \
+        .sort([("created_at", -1), ("_id", -1)]) \
+        .limit(limit + 1) \
+        .to_list(limit + 1)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    docs = [
+        {
+            "id": str(doc["_id"]),
+            "project_id": doc.get("project_id"),
+            "template_name": (doc.get("template_name") or "").strip(),
+            "version": doc.get("version", 1),
+            "board_name": (doc.get("board_name") or "Unknown Board").strip(),
+            "created_at": doc.get("created_at"),
+            "size": doc.get("size", 0),
+        }
+        for doc in rows
+    ]
+
+    next_cursor = None
+    if has_more and rows[-1].get("created_at"):
+        next_cursor = {"before": rows[-1]["created_at"].isoformat(), "before_id": str(rows[-1]["_id"])}
+
+    return {
+        "status": "success",
+        "count": len(docs),
+        "documents": docs,
+        "has_more": has_more,
+        "next_cursor": next_cursor
+    }
+
+
+# -------------------------------------------------
+# Get a SINGLE version's body
+# -------------------------------------------------
+@router.get("/{doc_id}")
+async def get_generated_doc_version(request: Request, doc_id: str, user_id: str = None):
+    db: AsyncIOMotorDatabase = request.app.state.db
+
+    if not ObjectId.is_valid(doc_id):
+        raise HTTPException(status_code=400, detail="Invalid document id")
+
+    query = {"_id": ObjectId(doc_id)}
+    if user_id:
+        query["user_id"] = user_id
+
+    doc = await db["generated_docs"].find_one(query)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    return {
+        "status": "success",
+        "document": {
+            "id": str(doc["_id"]),
+            "project_id": doc.get("project_id"),
+            "template_name": (doc.get("template_name") or "").strip(),
+            "version": doc.get("version", 1),
+            "board_name": (doc.get("board_name") or "Unknown Board").strip(),
+            "created_at": doc.get("created_at"),
+            "generated_docs": doc.get("generated_docs", ""),
+        }
+    }
@@ -7,9 +7,11 @@ router = APIRouter()
 async def get_headings(request: Request, template: str = Query(...)):
     db = request.app.state.db.get_collection("templates")
     
-    # Case-insensitive search
-    import re
-    doc = await db.find_one({"template_name": re.compile(f"^{template.strip()}$", re.IGNORECASE)})
+    # Case-insensitive match served by the template_name collation index
+    doc = await db.find_one(
+        {"template_name": template.strip()},
+        collation={"locale": "en", "strength": 2}
+    )
 
     if not doc:
         return JSONResponse(
@@ -1,11 +1,23 @@
-from fastapi import APIRouter, Request, Response, BackgroundTasks, Depends
+from fastapi import APIRouter, Request, Response, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime
 from bson import ObjectId
-from pymongo.errors import DuplicateKeyError   # ✅ IMPORTANT
 
 from app.db import get_db
-from app.services.workflow_service import execute_workflow
+from app.services.workflow_service import execute_workflow, copy_doc_as_new_version
+from app.services.board_cache import invalidate_board, invalidate_token
+from app.services.board_mirror import apply_webhook_action, MIRROR_ONLY_ACTIONS
+from app.services.auto_regen import note_board_activity, set_auto_regen, get_auto_regen
+from app.services.notification_ingest import (
+    get_board_entry,
+    remember_board_entry,
+    forget_board_entry,
+    seen_action,
+    enqueue_notification
+)
+from app.services.webhook_queue import enqueue_webhook_event, replay_webhook_events
+from app.services.notification_retention import trim_raw_event
+from app.services.event_bus import publish
 
 router = APIRouter(tags=["Trello Webhook"])
 
@@ -23,26 +35,93 @@ async def trello_verify():
 # Webhook receiver
 # ----------------------------
 @router.post("/pm")
-async def trello_webhook(
-    request: Request,
-    background_tasks: BackgroundTasks,
-    db: AsyncIOMotorDatabase = Depends(get_db)
-):
+async def trello_webhook(request: Request):
     payload = await request.json()
-    background_tasks.add_task(process_event, payload, db=db)
+
+    # Persist and acknowledge; the consumer pool does the actual processing.
+    # If the insert fails Trello gets a 5xx and retries the delivery.
+    # Same database the consumers poll (not the get_db dependency)
+    await enqueue_webhook_event(request.app.state.db, payload)
     return Response(status_code=200)
 
 
+@router.post("/trello/webhooks/replay")
+async def replay_webhooks(request: Request):
+    body = await request.json()
+
+    try:
+        since = datetime.fromisoformat(body["since"])
+        until = datetime.fromisoformat(body["until"]) if body.get("until") else None
+    except (KeyError, ValueError):
+        return {"status": "error", "message": "'since' (ISO datetime, UTC) is required"}
+
+    replayed = await replay_webhook_events(request.app.state.db, since, until, body.get("board_id"))
+    return {"status": "success", "replayed": replayed}
+
+
+# ----------------------------
+# Board list cache invalidation
+# ----------------------------
+BOARD_LIST_ACTIONS = {
+    "createBoard",
+    "updateBoard",
+    "copyBoard",
+    "addMemberToBoard",
+    "removeMemberFromBoard",
+    "addToOrganizationBoard",
+    "removeFromOrganizationBoard",
+}
+
+
+async def invalidate_board_lists(board_id: str, db: AsyncIOMotorDatabase):
+    if not board_id:
+        return
+
+    invalidate_board(board_id)
+
+    # A new board is not in any cached list yet, so also drop the owner's entry
+    board_entry = await db["board_user_map"].find_one({"board_id": board_id})
+    if board_entry:
+        token_doc = await db["tokens"].find_one({"user_id": board_entry["user_id"]})
+        if token_doc:
+            invalidate_token(token_doc.get("trello_token"))
+
+
 # ----------------------------
 # Background processor
 # ----------------------------
-async def process_event(event: dict, db: AsyncIOMotorDatabase):
+async def process_event(event: dict, db: AsyncIOMotorDatabase, redelivery: bool = False):
+    """
+    Handle one webhook payload. Safe to run more than once per action.
+    Returns an awaitable that completes once the notification is written and
+    pushed (or None when nothing was queued).
+    """
 
     action = event.get("action", {})
     action_id = action.get("id")
     action_type = action.get("type")
     data = action.get("data", {})
 
+    # Board-level changes (rename, close, membership) invalidate cached board lists
+    if action_type in BOARD_LIST_ACTIONS:
+        board_info = data.get("board", {})
+        if action_type == "updateBoard" and board_info.get("id") and board_info.get("name"):
+            await db["board_user_map"].update_one(
+                {"board_id": board_info["id"]},
+                {"$set": {"board_name": board_info["name"]}}
+            )
+        forget_board_entry(board_info.get("id"))
+        await invalidate_board_lists(board_info.get("id"), db)
+        return
+
+    # List / checklist item changes only matter to the card mirror
+    if action_type in MIRROR_ONLY_ACTIONS:
+        try:
+            await apply_webhook_action(db, action)
+        except Exception as e:
+            print("❌ Board mirror update error:", e)
+        return
+
     # Only card-related actions
     if not action_type or not action_type.endswith("Card"):
         print("Skipping non-card event:", action_type)
@@ -55,12 +134,37 @@ async def process_event(event: dict, db: AsyncIOMotorDatabase):
     if not board_id:
         return
 
-    board_entry = await db["board_user_map"].find_one({"board_id": board_id})
+    # Trello retries deliveries; drop ones this process already handled
+    if seen_action(action_id) and not redelivery:
+        print("⚡ Duplicate webhook ignored:", action_id)
+        return
+
+    # Keep the local card mirror current
+    try:
+        await apply_webhook_action(db, action)
+    except Exception as e:
+        print("❌ Board mirror update error:", e)
+
+    # Opt-in boards: push back the debounced auto-regeneration
+    try:
+        await note_board_activity(db, board_id)
+    except Exception as e:
+        print("❌ Auto-regeneration scheduling error:", e)
+
+    board_entry = await get_board_entry(db, board_id)
     if not board_entry:
         return
 
     user_id = str(board_entry["user_id"])
 
+    # Keep the local board name in sync with what Trello sends us
+    if board_info.get("name") and board_entry.get("board_name") != board_name:
+        await db["board_user_map"].update_one(
+            {"board_id": board_id},
+            {"$set": {"board_name": board_name}}
+        )
+        remember_board_entry(board_id, {**board_entry, "board_name": board_name})
+
     card = data.get("card", {})
     card_name = card.get("name") or f"Card {card.get('idShort', '')}"
     card_id = card.get("id", "")
@@ -109,59 +213,131 @@ async def process_event(event: dict, db: AsyncIOMotorDatabase):
         "message": message,
         "is_read": False,
         "created_at": datetime.utcnow(),
-        "raw_event": action,
+        "raw_event": trim_raw_event(action),
+        "raw_event_trimmed": True,
         "action_id": action_id
     }
 
     # ----------------------------
-    # Insert with duplicate protection
+    # Batched insert (unique action_id index drops cross-process duplicates)
     # ----------------------------
-    try:
-        await db["notifications"].insert_one(notification_doc)
-        print("✅ Notification stored")
-
-    except DuplicateKeyError:
-        # Happens when same action_id already inserted
-        print("⚡ Duplicate webhook ignored:", action_id)
+    written = await enqueue_notification(db, notification_doc)
+    return _publish_when_written(db, written, notification_doc)
+
+
+async def _publish_when_written(db, written, notification_doc: dict):
+    """
+    Push the notification to open dashboards once it is stored. Redeliveries
+    and replays hit the unique action_id index (written resolves to None)
+    and are not pushed again.
+    """
+    inserted_id = await written
+    if inserted_id is None:
+        return
 
-    except Exception as e:
-        print("❌ Notification insert error:", e)
+    await publish(db, notification_doc["user_id"], "notification", {
+        "_id": str(inserted_id),   # same shape as the list endpoint, usable with mark-read
+        "action_id": notification_doc["action_id"],
+        "board_id": notification_doc["board_id"],
+        "board_name": notification_doc["board_name"],
+        "card_id": notification_doc["card_id"],
+        "action_type": notification_doc["action_type"],
+        "message": notification_doc["message"],
+        "created_at": notification_doc["created_at"].isoformat()
+    })
 
 
 # ----------------------------
 # Fetch notifications
 # ----------------------------
-@router.get("/trello/notifications/{user_id}")
-async def get_notifications(user_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
-
-    notifications = await db["notifications"] \
-        .find({"user_id": user_id}) \
-        .sort("created_at", -1) \
-        .to_list(100)
+NOTIFICATIONS_PAGE_SIZE = 100
+NOTIFICATIONS_MAX_PAGE_SIZE = 500
 
-    unread_count = 0
-    grouped = {}
 
-    for n in notifications:
-        n["_id"] = str(n["_id"])
-
-        if not n.get("is_read"):
-            unread_count += 1
-
-        board_id = n.get("board_id", "unknown")
-        board_name = n.get("board_name", "Untitled Board")
-
-        grouped.setdefault(board_id, {
-            "board_name": board_name,
-            "notifications": []
-        })
+@router.get("/trello/notifications/{user_id}")
+async def get_notifications(
+    user_id: str,
+    limit: int = NOTIFICATIONS_PAGE_SIZE,
+    before: str = None,
+    before_id: str = None,
+    board_id: str = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """
+    Newest-first page of notifications grouped by board (raw Trello payload
+    excluded). Pass the returned `next_cursor` as `before` / `before_id`
+    to load older ones.
+    """
+    limit = max(1, min(limit, NOTIFICATIONS_MAX_PAGE_SIZE))
+
+    match = {"user_id": user_id}
+    if board_id:
+        match["board_id"] = board_id
+
+    unread_count = await db["notifications"].count_documents({**match, "is_read": False})
+
+    # -------------------- Cursor (created_at, _id) --------------------
+    if before:
+        try:
+            before_at = datetime.fromisoformat(before)
+        except ValueError:
+            return {"status": "error", "message": "Invalid 'before' timestamp"}
+
+        if before_id and ObjectId.is_valid(before_id):
+            match["$or"] = [
+                {"created_at": {"$lt": before_at}},
+                {"created_at": before_at, "_id": {"$lt": ObjectId(before_id)}},
+            ]
+        else:
+            match["created_at"] = {"$lt": before_at}
+
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"created_at": -1, "_id": -1}},
+        {"$limit": limit + 1},
+        {"$project": {"raw_event": 0}},
+        # One extra row tells us whether there is another page
+        {"$group": {"_id": None, "items": {"$push": "$$ROOT"}}},
+        {"$project": {
+            "has_more": {"$gt": [{"$size": "$items"}, limit]},
+            "items": {"$slice": ["$items", limit]},
+        }},
+        {"$project": {"has_more": 1, "items": 1, "last": {"$arrayElemAt": ["$items", -1]}}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {"$ifNull": ["$items.board_id", "unknown"]},
+            "board_name": {"$first": {"$ifNull": ["$items.board_name", "Untitled Board"]}},
+            "latest_at": {"$first": "$items.created_at"},
+            "notifications": {"$push": "$items"},
+            "has_more": {"$first": "$has_more"},
+            "last": {"$first": "$last"},
+        }},
+        {"$sort": {"latest_at": -1}},
+    ]
+
+    groups = await db["notifications"].aggregate(pipeline).to_list(None)
 
-        grouped[board_id]["notifications"].append(n)
+    grouped = {}
+    for g in groups:
+        for n in g["notifications"]:
+            n["_id"] = str(n["_id"])
+        grouped[g["_id"]] = {
+            "board_name": g["board_name"],
+            "notifications": g["notifications"]
+        }
+
+    has_more = bool(groups and groups[0]["has_more"])
+    next_cursor = None
+    if has_more:
+        last = groups[0]["last"]
+        next_cursor = {"before": last["created_at"].isoformat(), "before_id": str(last["_id"])}
 
     return {
         "status": "success",
         "unread_count": unread_count,
-        "notifications_by_board": grouped
+        "notifications_by_board": grouped,
+        "has_more": has_more,
+        "next_cursor": next_cursor
     }
 
 
@@ -175,7 +351,7 @@ async def mark_notification_read(
 ):
     result = await db["notifications"].update_one(
         {"_id": ObjectId(notification_id)},
-        {"$set": {"is_read": True}}
+        {"$set": {"is_read": True, "read_at": datetime.utcnow()}}
     )
 
     return {
@@ -184,6 +360,100 @@ async def mark_notification_read(
     }
 
 
+# ----------------------------
+# Bulk mark as read
+# ----------------------------
+async def _mark_read(db: AsyncIOMotorDatabase, query: dict, user_id: str = None) -> dict:
+    # Only unread ones, so modified_count is the number of notifications cleared
+    result = await db["notifications"].update_many(
+        {**query, "is_read": False},
+        {"$set": {"is_read": True, "read_at": datetime.utcnow()}}
+    )
+
+    response = {"status": "success", "modified_count": result.modified_count}
+    if user_id:
+        response["unread_count"] = await db["notifications"].count_documents(
+            {"user_id": user_id, "is_read": False}
+        )
+    return response
+
+
+@router.post("/notifications/mark-read")
+async def mark_notifications_read(
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    body = await request.json()
+
+    ids = [ObjectId(i) for i in body.get("notification_ids", []) if ObjectId.is_valid(i)]
+    if not ids:
+        return {"status": "error", "message": "No valid notification_ids"}
+
+    query = {"_id": {"$in": ids}}
+    if body.get("user_id"):
+        query["user_id"] = body["user_id"]
+
+    return await _mark_read(db, query, body.get("user_id"))
+
+
+@router.post("/notifications/mark-all-read")
+async def mark_all_notifications_read(
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """
+    Mark every unread notification of a user read, optionally only for one
+    board and/or only those created up to `up_to` (ISO timestamp, UTC).
+    """
+    body = await request.json()
+
+    user_id = body.get("user_id")
+    if not user_id:
+        return {"status": "error", "message": "Missing user_id"}
+
+    query = {"user_id": user_id}
+    if body.get("board_id"):
+        query["board_id"] = body["board_id"]
+
+    if body.get("up_to"):
+        try:
+            query["created_at"] = {"$lte": datetime.fromisoformat(body["up_to"])}
+        except ValueError:
+            return {"status": "error", "message": "Invalid 'up_to' timestamp"}
+
+    return await _mark_read(db, query, user_id)
+
+
+# ----------------------------
+# Auto-regeneration settings
+# ----------------------------
+@router.put("/trello/boards/{board_id}/auto-regen")
+async def update_auto_regen(
+    board_id: str,
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    body = await request.json()
+
+    user_id = body.get("user_id")
+    if not user_id:
+        return {"status": "error", "message": "Missing user_id"}
+
+    if body.get("enabled", True) and not body.get("templates"):
+        return {"status": "error", "message": "At least one template is required"}
+
+    settings = await set_auto_regen(db, board_id, user_id, body)
+    return {"status": "success", "auto_regen": settings}
+
+
+@router.get("/trello/boards/{board_id}/auto-regen")
+async def read_auto_regen(board_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
+    settings = await get_auto_regen(db, board_id)
+    if not settings:
+        return {"status": "success", "auto_regen": {"board_id": board_id, "enabled": False}}
+    return {"status": "success", "auto_regen": settings}
+
+
 # ----------------------------
 # Get documents for board
 # ----------------------------
@@ -228,12 +498,7 @@ async def regenerate_doc(
         if not doc:
             continue
 
-        new_doc = doc.copy()
-        new_doc["_id"] = ObjectId()
-        new_doc["version"] = doc.get("version", 1) + 1
-        new_doc["created_at"] = datetime.utcnow()
-
-        await db["generated_docs"].insert_one(new_doc)
+        new_doc = await copy_doc_as_new_version(db, doc)
         new_docs.append(str(new_doc["_id"]))
 
     return {"status": "success", "new_doc_ids": new_docs}
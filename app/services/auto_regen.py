@@ -0,0 +1,171 @@
+# app/services/auto_regen.py
+import os
+import asyncio
+from datetime import datetime, timedelta
+
+from app.services.job_queue import submit_job
+
+SETTINGS_COLLECTION = "auto_regen_settings"
+PENDING_COLLECTION = "auto_regen_pending"
+
+AUTO_REGEN_DEBOUNCE = int(os.getenv("AUTO_REGEN_DEBOUNCE", 120))     # quiet seconds before regenerating
+AUTO_REGEN_MAX_WAIT = int(os.getenv("AUTO_REGEN_MAX_WAIT", 900))     # regenerate at most this long after the first event
+AUTO_REGEN_COOLDOWN = int(os.getenv("AUTO_REGEN_COOLDOWN", 1800))    # min seconds between runs per board
+AUTO_REGEN_TICK = float(os.getenv("AUTO_REGEN_TICK", 15))
+
+
+# --------------------------------------------------
+# Settings
+# --------------------------------------------------
+async def set_auto_regen(db, board_id: str, user_id: str, settings: dict) -> dict:
+    """
+    Opt a board in/out. `templates` is a list of
+    {"template", "pdf_headings", "selected_headings"} to regenerate.
+    """
+    doc = {
+        "user_id": user_id,
+        "enabled": bool(settings.get("enabled", True)),
+        "templates": [
+            {
+                "template": str(t.get("template", "")).strip(),
+                "pdf_headings": t.get("pdf_headings", []),
+                "selected_headings": t.get("selected_headings", []),
+            }
+            for t in settings.get("templates", [])
+            if str(t.get("template", "")).strip()
+        ],
+        "debounce_seconds": int(settings.get("debounce_seconds") or AUTO_REGEN_DEBOUNCE),
+        "max_wait_seconds": int(settings.get("max_wait_seconds") or AUTO_REGEN_MAX_WAIT),
+        "cooldown_seconds": int(settings.get("cooldown_seconds") or AUTO_REGEN_COOLDOWN),
+        "updated_at": datetime.utcnow(),
+    }
+
+    await db[SETTINGS_COLLECTION].update_one(
+        {"board_id": board_id},
+        {"$set": doc},
+        upsert=True
+    )
+
+    if not doc["enabled"]:
+        await db[PENDING_COLLECTION].delete_one({"board_id": board_id})
+
+    return {"board_id": board_id, **doc}
+
+
+async def get_auto_regen(db, board_id: str):
+    settings = await db[SETTINGS_COLLECTION].find_one({"board_id": board_id}, {"_id": 0})
+    if not settings:
+        return None
+
+    pending = await db[PENDING_COLLECTION].find_one({"board_id": board_id}, {"_id": 0})
+    settings["pending"] = pending
+    return settings
+
+
+# --------------------------------------------------
+# Webhook side: record activity
+# --------------------------------------------------
+async def note_board_activity(db, board_id: str):
+    """
+    Called per card event. Pushes the board's debounce deadline out; the
+    first event of a burst also fixes the max-wait deadline.
+    """
+    settings = await db[SETTINGS_COLLECTION].find_one(
+        {"board_id": board_id, "enabled": True},
+        {"debounce_seconds": 1, "max_wait_seconds": 1}
+    )
+    if not settings:
+        return
+
+    now = datetime.utcnow()
+    await db[PENDING_COLLECTION].update_one(
+        {"board_id": board_id},
+        {
+            "$set": {
+                "last_event_at": now,
+                "due_at": now + timedelta(seconds=settings.get("debounce_seconds", AUTO_REGEN_DEBOUNCE)),
+            },
+            "$setOnInsert": {
+                "first_event_at": now,
+                "deadline_at": now + timedelta(seconds=settings.get("max_wait_seconds", AUTO_REGEN_MAX_WAIT)),
+            },
+            "$inc": {"events": 1},
+        },
+        upsert=True
+    )
+
+
+# --------------------------------------------------
+# Scheduler
+# --------------------------------------------------
+async def _run_board(db, pending: dict):
+    board_id = pending["board_id"]
+    settings = await db[SETTINGS_COLLECTION].find_one({"board_id": board_id, "enabled": True})
+    if not settings or not settings.get("templates"):
+        return
+
+    now = datetime.utcnow()
+    last_run_at = settings.get("last_run_at")
+    cooldown = settings.get("cooldown_seconds", AUTO_REGEN_COOLDOWN)
+
+    # Still cooling down: park the burst until the cooldown ends
+    if last_run_at and last_run_at + timedelta(seconds=cooldown) > now:
+        resume_at = last_run_at + timedelta(seconds=cooldown)
+        await db[PENDING_COLLECTION].update_one(
+            {"board_id": board_id},
+            {
+                "$set": {"due_at": resume_at, "deadline_at": resume_at},
+                "$min": {"first_event_at": pending.get("first_event_at", now)},
+                "$max": {"last_event_at": pending.get("last_event_at", now)},
+                "$inc": {"events": pending.get("events", 0)},
+            },
+            upsert=True
+        )
+        return
+
+    job_ids = []
+    for t in settings["templates"]:
+        job_ids.append(await submit_job(db, settings["user_id"], board_id, {
+            "user_id": settings["user_id"],
+            "project_id": board_id,
+            "template": t["template"],
+            "pdf_headings": t.get("pdf_headings", []),
+            "selected_headings": t.get("selected_headings", []),
+            # Regenerated sections must overwrite their stale versions
+            "merge": "replace",
+            "trigger": "auto_regen",
+        }))
+
+    await db[SETTINGS_COLLECTION].update_one(
+        {"board_id": board_id},
+        {"$set": {
+            "last_run_at": now,
+            "last_run_events": pending.get("events", 0),
+            "last_job_ids": job_ids,
+        }}
+    )
+    print(f"🔁 Auto-regeneration queued for board {board_id} ({pending.get('events', 0)} events, {len(job_ids)} templates)")
+
+
+async def run_due_regenerations(db):
+    while True:
+        now = datetime.utcnow()
+        # Claim one due burst at a time so parallel workers never run a board twice
+        pending = await db[PENDING_COLLECTION].find_one_and_delete(
+            {"$or": [{"due_at": {"$lte": now}}, {"deadline_at": {"$lte": now}}]}
+        )
+        if not pending:
+            return
+        try:
+            await _run_board(db, pending)
+        except Exception as e:
+            print(f"❌ Auto-regeneration failed for board {pending.get('board_id')}: {e}")
+
+
+async def run_auto_regen_loop(db):
+    while True:
+        await asyncio.sleep(AUTO_REGEN_TICK)
+        try:
+            await run_due_regenerations(db)
+        except Exception as e:
+            print(f"❌ Auto-regeneration loop error: {e}")
@@ -0,0 +1,105 @@
+# app/services/board_cache.py
+import os
+import time
+from collections import OrderedDict
+from pymongo import UpdateOne
+
+from app.services.trello_client import trello_get
+
+TRELLO_API_KEY = os.getenv("TRELLO_API_KEY")
+
+BOARD_CACHE_TTL = float(os.getenv("BOARD_CACHE_TTL", 300))          # seconds
+BOARD_CACHE_MAX_ENTRIES = int(os.getenv("BOARD_CACHE_MAX_ENTRIES", 1000))
+
+# Superset of the fields every caller needs; callers pick what they use
+BOARD_FIELDS = "id,name,desc,url,closed"
+
+# token -> (fetched_at, boards)
+_cache = OrderedDict()
+
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+# --------------------------------------------------
+# Read
+# --------------------------------------------------
+async def get_member_boards(
+    token: str,
+    force_refresh: bool = False,
+    include_closed: bool = True,
+    db=None,
+    user_id: str = None
+) -> list:
+    """
+    Return `/members/me/boards` for a token, served from a TTL cache.
+    When `db` and `user_id` are given, a fresh fetch also refreshes the
+    board names stored in board_user_map.
+    Raises RuntimeError when Trello answers with an error.
+    """
+    entry = _cache.get(token)
+    now = time.monotonic()
+
+    if entry and not force_refresh and now - entry[0] < BOARD_CACHE_TTL:
+        _stats["hits"] += 1
+        _cache.move_to_end(token)
+        boards = entry[1]
+    else:
+        _stats["misses"] += 1
+        res = await trello_get(
+            "/members/me/boards",
+            params={"key": TRELLO_API_KEY, "token": token, "fields": BOARD_FIELDS}
+        )
+        if res.status_code != 200:
+            raise RuntimeError(f"Trello API error {res.status_code}: {res.text}")
+
+        boards = res.json()
+        _cache[token] = (now, boards)
+        _cache.move_to_end(token)
+        while len(_cache) > BOARD_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+        if db is not None and user_id and boards:
+            await db["board_user_map"].bulk_write(
+                [
+                    UpdateOne(
+                        {"board_id": b["id"]},
+                        {"$set": {"user_id": user_id, "board_name": b["name"]}},
+                        upsert=True
+                    )
+                    for b in boards
+                ],
+                ordered=False
+            )
+
+    if include_closed:
+        return list(boards)
+    return [b for b in boards if not b.get("closed")]
+
+
+# --------------------------------------------------
+# Invalidation
+# --------------------------------------------------
+def invalidate_token(token: str):
+    if token and _cache.pop(token, None) is not None:
+        _stats["invalidations"] += 1
+
+
+def invalidate_board(board_id: str):
+    """
+    Drop every cached list that contains this board (rename, close, ...).
+    """
+    stale = [
+        token for token, (_, boards) in _cache.items()
+        if any(b.get("id") == board_id for b in boards)
+    ]
+    for token in stale:
+        invalidate_token(token)
+
+
+def get_board_cache_stats() -> dict:
+    return {
+        **_stats,
+        "entries": len(_cache),
+        "ttl": BOARD_CACHE_TTL,
+        "max_entries": BOARD_CACHE_MAX_ENTRIES,
+    }
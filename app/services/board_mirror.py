@@ -0,0 +1,359 @@
+# app/services/board_mirror.py
+import os
+import asyncio
+from datetime import datetime
+from pymongo import UpdateOne, DeleteOne
+
+from app.services.trello_client import trello_get
+from app.services.pm_connector import get_pm_data
+
+TRELLO_API_KEY = os.getenv("TRELLO_API_KEY")
+
+MIRROR_SYNC_INTERVAL = float(os.getenv("MIRROR_SYNC_INTERVAL", 600))   # seconds
+MIRROR_SYNC_CONCURRENCY = int(os.getenv("MIRROR_SYNC_CONCURRENCY", 4))
+MIRROR_MAX_COMMENTS = int(os.getenv("MIRROR_MAX_COMMENTS", 20))
+
+CARDS_COLLECTION = "trello_cards"
+STATE_COLLECTION = "board_mirror_state"
+
+MIRRORED_CARD_FIELDS = (
+    "name", "desc", "idList", "pos", "closed",
+    "labels", "due", "dueComplete", "url", "checklists",
+)
+MIRRORED_ACTIONS = (
+    "createCard,updateCard,deleteCard,commentCard,"
+    "addLabelToCard,removeLabelFromCard,"
+    "addChecklistToCard,removeChecklistFromCard,updateCheckItemStateOnCard,"
+    "createCheckItem,updateCheckItem,deleteCheckItem,"
+    "createList,updateList"
+)
+# Checklist edits are rare and deeply nested; the next read re-syncs the board
+RESYNC_ACTIONS = {
+    "addChecklistToCard",
+    "removeChecklistFromCard",
+    "updateCheckItemStateOnCard",
+    "createCheckItem",
+    "updateCheckItem",
+    "deleteCheckItem",
+}
+LIST_ACTIONS = {"createList", "updateList"}
+# Mirror-relevant actions that are not "...Card" notifications
+MIRROR_ONLY_ACTIONS = LIST_ACTIONS | {"createCheckItem", "updateCheckItem", "deleteCheckItem"}
+ACTIONS_PAGE_LIMIT = 1000
+# Card fields set by create/update actions; each keeps the date of the action
+# that last wrote it, so a late (retried / replayed) action cannot undo a newer one
+ORDERED_CARD_FIELDS = ("name", "desc", "idList", "pos", "closed", "due", "dueComplete")
+
+# board_id -> in-flight first sync
+_board_syncs = {}
+
+
+# --------------------------------------------------
+# Full sync
+# --------------------------------------------------
+async def full_sync_board(db, board_id: str, key: str, token: str) -> int:
+    """
+    Replace the mirror for a board with a fresh copy of its lists and open cards.
+    """
+    started_at = datetime.utcnow()
+    started_iso = started_at.isoformat(timespec="milliseconds") + "Z"
+
+    pm_data = await get_pm_data(board_id, key, token)
+    cards = pm_data["cards"]
+    card_ids = [c["id"] for c in cards]
+
+    ops = [
+        UpdateOne(
+            {"board_id": board_id, "card_id": c["id"]},
+            {"$set": {
+                **{field: c.get(field) for field in MIRRORED_CARD_FIELDS},
+                # Actions older than this copy must not overwrite it
+                "field_dates": {field: started_iso for field in ORDERED_CARD_FIELDS},
+                "updated_at": started_at
+            }},
+            upsert=True
+        )
+        for c in cards
+    ]
+    if ops:
+        await db[CARDS_COLLECTION].bulk_write(ops, ordered=False)
+
+    await db[CARDS_COLLECTION].delete_many(
+        {"board_id": board_id, "card_id": {"$nin": card_ids}}
+    )
+
+    await db[STATE_COLLECTION].update_one(
+        {"board_id": board_id},
+        {"$set": {
+            "synced_at": started_at,
+            "synced_through": started_iso,
+            "board_name": pm_data.get("board_name"),
+            "lists": pm_data["lists"],
+            "labels": pm_data["labels"],
+            "needs_full_sync": False
+        }},
+        upsert=True
+    )
+
+    print(f"✅ Board mirror synced: {board_id} ({len(cards)} cards)")
+    return len(cards)
+
+
+# --------------------------------------------------
+# Incremental updates (webhook / actions feed)
+# --------------------------------------------------
+def _field_ops(query: dict, fields: dict, date, now, upsert: bool = False) -> list:
+    """
+    One guarded $set per field: applied only if no newer action wrote that field.
+    """
+    if not date:
+        return [UpdateOne(query, {"$set": {**fields, "updated_at": now}}, upsert=upsert)]
+
+    ops = []
+    if upsert:
+        # Create the card if missing, without touching an existing (newer) copy
+        ops.append(UpdateOne(query, {"$setOnInsert": {"updated_at": now}}, upsert=True))
+    ops.extend(
+        UpdateOne(
+            {**query, f"field_dates.{field}": {"$not": {"$gt": date}}},
+            {"$set": {field: value, f"field_dates.{field}": date, "updated_at": now}}
+        )
+        for field, value in fields.items()
+    )
+    return ops
+
+
+def _card_ops(board_id: str, action: dict) -> list:
+    """
+    Translate one Trello card action into mirror writes.
+    """
+    action_type = action.get("type")
+    data = action.get("data", {})
+    card = data.get("card", {})
+    card_id = card.get("id")
+    if not card_id:
+        return []
+
+    query = {"board_id": board_id, "card_id": card_id}
+    now = datetime.utcnow()
+
+    if action_type == "deleteCard":
+        return [DeleteOne(query)]
+
+    if action_type == "commentCard":
+        # Keyed on the action id so redeliveries do not repeat a comment
+        action_id = action.get("id")
+        if action_id:
+            query["comment_ids"] = {"$ne": action_id}
+        return [UpdateOne(query, {
+            "$push": {
+                "comments": {"$each": [data.get("text", "")], "$slice": -MIRROR_MAX_COMMENTS},
+                "comment_ids": {"$each": [action_id], "$slice": -MIRROR_MAX_COMMENTS},
+            },
+            "$set": {"updated_at": now}
+        })]
+
+    if action_type in ("addLabelToCard", "removeLabelFromCard"):
+        label = data.get("label", {})
+        label_name = label.get("name") or label.get("color")
+        if not label_name:
+            return []
+        operator = "$addToSet" if action_type == "addLabelToCard" else "$pull"
+        return [UpdateOne(query, {operator: {"labels": label_name}, "$set": {"updated_at": now}})]
+
+    if action_type not in ("createCard", "updateCard"):
+        return []
+
+    fields = {}
+    for field in ("name", "desc", "pos", "closed", "due", "dueComplete"):
+        if field in card:
+            fields[field] = card[field]
+
+    if "listAfter" in data:
+        fields["idList"] = data["listAfter"].get("id")
+    elif "idList" in card:
+        fields["idList"] = card["idList"]
+    elif action_type == "createCard" and data.get("list", {}).get("id"):
+        fields["idList"] = data["list"]["id"]
+
+    return _field_ops(query, fields, action.get("date"), now, upsert=action_type == "createCard")
+
+
+async def apply_actions(db, board_id: str, actions: list):
+    """
+    Apply card actions (oldest first) to a mirrored board. Repeated or late
+    actions do not duplicate comments or undo newer card fields.
+    Returns None when the board has no mirror yet (nothing applied).
+    """
+    state = await db[STATE_COLLECTION].find_one({"board_id": board_id})
+    if not state:
+        return None
+
+    ops = [op for a in actions for op in _card_ops(board_id, a)]
+    if ops:
+        await db[CARDS_COLLECTION].bulk_write(ops, ordered=True)
+
+    # ------------------ List create / rename ------------------
+    lists = {lst["id"]: lst for lst in state.get("lists", [])}
+    lists_changed = False
+    for a in actions:
+        if a.get("type") in LIST_ACTIONS:
+            lst = a.get("data", {}).get("list", {})
+            if lst.get("id"):
+                lists[lst["id"]] = {"id": lst["id"], "name": lst.get("name", lists.get(lst["id"], {}).get("name", ""))}
+                lists_changed = True
+
+    state_update = {}
+    if lists_changed:
+        state_update["lists"] = list(lists.values())
+    if any(a.get("type") in RESYNC_ACTIONS for a in actions):
+        state_update["needs_full_sync"] = True
+    if state_update:
+        await db[STATE_COLLECTION].update_one({"board_id": board_id}, {"$set": state_update})
+
+    return len(ops)
+
+
+async def apply_webhook_action(db, action: dict):
+    board_id = action.get("data", {}).get("board", {}).get("id")
+    if not board_id:
+        return
+
+    applied = await apply_actions(db, board_id, [action])
+    if applied is None:
+        # First event for this board: a full sync already includes this action
+        await sync_board(db, board_id)
+
+
+async def delta_sync_board(db, board_id: str, key: str, token: str) -> int:
+    """
+    Catch up on anything webhooks missed via `actions?since=`.
+    Falls back to a full sync when the gap is larger than one page.
+    """
+    state = await db[STATE_COLLECTION].find_one({"board_id": board_id})
+    if not state:
+        return await full_sync_board(db, board_id, key, token)
+
+    res = await trello_get(
+        f"/boards/{board_id}/actions",
+        params={
+            "key": key,
+            "token": token,
+            "filter": MIRRORED_ACTIONS,
+            "since": state.get("synced_through"),
+            "limit": ACTIONS_PAGE_LIMIT
+        }
+    )
+    if res.status_code != 200:
+        raise ValueError(f"Trello actions fetch failed: {res.text}")
+
+    actions = res.json()
+    if len(actions) >= ACTIONS_PAGE_LIMIT:
+        return await full_sync_board(db, board_id, key, token)
+
+    # Trello returns newest first
+    applied = await apply_actions(db, board_id, list(reversed(actions)))
+
+    # Only this feed advances the cursor: a webhook for a newer action says
+    # nothing about older ones that were never delivered
+    dates = [a.get("date") for a in actions if a.get("date")]
+    if dates:
+        await db[STATE_COLLECTION].update_one(
+            {"board_id": board_id, "synced_through": {"$lt": max(dates)}},
+            {"$set": {"synced_through": max(dates)}}
+        )
+    return applied
+
+
+# --------------------------------------------------
+# Read
+# --------------------------------------------------
+async def get_mirrored_pm_data(db, board_id: str, key: str, token: str) -> dict:
+    """
+    Board PM data served from the local mirror (full sync on first use or
+    after a checklist change). Same shape as pm_connector.get_pm_data.
+    """
+    state = await db[STATE_COLLECTION].find_one({"board_id": board_id})
+    if not state or state.get("needs_full_sync"):
+        await full_sync_board(db, board_id, key, token)
+        state = await db[STATE_COLLECTION].find_one({"board_id": board_id})
+
+    list_names = {lst["id"]: lst.get("name", "") for lst in state.get("lists", [])}
+
+    cursor = db[CARDS_COLLECTION].find(
+        {"board_id": board_id, "closed": {"$ne": True}},
+        {"_id": 0, "board_id": 0, "updated_at": 0, "field_dates": 0, "comment_ids": 0}
+    ).sort("pos", 1)
+
+    cards = []
+    async for doc in cursor:
+        card = {"id": doc.pop("card_id"), **doc}
+        card["list_name"] = list_names.get(card.get("idList"), "")
+        cards.append(card)
+
+    return {
+        "board_id": board_id,
+        "board_name": state.get("board_name"),
+        "lists": state.get("lists", []),
+        "labels": state.get("labels", []),
+        "cards": cards,
+    }
+
+
+# --------------------------------------------------
+# Periodic delta sync
+# --------------------------------------------------
+async def _token_for_board(db, board_id: str):
+    entry = await db["board_user_map"].find_one({"board_id": board_id}, {"user_id": 1})
+    if not entry:
+        return None
+    token_doc = await db["tokens"].find_one({"user_id": entry["user_id"]}, {"trello_token": 1})
+    return token_doc.get("trello_token") if token_doc else None
+
+
+async def _sync_board(db, board_id: str) -> int:
+    token = await _token_for_board(db, board_id)
+    if not token:
+        return 0
+    return await full_sync_board(db, board_id, TRELLO_API_KEY, token)
+
+
+def sync_board(db, board_id: str) -> asyncio.Task:
+    """
+    Full sync using the board owner's token. Concurrent calls for the same
+    board (a burst of webhooks before the first sync) share one run.
+    """
+    task = _board_syncs.get(board_id)
+    if task is None:
+        task = asyncio.create_task(_sync_board(db, board_id))
+        _board_syncs[board_id] = task
+        task.add_done_callback(lambda _: _board_syncs.pop(board_id, None))
+    return task
+
+
+async def sync_all_mirrors(db):
+    semaphore = asyncio.Semaphore(MIRROR_SYNC_CONCURRENCY)
+
+    async def _sync(board_id):
+        async with semaphore:
+            try:
+                token = await _token_for_board(db, board_id)
+                if token:
+                    await delta_sync_board(db, board_id, TRELLO_API_KEY, token)
+            except Exception as e:
+                print(f"❌ Board mirror delta sync failed for {board_id}: {e}")
+
+    board_ids = [
+        doc["board_id"]
+        async for doc in db[STATE_COLLECTION].find({}, {"_id": 0, "board_id": 1})
+    ]
+    await asyncio.gather(*(_sync(b) for b in board_ids))
+
+
+async def run_mirror_sync_loop(db):
+    while True:
+        await asyncio.sleep(MIRROR_SYNC_INTERVAL)
+        try:
+            await sync_all_mirrors(db)
+        except Exception as e:
+            print(f"❌ Board mirror sync loop error: {e}")
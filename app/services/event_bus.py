@@ -0,0 +1,105 @@
+# app/services/event_bus.py
+import os
+import socket
+import asyncio
+from datetime import datetime
+from pymongo.errors import OperationFailure
+
+PUSH_COLLECTION = "push_events"
+
+# "local" delivers within this process only; "mongo" also fans out to other
+# workers through a change stream on push_events (needs a replica set / Atlas)
+PUSH_FANOUT = os.getenv("PUSH_FANOUT", "local")
+PUSH_QUEUE_SIZE = int(os.getenv("PUSH_QUEUE_SIZE", 100))
+PUSH_HEARTBEAT = float(os.getenv("PUSH_HEARTBEAT", 20))          # seconds
+PUSH_EVENT_TTL = int(os.getenv("PUSH_EVENT_TTL", 3600))          # seconds fan-out records are kept
+
+ORIGIN = f"{socket.gethostname()}:{os.getpid()}"
+
+# user_id -> set of subscriber queues
+_subscribers = {}
+
+_stats = {"published": 0, "delivered": 0, "dropped": 0, "remote_received": 0}
+
+
+# --------------------------------------------------
+# Subscriptions
+# --------------------------------------------------
+def subscribe(user_id: str) -> asyncio.Queue:
+    queue = asyncio.Queue(maxsize=PUSH_QUEUE_SIZE)
+    _subscribers.setdefault(user_id, set()).add(queue)
+    return queue
+
+
+def unsubscribe(user_id: str, queue: asyncio.Queue):
+    queues = _subscribers.get(user_id)
+    if not queues:
+        return
+    queues.discard(queue)
+    if not queues:
+        _subscribers.pop(user_id, None)
+
+
+def _deliver(user_id: str, message: dict):
+    for queue in list(_subscribers.get(user_id, ())):
+        # A slow client loses its oldest events rather than stalling publishers
+        if queue.full():
+            queue.get_nowait()
+            _stats["dropped"] += 1
+        queue.put_nowait(message)
+        _stats["delivered"] += 1
+
+
+# --------------------------------------------------
+# Publish
+# --------------------------------------------------
+async def publish(db, user_id: str, event: str, data: dict):
+    if not user_id:
+        return
+
+    message = {"event": event, "data": data}
+    _stats["published"] += 1
+    _deliver(user_id, message)
+
+    if PUSH_FANOUT == "mongo" and db is not None:
+        try:
+            await db[PUSH_COLLECTION].insert_one({
+                "user_id": user_id,
+                "origin": ORIGIN,
+                "message": message,
+                "created_at": datetime.utcnow(),
+            })
+        except Exception as e:
+            print(f"⚠️ Push fan-out write failed: {e}")
+
+
+async def run_push_fanout_loop(db):
+    """
+    Deliver events published by other workers to this worker's subscribers.
+    """
+    if PUSH_FANOUT != "mongo":
+        return
+
+    pipeline = [{"$match": {"operationType": "insert", "fullDocument.origin": {"$ne": ORIGIN}}}]
+    while True:
+        try:
+            async with db[PUSH_COLLECTION].watch(pipeline) as stream:
+                async for change in stream:
+                    doc = change["fullDocument"]
+                    _stats["remote_received"] += 1
+                    _deliver(doc["user_id"], doc["message"])
+        except OperationFailure as e:
+            print(f"❌ Push fan-out unavailable (change streams need a replica set): {e}")
+            return
+        except Exception as e:
+            print(f"❌ Push fan-out stream error, reconnecting: {e}")
+            await asyncio.sleep(5)
+
+
+def get_push_stats() -> dict:
+    return {
+        **_stats,
+        "fanout": PUSH_FANOUT,
+        "users": len(_subscribers),
+        "connections": sum(len(q) for q in _subscribers.values()),
+    }
@@ -0,0 +1,98 @@
+# app/services/generation_cache.py
+import os
+import json
+import hashlib
+from datetime import datetime
+
+CACHE_COLLECTION = "generation_cache"
+CHUNK_COLLECTION = "chunk_summaries"
+GENERATION_CACHE_TTL_DAYS = int(os.getenv("GENERATION_CACHE_TTL_DAYS", 30))
+
+_stats = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "chunk_hits": 0, "chunk_misses": 0}
+
+
+# --------------------------------------------------
+# Key
+# --------------------------------------------------
+def compute_cache_key(
+    cleaned_pm_data: str,
+    pdf_headings: list,
+    selected_headings: list,
+    template_name: str,
+    prompt_version: str,
+    model_name: str
+) -> str:
+    """
+    Content hash of everything that determines the LLM output. The board
+    is keyed by the exact text the prompt receives, so the token budget and
+    compact vs map-reduce mode are part of the key.
+    """
+    payload = {
+        "pm_data": hashlib.sha256((cleaned_pm_data or "").encode("utf-8")).hexdigest(),
+        "pdf_headings": list(pdf_headings or []),
+        "selected_headings": list(selected_headings or []),
+        "template": (template_name or "").strip().lower(),
+        "prompt": prompt_version,
+        "model": model_name,
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# --------------------------------------------------
+# Read / write
+# --------------------------------------------------
+async def get_cached_output(db, key: str):
+    doc = await db[CACHE_COLLECTION].find_one({"_id": key}, {"output": 1})
+    if doc:
+        _stats["hits"] += 1
+        return doc["output"]
+    _stats["misses"] += 1
+    return None
+
+
+async def store_output(db, key: str, output: str, **meta):
+    await db[CACHE_COLLECTION].update_one(
+        {"_id": key},
+        {"$set": {"output": output, "created_at": datetime.utcnow(), **meta}},
+        upsert=True
+    )
+    _stats["stores"] += 1
+
+
+# --------------------------------------------------
+# Map-reduce chunk summaries
+# --------------------------------------------------
+def compute_chunk_key(chunk_text: str, prompt_version: str, model_name: str) -> str:
+    raw = f"{model_name}\n{prompt_version}\n{chunk_text}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def get_chunk_summaries(db, keys: list) -> dict:
+    found = {
+        doc["_id"]: doc["summary"]
+        async for doc in db[CHUNK_COLLECTION].find({"_id": {"$in": keys}}, {"summary": 1})
+    }
+    _stats["chunk_hits"] += len(found)
+    _stats["chunk_misses"] += len(set(keys)) - len(found)
+    return found
+
+
+async def store_chunk_summary(db, key: str, summary: str):
+    await db[CHUNK_COLLECTION].update_one(
+        {"_id": key},
+        {"$set": {"summary": summary, "created_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def record_bypass():
+    _stats["bypassed"] += 1
+
+
+def get_generation_cache_stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_rate": round(_stats["hits"] / lookups, 3) if lookups else 0.0,
+    }
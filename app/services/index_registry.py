@@ -0,0 +1,226 @@
+# app/services/index_registry.py
+import os
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from app.services.generation_cache import GENERATION_CACHE_TTL_DAYS
+from app.services.webhook_queue import WEBHOOK_EVENT_RETENTION_HOURS
+from app.services.event_bus import PUSH_EVENT_TTL
+from app.services.notification_retention import (
+    NOTIFICATION_RETENTION_DAYS,
+    READ_NOTIFICATION_RETENTION_DAYS
+)
+
+INDEX_DIAGNOSTICS = os.getenv("INDEX_DIAGNOSTICS", "").lower() in ("1", "true", "yes")
+
+# Case-insensitive equality (template / board names are matched ignoring case)
+CASE_INSENSITIVE = {"locale": "en", "strength": 2}
+
+DOC_VERSION_KEYS = [("user_id", 1), ("project_id", 1), ("template_name", 1), ("version", -1)]
+
+# --------------------------------------------------
+# Registry: (collection, keys, options)
+# --------------------------------------------------
+INDEXES = [
+    # ------------------ Users / auth ------------------
+    ("users", [("email", 1)], {"unique": True}),
+    ("tokens", [("user_id", 1)], {"unique": True}),
+    ("templates", [("template_name", 1)], {"collation": CASE_INSENSITIVE}),
+
+    # ------------------ Boards ------------------
+    ("board_user_map", [("board_id", 1)], {"unique": True}),
+    ("board_user_map", [("user_id", 1), ("board_name", 1)], {}),
+    ("trello_webhooks", [("board_id", 1), ("callback_url", 1)], {"unique": True}),
+    ("trello_cards", [("board_id", 1), ("card_id", 1)], {"unique": True}),
+    ("board_mirror_state", [("board_id", 1)], {"unique": True}),
+
+    # ------------------ Notifications ------------------
+    # Prevents duplicate notifications
+    ("notifications", [("action_id", 1)], {"unique": True, "sparse": True}),
+    ("notifications", [("user_id", 1), ("created_at", -1), ("_id", -1)], {}),
+    ("notifications", [("user_id", 1), ("board_id", 1), ("created_at", -1), ("_id", -1)], {}),
+    ("notifications", [("user_id", 1), ("is_read", 1), ("board_id", 1)], {}),
+    # Retention: all notifications age out, read ones sooner
+    ("notifications", [("created_at", 1)], {"expireAfterSeconds": NOTIFICATION_RETENTION_DAYS * 86400}),
+    ("notifications", [("read_at", 1)], {
+        "expireAfterSeconds": READ_NOTIFICATION_RETENTION_DAYS * 86400,
+        "partialFilterExpression": {"is_read": True},
+    }),
+
+    # ------------------ Generated documents ------------------
+    # Latest version lookup on save; unique so concurrent saves cannot both
+    # take the same version number (the loser retries on the next one)
+    ("generated_docs", DOC_VERSION_KEYS, {"unique": True}),
+    ("generated_docs", [("user_id", 1), ("created_at", -1), ("_id", -1)], {}),
+    ("generated_docs", [("user_id", 1), ("project_id", 1), ("created_at", -1), ("_id", -1)], {}),
+
+    # ------------------ Generation ------------------
+    ("generation_cache", [("created_at", 1)], {"expireAfterSeconds": GENERATION_CACHE_TTL_DAYS * 86400}),
+    ("chunk_summaries", [("created_at", 1)], {"expireAfterSeconds": GENERATION_CACHE_TTL_DAYS * 86400}),
+    ("generation_leases", [("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ("generation_jobs", [("status", 1), ("created_at", 1)], {}),
+    ("auto_regen_settings", [("board_id", 1)], {"unique": True}),
+    ("auto_regen_pending", [("board_id", 1)], {"unique": True}),
+    ("auto_regen_pending", [("due_at", 1)], {}),
+    ("auto_regen_pending", [("deadline_at", 1)], {}),
+
+    # ------------------ Webhook queue / push ------------------
+    ("webhook_events", [("status", 1), ("received_at", 1)], {}),
+    # Per-consumer claim: its partitions, oldest first
+    ("webhook_events", [("partition", 1), ("status", 1), ("received_at", 1)], {}),
+    ("webhook_events", [("processed_at", 1)], {"expireAfterSeconds": WEBHOOK_EVENT_RETENTION_HOURS * 3600}),
+    ("push_events", [("created_at", 1)], {"expireAfterSeconds": PUSH_EVENT_TTL}),
+]
+
+# Conflicting index with the same key pattern / name
+_CONFLICT_CODES = {85, 86}
+# Existing documents violate a unique index
+_DUPLICATE_KEY_CODE = 11000
+
+
+# --------------------------------------------------
+# Repairs for data that blocks a unique index
+# --------------------------------------------------
+async def renumber_doc_versions(db) -> int:
+    """
+    Give every (user, board, template) series with repeated version numbers
+    consecutive versions again, keeping their order. Older copies reused
+    version numbers, which blocks the unique version index.
+    Returns the number of series renumbered.
+    """
+    docs_collection = db["generated_docs"]
+    series_key = {"user_id": "$user_id", "project_id": "$project_id", "template_name": "$template_name"}
+
+    duplicated = await docs_collection.aggregate([
+        {"$group": {"_id": {**series_key, "version": "$version"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$group": {"_id": {field: f"$_id.{field}" for field in series_key}}},
+    ]).to_list(None)
+
+    for group in duplicated:
+        # Missing fields are left out of the group key; None matches them
+        series = {field: group["_id"].get(field) for field in series_key}
+        docs = await docs_collection.find(series, {"_id": 1}).sort(
+            [("version", 1), ("created_at", 1), ("_id", 1)]
+        ).to_list(None)
+        await docs_collection.bulk_write([
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"version": version}})
+            for version, doc in enumerate(docs, start=1)
+        ], ordered=False)
+
+    print(f"✅ Renumbered document versions ({len(duplicated)} series)")
+    return len(duplicated)
+
+
+# (collection, keys) -> repair run once when existing duplicates block the index
+REPAIRS = {
+    ("generated_docs", str(DOC_VERSION_KEYS)): renumber_doc_versions,
+}
+
+
+async def _ensure_index(db, collection: str, keys: list, options: dict, repaired: bool = False):
+    try:
+        await db[collection].create_index(keys, **options)
+        return "ok"
+    except OperationFailure as e:
+        repair = REPAIRS.get((collection, str(keys)))
+        if e.code == _DUPLICATE_KEY_CODE and repair and not repaired:
+            try:
+                await repair(db)
+            except Exception as repair_error:
+                print(f"⚠️ Could not repair duplicates for index {collection}{keys}: {repair_error}")
+                return "failed"
+            return await _ensure_index(db, collection, keys, options, repaired=True)
+        if e.code in _CONFLICT_CODES and "expireAfterSeconds" in options:
+            # Retention was reconfigured: update the TTL in place
+            try:
+                await db.command({
+                    "collMod": collection,
+                    "index": {"keyPattern": dict(keys), "expireAfterSeconds": options["expireAfterSeconds"]},
+                })
+            except OperationFailure as mod_error:
+                # e.g. the conflict was another option, not the TTL
+                print(f"⚠️ Could not update TTL of index {collection}{keys}: {mod_error}")
+                return "failed"
+            return "ttl_updated"
+        # Usually existing duplicates blocking a unique index; keep starting up
+        print(f"⚠️ Could not create index {collection}{keys}: {e}")
+        return "failed"
+
+
+async def ensure_indexes(db) -> dict:
+    """
+    Create every registered index. Safe to run on each startup:
+    existing identical indexes are a no-op.
+    """
+    summary = {"ok": 0, "ttl_updated": 0, "failed": 0}
+    for collection, keys, options in INDEXES:
+        summary[await _ensure_index(db, collection, keys, options)] += 1
+
+    print(f"✅ Indexes ensured ({summary['ok']} ok, {summary['ttl_updated']} TTL updated, {summary['failed']} failed)")
+    return summary
+
+
+# --------------------------------------------------
+# Query-plan diagnostics
+# --------------------------------------------------
+# (name, collection, filter, sort, collation) with representative values
+HOT_QUERIES = [
+    ("user_by_email", "users", {"email": "probe@example.com"}, None, None),
+    ("token_by_user", "tokens", {"user_id": "probe"}, None, None),
+    ("template_by_name", "templates", {"template_name": "SRS"}, None, CASE_INSENSITIVE),
+    ("board_by_id", "board_user_map", {"board_id": "probe"}, None, None),
+    ("latest_doc_version", "generated_docs",
+     {"user_id": "probe", "project_id": "probe", "template_name": "probe"}, {"version": -1}, None),
+    ("docs_by_user", "generated_docs", {"user_id": "probe"}, {"created_at": -1, "_id": -1}, None),
+    ("notifications_page", "notifications", {"user_id": "probe"}, {"created_at": -1, "_id": -1}, None),
+    ("unread_count", "notifications", {"user_id": "probe", "is_read": False}, None, None),
+    ("webhook_claim", "webhook_events", {"status": "pending", "partition": {"$in": [0, 8]}}, {"received_at": 1}, None),
+    ("job_claim", "generation_jobs", {"status": "queued"}, {"created_at": 1}, None),
+]
+
+
+def _plan_stages(plan: dict) -> list:
+    stages = [plan.get("stage")]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages.extend(_plan_stages(child))
+    return stages
+
+
+async def explain_hot_queries(db) -> list:
+    """
+    Run explain() on each hot query and flag any whose winning plan is a
+    collection scan.
+    """
+    report = []
+    for name, collection, query, sort, collation in HOT_QUERIES:
+        command = {"find": collection, "filter": query}
+        if sort:
+            command["sort"] = sort
+        if collation:
+            command["collation"] = collation
+
+        try:
+            result = await db.command({"explain": command, "verbosity": "queryPlanner"})
+        except Exception as e:
+            report.append({"query": name, "collection": collection, "error": str(e)})
+            continue
+
+        winning = result.get("queryPlanner", {}).get("winningPlan", {})
+        # Newer servers wrap the classic plan in queryPlan
+        stages = _plan_stages(winning.get("queryPlan", winning))
+        collscan = "COLLSCAN" in stages
+
+        if collscan:
+            print(f"⚠️ Hot query '{name}' on {collection} does a COLLSCAN")
+        report.append({"query": name, "collection": collection, "stages": stages, "collscan": collscan})
+
+    return report
+
+
+async def run_index_diagnostics(db):
+    try:
+        await explain_hot_queries(db)
+    except Exception as e:
+        print(f"❌ Index diagnostics error: {e}")
@@ -0,0 +1,276 @@
+# app/services/job_queue.py
+import os
+import time
+import uuid
+import socket
+import asyncio
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from app.services.workflow_service import stream_workflow
+
+JOBS_COLLECTION = "generation_jobs"
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 120))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 5))
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", 2))  # min seconds between chunk progress writes
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_wakeup = None
+
+
+def _wakeup_event() -> asyncio.Event:
+    # Created lazily so it binds to the running event loop
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+# --------------------------------------------------
+# Submit / read
+# --------------------------------------------------
+async def submit_job(db, user_id: str, project_id: str, data: dict) -> str:
+    now = datetime.utcnow()
+    result = await db[JOBS_COLLECTION].insert_one({
+        "user_id": user_id,
+        "project_id": project_id,
+        "data": data,
+        "status": "queued",
+        "progress": {"stage": "queued"},
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now,
+    })
+    _wakeup_event().set()
+    return str(result.inserted_id)
+
+
+def serialize_job(job: dict, include_result: bool = False) -> dict:
+    out = {
+        "job_id": str(job["_id"]),
+        "user_id": job.get("user_id"),
+        "project_id": job.get("project_id"),
+        "template_name": (job.get("data") or {}).get("template"),
+        "status": job.get("status"),
+        "progress": job.get("progress", {}),
+        "attempts": job.get("attempts", 0),
+        "error": job.get("error"),
+        "created_at": job.get("created_at"),
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+    }
+    if include_result:
+        out["result"] = job.get("result")
+    return out
+
+
+async def get_job(db, job_id: str, include_result: bool = False):
+    try:
+        oid = ObjectId(job_id)
+    except Exception:
+        return None
+
+    projection = None if include_result else {"result": 0}
+    job = await db[JOBS_COLLECTION].find_one({"_id": oid}, projection)
+    return serialize_job(job, include_result) if job else None
+
+
+# --------------------------------------------------
+# Worker
+# --------------------------------------------------
+async def _claim_job(db):
+    """
+    Atomically take the oldest queued job, or a running one whose lease
+    expired (its worker died / restarted). Each claim gets its own claim_id,
+    so a worker whose lease was taken over can no longer write to the job.
+    """
+    now = datetime.utcnow()
+    return await db[JOBS_COLLECTION].find_one_and_update(
+        {
+            "attempts": {"$lt": JOB_MAX_ATTEMPTS},
+            "$or": [
+                {"status": "queued"},
+                {"status": "running", "lease_until": {"$lt": now}},
+            ],
+        },
+        {
+            "$set": {
+                "status": "running",
+                "worker_id": WORKER_ID,
+                "claim_id": uuid.uuid4().hex,
+                "started_at": now,
+                "updated_at": now,
+                "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _fail_exhausted_jobs(db):
+    await db[JOBS_COLLECTION].update_many(
+        {
+            "status": "running",
+            "lease_until": {"$lt": datetime.utcnow()},
+            "attempts": {"$gte": JOB_MAX_ATTEMPTS},
+        },
+        {"$set": {
+            "status": "failed",
+            "error": "Job abandoned after repeated worker failures",
+            "finished_at": datetime.utcnow(),
+        }}
+    )
+
+
+async def _update_job(db, job: dict, fields: dict) -> bool:
+    """
+    Write to a job this worker still holds (also renews its lease).
+    Returns False once the claim was lost.
+    """
+    now = datetime.utcnow()
+    result = await db[JOBS_COLLECTION].update_one(
+        {"_id": job["_id"], "claim_id": job["claim_id"]},
+        {"$set": {
+            **fields,
+            "updated_at": now,
+            "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+        }}
+    )
+    return result.matched_count > 0
+
+
+async def _renew_lease(db, job: dict):
+    # Long LLM calls emit no progress events; keep the lease alive regardless
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            if not await _update_job(db, job, {}):
+                print(f"⚠️ Generation job {job['_id']} was taken over by another worker")
+                return
+        except Exception as e:
+            print(f"⚠️ Generation job {job['_id']} lease renewal failed: {e}")
+
+
+async def _run_job(db, job: dict):
+    worker = asyncio.create_task(_process_job(db, job))
+    renewer = asyncio.create_task(_renew_lease(db, job))
+    try:
+        # The renewer only returns once the claim is lost
+        await asyncio.wait({worker, renewer}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        worker.cancel()
+        renewer.cancel()
+    await asyncio.gather(worker, renewer, return_exceptions=True)
+
+
+async def _process_job(db, job: dict):
+    job_id = job["_id"]
+    progress = {"stage": "started", "chunks": 0, "sections_done": 0}
+    last_write = 0.0
+
+    if not await _update_job(db, job, {"progress": progress}):
+        return
+
+    try:
+        async for item in stream_workflow(job["user_id"], job["project_id"], job.get("data") or {}, db=db):
+            event, payload = item["event"], item["data"]
+
+            if event == "done":
+                await _update_job(db, job, {
+                    "status": "succeeded",
+                    "progress": {**progress, "stage": "done"},
+                    "result": payload,
+                    "finished_at": datetime.utcnow(),
+                })
+                return
+
+            if event == "error":
+                await _update_job(db, job, {
+                    "status": "failed",
+                    "progress": {**progress, "stage": "error"},
+                    "error": payload.get("message"),
+                    "finished_at": datetime.utcnow(),
+                })
+                return
+
+            if event == "chunk":
+                progress["chunks"] += 1
+                progress["stage"] = "generating"
+            elif event == "section_done":
+                progress["sections_done"] += 1
+                progress["stage"] = "generating"
+            elif event == "pm_data":
+                progress["stage"] = "pm_data_fetched"
+                progress["cards"] = payload.get("cards")
+            elif event == "pm_tokens":
+                progress["stage"] = "pm_data_cleaned"
+                progress["pm_tokens"] = payload.get("tokens")
+
+            # Chunk events are throttled
+            if event != "chunk" or time.monotonic() - last_write >= JOB_PROGRESS_INTERVAL:
+                last_write = time.monotonic()
+                if not await _update_job(db, job, {"progress": progress}):
+                    # Another worker owns the job now; it runs the generation
+                    print(f"⚠️ Generation job {job_id} was taken over by another worker")
+                    return
+
+    except Exception as e:
+        print(f"❌ Generation job {job_id} failed: {e}")
+        try:
+            await _update_job(db, job, {
+                "status": "failed",
+                "progress": {**progress, "stage": "error"},
+                "error": str(e),
+                "finished_at": datetime.utcnow(),
+            })
+        except Exception as write_error:
+            # The lease expires and the job is retried
+            print(f"❌ Generation job {job_id} status write failed: {write_error}")
+
+
+async def _worker_loop(db, index: int):
+    wakeup = _wakeup_event()
+
+    while True:
+        try:
+            job = await _claim_job(db)
+        except Exception as e:
+            print(f"❌ Job worker {index} claim error: {e}")
+            job = None
+
+        if job:
+            try:
+                await _run_job(db, job)
+            except Exception as e:
+                # Keep the pool at full size; the job is retried once its lease expires
+                print(f"❌ Job worker {index} error on job {job['_id']}: {e}")
+            continue
+
+        try:
+            await _fail_exhausted_jobs(db)
+        except Exception as e:
+            print(f"❌ Job worker {index} sweep error: {e}")
+
+        wakeup.clear()
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_job_workers(db, count: int = None) -> list:
+    """
+    Start the bounded worker pool. Unfinished jobs from a previous process
+    are picked up once their lease expires.
+    """
+    return [
+        asyncio.create_task(_worker_loop(db, i))
+        for i in range(count or JOB_WORKERS)
+    ]
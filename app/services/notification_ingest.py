@@ -0,0 +1,207 @@
+# app/services/notification_ingest.py
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from pymongo.errors import BulkWriteError
+
+BOARD_MAP_CACHE_TTL = float(os.getenv("BOARD_MAP_CACHE_TTL", 300))            # seconds
+BOARD_MAP_NEGATIVE_TTL = float(os.getenv("BOARD_MAP_NEGATIVE_TTL", 30))       # unknown boards are rechecked sooner
+BOARD_MAP_CACHE_MAX_ENTRIES = int(os.getenv("BOARD_MAP_CACHE_MAX_ENTRIES", 5000))
+SEEN_ACTIONS_MAX = int(os.getenv("SEEN_ACTIONS_MAX", 20000))
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", 200))
+NOTIFY_FLUSH_INTERVAL = float(os.getenv("NOTIFY_FLUSH_INTERVAL", 1))          # seconds
+
+# board_id -> (cached_at, board_user_map entry or None)
+_board_map = OrderedDict()
+# Recently ingested action ids (insertion ordered, oldest evicted first)
+_seen_actions = OrderedDict()
+
+_buffer = []
+_buffer_db = None
+_flush_lock = None
+
+_stats = {
+    "received": 0,
+    "local_duplicates": 0,
+    "db_duplicates": 0,
+    "inserted": 0,
+    "batches": 0,
+    "failed": 0,
+    "board_map_hits": 0,
+    "board_map_misses": 0,
+    "last_batch_size": 0,
+    "last_flush_ms": 0.0,
+}
+_started_at = time.monotonic()
+
+
+# --------------------------------------------------
+# Board -> user lookup
+# --------------------------------------------------
+async def get_board_entry(db, board_id: str):
+    entry = _board_map.get(board_id)
+    now = time.monotonic()
+
+    if entry:
+        cached_at, board_entry = entry
+        ttl = BOARD_MAP_CACHE_TTL if board_entry else BOARD_MAP_NEGATIVE_TTL
+        if now - cached_at < ttl:
+            _stats["board_map_hits"] += 1
+            _board_map.move_to_end(board_id)
+            return board_entry
+
+    _stats["board_map_misses"] += 1
+    board_entry = await db["board_user_map"].find_one(
+        {"board_id": board_id},
+        {"user_id": 1, "board_name": 1}
+    )
+    remember_board_entry(board_id, board_entry)
+    return board_entry
+
+
+def remember_board_entry(board_id: str, board_entry):
+    _board_map[board_id] = (time.monotonic(), board_entry)
+    _board_map.move_to_end(board_id)
+    while len(_board_map) > BOARD_MAP_CACHE_MAX_ENTRIES:
+        _board_map.popitem(last=False)
+
+
+def forget_board_entry(board_id: str):
+    _board_map.pop(board_id, None)
+
+
+# --------------------------------------------------
+# Action id dedupe
+# --------------------------------------------------
+def seen_action(action_id: str) -> bool:
+    """
+    True if this action id was ingested recently. Ids are only recorded once
+    their notification is written (see flush_notifications), so a failed
+    write does not hide the retry; concurrent duplicates before that are
+    dropped by the unique action_id index.
+    """
+    if not action_id:
+        return False
+
+    _stats["received"] += 1
+    if action_id in _seen_actions:
+        _stats["local_duplicates"] += 1
+        return True
+    return False
+
+
+def mark_action_seen(action_id: str):
+    if not action_id:
+        return
+    _seen_actions[action_id] = None
+    _seen_actions.move_to_end(action_id)
+    while len(_seen_actions) > SEEN_ACTIONS_MAX:
+        _seen_actions.popitem(last=False)
+
+
+# --------------------------------------------------
+# Batched insert
+# --------------------------------------------------
+def _lock() -> asyncio.Lock:
+    global _flush_lock
+    if _flush_lock is None:
+        _flush_lock = asyncio.Lock()
+    return _flush_lock
+
+
+async def enqueue_notification(db, notification_doc: dict) -> asyncio.Future:
+    """
+    Buffer a notification; the batch is written once it reaches
+    NOTIFY_BATCH_SIZE, or by the flush loop after NOTIFY_FLUSH_INTERVAL.
+    Callers dedupe with seen_action() first.
+
+    Returns a future resolved once the batch holding this document is
+    written: to the inserted _id, or None if the action_id already existed
+    (set to an exception if the write failed).
+    """
+    global _buffer_db
+    written = asyncio.get_running_loop().create_future()
+
+    _buffer_db = db
+    _buffer.append((notification_doc, written))
+
+    if len(_buffer) >= NOTIFY_BATCH_SIZE:
+        await flush_notifications()
+
+    return written
+
+
+def _settle(batch: list, waiters: list, error: Exception = None, duplicates: set = ()):
+    for index, (doc, written) in enumerate(zip(batch, waiters)):
+        if written.done():
+            continue
+        if error:
+            written.set_exception(error)
+        else:
+            written.set_result(None if index in duplicates else doc.get("_id"))
+
+
+async def flush_notifications():
+    async with _lock():
+        if not _buffer or _buffer_db is None:
+            return
+
+        batch = [doc for doc, _ in _buffer]
+        waiters = [written for _, written in _buffer]
+        _buffer.clear()
+
+        started = time.perf_counter()
+        error = None
+        duplicate_indexes = set()
+        try:
+            result = await _buffer_db["notifications"].insert_many(batch, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            details = e.details or {}
+            errors = details.get("writeErrors", [])
+            duplicate_indexes = {err.get("index") for err in errors if err.get("code") == 11000}
+            duplicates = len(duplicate_indexes)
+            _stats["db_duplicates"] += duplicates
+            _stats["failed"] += len(errors) - duplicates
+            inserted = details.get("nInserted", 0)
+            if len(errors) > duplicates:
+                error = e
+        except Exception as e:
+            print(f"❌ Notification batch insert error: {e}")
+            _stats["failed"] += len(batch)
+            inserted = 0
+            error = e
+
+        # Duplicates count as written; other failures fail the whole batch
+        # (re-delivery is safe thanks to the unique action_id index)
+        _settle(batch, waiters, error, duplicate_indexes)
+        if error is None:
+            for doc in batch:
+                mark_action_seen(doc.get("action_id"))
+
+        _stats["inserted"] += inserted
+        _stats["batches"] += 1
+        _stats["last_batch_size"] = len(batch)
+        _stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+
+async def run_notification_flush_loop():
+    while True:
+        await asyncio.sleep(NOTIFY_FLUSH_INTERVAL)
+        try:
+            await flush_notifications()
+        except Exception as e:
+            print(f"❌ Notification flush loop error: {e}")
+
+
+def get_ingest_stats() -> dict:
+    uptime = max(time.monotonic() - _started_at, 1e-6)
+    return {
+        **_stats,
+        "buffered": len(_buffer),
+        "board_map_entries": len(_board_map),
+        "seen_actions": len(_seen_actions),
+        "inserted_per_sec": round(_stats["inserted"] / uptime, 2),
+        "received_per_sec": round(_stats["received"] / uptime, 2),
+    }
@@ -0,0 +1,113 @@
+# app/services/notification_retention.py
+import os
+from datetime import datetime
+from pymongo import UpdateOne
+
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", 90))
+READ_NOTIFICATION_RETENTION_DAYS = int(os.getenv("READ_NOTIFICATION_RETENTION_DAYS", 14))
+NOTIFICATION_COMMENT_MAX_CHARS = int(os.getenv("NOTIFICATION_COMMENT_MAX_CHARS", 1000))
+COMPACTION_BATCH_SIZE = int(os.getenv("NOTIFICATION_COMPACTION_BATCH_SIZE", 500))
+
+MAINTENANCE_COLLECTION = "maintenance_jobs"
+COMPACTION_JOB = "notifications_raw_event_trim_v1"
+
+# Parts of a Trello action worth keeping on a notification
+_DATA_OBJECTS = {
+    "card": ("id", "name", "idShort"),
+    "list": ("id", "name"),
+    "listBefore": ("id", "name"),
+    "listAfter": ("id", "name"),
+    "board": ("id", "name"),
+    "attachment": ("id", "name", "url"),
+    "checklist": ("id", "name"),
+    "checkItem": ("id", "name", "state"),
+    "label": ("id", "name", "color"),
+}
+
+
+def _pick(obj: dict, fields: tuple) -> dict:
+    return {f: obj[f] for f in fields if f in obj}
+
+
+def trim_raw_event(action: dict) -> dict:
+    """
+    Whitelisted subset of a Trello action: ids, names and what changed,
+    without the nested board/list/member snapshots Trello includes.
+    """
+    action = action or {}
+    data = action.get("data") or {}
+
+    trimmed_data = {
+        key: _pick(data[key], fields)
+        for key, fields in _DATA_OBJECTS.items()
+        if isinstance(data.get(key), dict)
+    }
+    if data.get("text"):
+        trimmed_data["text"] = data["text"][:NOTIFICATION_COMMENT_MAX_CHARS]
+    if isinstance(data.get("old"), dict):
+        # Only which fields changed, not their (possibly long) previous values
+        trimmed_data["old_fields"] = sorted(data["old"].keys())
+
+    trimmed = _pick(action, ("id", "type", "date", "idMemberCreator"))
+    if isinstance(action.get("memberCreator"), dict):
+        trimmed["memberCreator"] = _pick(action["memberCreator"], ("id", "fullName", "username"))
+    trimmed["data"] = trimmed_data
+    return trimmed
+
+
+# --------------------------------------------------
+# One-off compaction of existing notifications
+# --------------------------------------------------
+async def compact_notifications(db) -> int:
+    """
+    Trim raw_event on notifications stored before trimming existed, and
+    stamp read_at on already-read ones so the read TTL applies to them.
+    Runs once; completion is recorded in maintenance_jobs.
+    """
+    if await db[MAINTENANCE_COLLECTION].find_one({"_id": COMPACTION_JOB, "finished_at": {"$exists": True}}):
+        return 0
+
+    await db[MAINTENANCE_COLLECTION].update_one(
+        {"_id": COMPACTION_JOB},
+        {"$setOnInsert": {"started_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+    compacted = 0
+    now = datetime.utcnow()
+    cursor = db["notifications"].find(
+        {"raw_event_trimmed": {"$ne": True}},
+        {"raw_event": 1, "is_read": 1, "read_at": 1}
+    ).batch_size(COMPACTION_BATCH_SIZE)
+
+    ops = []
+    async for doc in cursor:
+        update = {"raw_event_trimmed": True}
+        if doc.get("raw_event"):
+            update["raw_event"] = trim_raw_event(doc["raw_event"])
+        if doc.get("is_read") and not doc.get("read_at"):
+            update["read_at"] = now
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+
+        if len(ops) >= COMPACTION_BATCH_SIZE:
+            await db["notifications"].bulk_write(ops, ordered=False)
+            compacted += len(ops)
+            ops = []
+
+    if ops:
+        await db["notifications"].bulk_write(ops, ordered=False)
+        compacted += len(ops)
+
+    await db[MAINTENANCE_COLLECTION].update_one(
+        {"_id": COMPACTION_JOB},
+        {"$set": {"finished_at": datetime.utcnow(), "compacted": compacted}}
+    )
+    print(f"✅ Compacted {compacted} stored notifications")
+    return compacted
+
+
+async def run_notification_compaction(db):
+    try:
+        await compact_notifications(db)
+    except Exception as e:
+        print(f"❌ Notification compaction error: {e}")
@@ -1,45 +1,192 @@
-import requests
+import os
+import asyncio
 
-def get_user_boards(trello_key, trello_token):
-    url = "https://api.trello.com/1/members/me/boards"
+from app.services.trello_client import trello_get
+
+# Above this many cards the nested board response is treated as truncated
+# and cards are re-fetched per list
+PM_NESTED_CARD_LIMIT = int(os.getenv("PM_NESTED_CARD_LIMIT", 1000))
+PM_LIST_PAGE_SIZE = int(os.getenv("PM_LIST_PAGE_SIZE", 500))
+PM_LIST_FETCH_CONCURRENCY = int(os.getenv("PM_LIST_FETCH_CONCURRENCY", 6))
+
+CARD_FIELDS = "name,desc,idList,labels,due,dueComplete,shortUrl,pos,closed"
+LIST_FIELDS = "name,pos"
+LABEL_FIELDS = "name,color"
+CHECKLIST_FIELDS = "name,idCard,pos"
+CHECKITEM_FIELDS = "name,state,pos"
+
+
+async def get_user_boards(trello_key, trello_token):
     params = {"key": trello_key, "token": trello_token, "fields": "name,id"}
     try:
-        response = requests.get(url, params=params)
+        response = await trello_get("/members/me/boards", params=params)
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except Exception as e:
         print(f"❌ Error fetching user boards: {e}")
         return []
 
-def get_pm_data(board_id, trello_key, trello_token):
-    base_url = "https://api.trello.com/1"
-    params = {"key": trello_key, "token": trello_token}
 
-    try:
-        # Fetch lists for the board
-        lists_resp = requests.get(f"{base_url}/boards/{board_id}/lists", params=params)
-        if lists_resp.status_code != 200:
-            print(f"❌ Trello API Error {lists_resp.status_code}: {lists_resp.text}")
-            return {}
-        lists = lists_resp.json()
-
-        board_data = {}
-        for lst in lists:
-            cards_resp = requests.get(f"{base_url}/lists/{lst['id']}/cards", params=params)
-            if cards_resp.status_code != 200:
-                print(f"⚠️ Skipping list {lst['name']} - API error {cards_resp.status_code}: {cards_resp.text}")
-                continue
-            cards = cards_resp.json()
-            board_data[lst["name"]] = [
-                {"id": c["id"], "name": c["name"], "desc": c["desc"], "url": c["shortUrl"]}
-                for c in cards
+# --------------------------------------------------
+# Normalization
+# --------------------------------------------------
+def _checklists_by_card(checklists: list) -> dict:
+    by_card = {}
+    for cl in sorted(checklists or [], key=lambda c: c.get("pos", 0)):
+        by_card.setdefault(cl.get("idCard"), []).append({
+            "name": cl.get("name", ""),
+            "items": [
+                {"name": item.get("name", ""), "state": item.get("state", "incomplete")}
+                for item in sorted(cl.get("checkItems", []), key=lambda i: i.get("pos", 0))
             ]
+        })
+    return by_card
+
+
+def normalize_card(card: dict, checklists_by_card: dict = None) -> dict:
+    """
+    Flatten a Trello card into the shape stored in the mirror / sent to the LLM.
+    """
+    checklists = card.get("checklists")
+    if checklists is not None:
+        checklists = _checklists_by_card(checklists).get(card["id"], [])
+    else:
+        checklists = (checklists_by_card or {}).get(card["id"], [])
+
+    return {
+        "id": card["id"],
+        "name": card.get("name", ""),
+        "desc": card.get("desc", ""),
+        "idList": card.get("idList"),
+        "pos": card.get("pos"),
+        "closed": card.get("closed", False),
+        "labels": [l.get("name") or l.get("color") for l in card.get("labels", [])],
+        "due": card.get("due"),
+        "dueComplete": card.get("dueComplete", False),
+        "url": card.get("shortUrl"),
+        "checklists": checklists,
+    }
+
+
+# --------------------------------------------------
+# Fallback: concurrent per-list paging
+# --------------------------------------------------
+async def _fetch_list_cards(list_id: str, trello_key: str, trello_token: str) -> list:
+    cards = []
+    before = None
+
+    while True:
+        params = {
+            "key": trello_key,
+            "token": trello_token,
+            "fields": CARD_FIELDS,
+            "checklists": "all",
+            "checklist_fields": CHECKLIST_FIELDS,
+            "limit": PM_LIST_PAGE_SIZE,
+        }
+        if before:
+            params["before"] = before
+
+        res = await trello_get(f"/lists/{list_id}/cards", params=params)
+        if res.status_code != 200:
+            raise ValueError(f"Trello list cards fetch failed [{res.status_code}]: {res.text}")
+
+        page = res.json()
+        cards.extend(page)
+
+        if len(page) < PM_LIST_PAGE_SIZE:
+            return cards
+
+        # Card ids are time-ordered, so page backwards from the oldest seen
+        before = min(c["id"] for c in page)
+
+
+async def _fetch_cards_per_list(lists: list, trello_key: str, trello_token: str) -> list:
+    semaphore = asyncio.Semaphore(PM_LIST_FETCH_CONCURRENCY)
+
+    async def _run(lst):
+        async with semaphore:
+            return await _fetch_list_cards(lst["id"], trello_key, trello_token)
+
+    pages = await asyncio.gather(*(_run(lst) for lst in lists))
+
+    seen = set()
+    cards = []
+    for page in pages:
+        for card in page:
+            if card["id"] not in seen:
+                seen.add(card["id"])
+                cards.append(card)
+    return cards
+
+
+# --------------------------------------------------
+# PM data
+# --------------------------------------------------
+async def get_pm_data(board_id, trello_key, trello_token):
+    """
+    Fetch a board with its lists, cards, labels and checklists in one nested
+    request. Very large boards fall back to concurrent per-list paging.
+
+    Returns {"board_id", "board_name", "lists", "labels", "cards"}; every card
+    carries its list name. Raises ValueError on Trello errors.
+    """
+    params = {
+        "key": trello_key,
+        "token": trello_token,
+        "fields": "name",
+        "lists": "open",
+        "list_fields": LIST_FIELDS,
+        "cards": "open",
+        "card_fields": CARD_FIELDS,
+        "labels": "all",
+        "label_fields": LABEL_FIELDS,
+        "checklists": "all",
+        "checklist_fields": CHECKLIST_FIELDS,
+        "checkItem_fields": CHECKITEM_FIELDS,
+    }
+
+    res = await trello_get(f"/boards/{board_id}", params=params)
+
+    if res.status_code == 200:
+        board = res.json()
+        lists = board.get("lists", [])
+        raw_cards = board.get("cards", [])
+        checklists_by_card = _checklists_by_card(board.get("checklists", []))
+        truncated = len(raw_cards) >= PM_NESTED_CARD_LIMIT
+    elif res.status_code in (400, 413, 414, 504):
+        # Board too large for a single nested response
+        print(f"⚠️ Nested board fetch failed [{res.status_code}], paging per list")
+        board, lists, raw_cards, checklists_by_card, truncated = {}, None, [], {}, True
+    else:
+        raise ValueError(f"Trello board fetch failed [{res.status_code}]: {res.text}")
+
+    if truncated:
+        if lists is None:
+            lists_res = await trello_get(
+                f"/boards/{board_id}/lists",
+                params={"key": trello_key, "token": trello_token, "fields": LIST_FIELDS}
+            )
+            if lists_res.status_code != 200:
+                raise ValueError(f"Trello lists fetch failed [{lists_res.status_code}]: {lists_res.text}")
+            lists = lists_res.json()
+
+        raw_cards = await _fetch_cards_per_list(lists, trello_key, trello_token)
 
-        return board_data
+    list_names = {lst["id"]: lst.get("name", "") for lst in lists}
+    cards = []
+    for raw in raw_cards:
+        card = normalize_card(raw, checklists_by_card)
+        card["list_name"] = list_names.get(card["idList"], "")
+        cards.append(card)
 
-    except requests.exceptions.RequestException as e:
-        print(f"🚨 Request failed: {e}")
-        return {}
-    except ValueError as e:
-        print(f"🚨 JSON decode failed: {e}")
-        return {}
+    return {
+        "board_id": board_id,
+        "board_name": board.get("name"),
+        "lists": [
+            {"id": lst["id"], "name": lst.get("name", "")}
+            for lst in sorted(lists, key=lambda l: l.get("pos", 0))
+        ],
+        "labels": [l.get("name") for l in board.get("labels", []) if l.get("name")],
+        "cards": cards,
+    }
@@ -0,0 +1,175 @@
+# app/services/pm_serializer.py
+import os
+import re
+import math
+
+PM_TOKEN_BUDGET = int(os.getenv("PM_TOKEN_BUDGET", 24000))
+PM_DESC_MAX_CHARS = int(os.getenv("PM_DESC_MAX_CHARS", 600))
+PM_MAX_COMMENTS = int(os.getenv("PM_MAX_COMMENTS", 3))
+
+# Rough chars-per-token ratio for Gemini / GPT-style tokenizers
+CHARS_PER_TOKEN = 4
+
+# Progressively smaller renderings tried until the text fits the budget
+_LEVELS = [
+    {"desc_chars": PM_DESC_MAX_CHARS, "comments": PM_MAX_COMMENTS, "checklists": True},
+    {"desc_chars": PM_DESC_MAX_CHARS, "comments": 0, "checklists": True},
+    {"desc_chars": PM_DESC_MAX_CHARS // 3, "comments": 0, "checklists": False},
+    {"desc_chars": 0, "comments": 0, "checklists": False},
+]
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+def _clean_text(text: str, max_chars: int) -> str:
+    text = re.sub(r"\s+", " ", text or "").strip()
+    if max_chars and len(text) > max_chars:
+        text = text[:max_chars].rsplit(" ", 1)[0] + "…"
+    return text
+
+
+def _group_by_list(pm_data: dict) -> list:
+    """
+    [(list_name, [cards])] in board list order; unknown lists go last.
+    """
+    order = [lst.get("name", "") for lst in pm_data.get("lists", [])]
+    grouped = {name: [] for name in order}
+
+    for card in pm_data.get("cards", []):
+        grouped.setdefault(card.get("list_name") or "Other", []).append(card)
+
+    return [(name, cards) for name, cards in grouped.items() if cards]
+
+
+def _render_card(card: dict, level: dict, seen_descs: dict) -> list:
+    header = f"- {_clean_text(card.get('name', ''), 200)}"
+
+    labels = [l for l in card.get("labels") or [] if l]
+    if labels:
+        header += f" [{', '.join(labels)}]"
+
+    if card.get("due"):
+        header += f" (due {str(card['due'])[:10]}{', done' if card.get('dueComplete') else ''})"
+
+    lines = [header]
+
+    if level["desc_chars"]:
+        desc = _clean_text(card.get("desc", ""), level["desc_chars"])
+        if desc:
+            # Identical descriptions (templates, copy-paste) are written once
+            if desc in seen_descs:
+                lines.append(f"  (same description as '{seen_descs[desc]}')")
+            else:
+                seen_descs[desc] = card.get("name", "")
+                lines.append(f"  {desc}")
+
+    if level["checklists"]:
+        for cl in card.get("checklists") or []:
+            items = ", ".join(
+                f"{_clean_text(i.get('name', ''), 80)}{' ✓' if i.get('state') == 'complete' else ''}"
+                for i in cl.get("items", [])
+            )
+            if items:
+                lines.append(f"  {_clean_text(cl.get('name', ''), 60) or 'Checklist'}: {items}")
+
+    if level["comments"]:
+        for comment in (card.get("comments") or [])[-level["comments"]:]:
+            comment = _clean_text(comment, 200)
+            if comment:
+                lines.append(f"  > {comment}")
+
+    return lines
+
+
+def _render(groups: list, level: dict, max_cards_per_list: int = None) -> str:
+    seen_descs = {}
+    out = []
+
+    for list_name, cards in groups:
+        out.append(f"## {list_name} ({len(cards)})")
+        shown = cards if max_cards_per_list is None else cards[:max_cards_per_list]
+        for card in shown:
+            out.extend(_render_card(card, level, seen_descs))
+        if len(shown) < len(cards):
+            out.append(f"- … {len(cards) - len(shown)} more cards")
+        out.append("")
+
+    return "\n".join(out).strip()
+
+
+def chunk_pm_data(pm_data: dict, chunk_tokens: int) -> list:
+    """
+    Split full-detail PM text into chunks of roughly `chunk_tokens`:
+    one chunk per list, large lists split into card batches. Each chunk is
+    summarized on its own, so duplicate descriptions are only collapsed
+    within a chunk.
+    Returns [{"list_name", "part", "text"}].
+    """
+    level = _LEVELS[0]
+    chunks = []
+
+    for list_name, cards in _group_by_list(pm_data or {}):
+        seen_descs = {}
+        batch, batch_tokens, part = [], 0, 1
+
+        for card in cards:
+            lines = _render_card(card, level, seen_descs)
+            if batch and batch_tokens + estimate_tokens("\n".join(lines)) > chunk_tokens:
+                chunks.append({"list_name": list_name, "part": part, "text": "\n".join(batch)})
+                batch, batch_tokens, part = [], 0, part + 1
+                # Re-render so a duplicate description is written out in full
+                seen_descs = {}
+                lines = _render_card(card, level, seen_descs)
+            batch.extend(lines)
+            batch_tokens += estimate_tokens("\n".join(lines))
+
+        if batch:
+            chunks.append({"list_name": list_name, "part": part, "text": "\n".join(batch)})
+
+    return chunks
+
+
+def full_detail_tokens(pm_data: dict) -> int:
+    """
+    Estimated tokens of the untruncated compact rendering.
+    """
+    return estimate_tokens(_render(_group_by_list(pm_data or {}), _LEVELS[0]))
+
+
+def serialize_pm_data(pm_data: dict, token_budget: int = None) -> tuple:
+    """
+    Compact text rendering of board PM data for the doc prompt: cards grouped
+    by list name, no ids or empty fields, long descriptions truncated and
+    duplicates collapsed. Shrinks detail (then cards per list) until the
+    estimated token count fits `token_budget`.
+
+    Returns (text, stats).
+    """
+    budget = token_budget or PM_TOKEN_BUDGET
+    groups = _group_by_list(pm_data or {})
+
+    text, level_used, max_cards = "", 0, None
+    for level_used, level in enumerate(_LEVELS):
+        text = _render(groups, level)
+        if estimate_tokens(text) <= budget:
+            break
+    else:
+        # Still too large with names only: cap cards per list
+        largest = max((len(cards) for _, cards in groups), default=0)
+        max_cards = largest
+        while max_cards > 1 and estimate_tokens(text) > budget:
+            max_cards = max(1, int(max_cards * 0.75))
+            text = _render(groups, _LEVELS[-1], max_cards_per_list=max_cards)
+
+    stats = {
+        "cards": len((pm_data or {}).get("cards", [])),
+        "lists": len(groups),
+        "raw_tokens": estimate_tokens(str(pm_data)),
+        "tokens": estimate_tokens(text),
+        "budget": budget,
+        "detail_level": level_used,
+        "max_cards_per_list": max_cards,
+    }
+    return text, stats
@@ -0,0 +1,139 @@
+# app/services/single_flight.py
+import os
+import json
+import uuid
+import hashlib
+import asyncio
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+
+LEASES_COLLECTION = "generation_leases"
+
+SINGLE_FLIGHT_LEASE_SECONDS = int(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", 60))
+SINGLE_FLIGHT_RESULT_TTL = int(os.getenv("SINGLE_FLIGHT_RESULT_TTL", 60))  # seconds a finished result stays readable
+SINGLE_FLIGHT_POLL_INTERVAL = float(os.getenv("SINGLE_FLIGHT_POLL_INTERVAL", 1))
+
+# key -> Task shared by identical concurrent callers in this process
+_inflight = {}
+
+_stats = {"leader": 0, "local_joins": 0, "remote_joins": 0, "takeovers": 0}
+
+
+def flight_key(*parts) -> str:
+    """
+    Stable hash of everything that makes two requests interchangeable.
+    """
+    raw = json.dumps(list(parts), sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# --------------------------------------------------
+# Mongo lease
+# --------------------------------------------------
+async def _try_acquire(db, key: str):
+    """
+    Returns this run's id if the lease was taken, else None.
+    A finished or expired lease can be taken over.
+    """
+    now = datetime.utcnow()
+    run_id = uuid.uuid4().hex
+    lease = {
+        "status": "running",
+        "run_id": run_id,
+        "expires_at": now + timedelta(seconds=SINGLE_FLIGHT_LEASE_SECONDS),
+        "started_at": now,
+    }
+
+    try:
+        await db[LEASES_COLLECTION].insert_one({"_id": key, **lease})
+        return run_id
+    except DuplicateKeyError:
+        pass
+
+    taken = await db[LEASES_COLLECTION].find_one_and_update(
+        {"_id": key, "$or": [{"status": "done"}, {"expires_at": {"$lt": now}}]},
+        {"$set": lease, "$unset": {"result": ""}}
+    )
+    return run_id if taken else None
+
+
+async def _renew_lease(db, key: str, run_id: str):
+    while True:
+        await asyncio.sleep(SINGLE_FLIGHT_LEASE_SECONDS / 3)
+        await db[LEASES_COLLECTION].update_one(
+            {"_id": key, "run_id": run_id},
+            {"$set": {"expires_at": datetime.utcnow() + timedelta(seconds=SINGLE_FLIGHT_LEASE_SECONDS)}}
+        )
+
+
+async def _lead(db, key: str, run_id: str, factory):
+    renewer = asyncio.create_task(_renew_lease(db, key, run_id))
+    try:
+        result = await factory()
+    except BaseException:
+        # Release so a waiter takes over instead of waiting out the lease
+        await db[LEASES_COLLECTION].delete_one({"_id": key, "run_id": run_id})
+        raise
+    finally:
+        renewer.cancel()
+
+    await db[LEASES_COLLECTION].update_one(
+        {"_id": key, "run_id": run_id},
+        {"$set": {
+            "status": "done",
+            "result": result,
+            "expires_at": datetime.utcnow() + timedelta(seconds=SINGLE_FLIGHT_RESULT_TTL),
+        }}
+    )
+    return result
+
+
+async def _run_coalesced(db, key: str, factory):
+    while True:
+        run_id = await _try_acquire(db, key)
+        if run_id:
+            _stats["leader"] += 1
+            return await _lead(db, key, run_id, factory)
+
+        # Another worker is generating: wait for the run we observed
+        lease = await db[LEASES_COLLECTION].find_one({"_id": key}, {"result": 0})
+        if not lease or lease.get("status") != "running":
+            continue
+        watched = lease["run_id"]
+        _stats["remote_joins"] += 1
+
+        while True:
+            await asyncio.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+            lease = await db[LEASES_COLLECTION].find_one({"_id": key})
+
+            if lease and lease.get("run_id") == watched:
+                if lease.get("status") == "done":
+                    return lease.get("result")
+                if lease["expires_at"] >= datetime.utcnow():
+                    continue
+
+            # Released, expired or replaced: try to take over
+            _stats["takeovers"] += 1
+            break
+
+
+async def single_flight(db, key: str, factory):
+    """
+    Run `factory()` once for all identical concurrent callers: in-process
+    callers share one task, other workers wait on a Mongo lease and read the
+    leader's stored result.
+    """
+    task = _inflight.get(key)
+    if task is not None:
+        _stats["local_joins"] += 1
+    else:
+        task = asyncio.create_task(_run_coalesced(db, key, factory))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    # A disconnecting caller must not cancel the shared run
+    return await asyncio.shield(task)
+
+
+def get_single_flight_stats() -> dict:
+    return {**_stats, "inflight": len(_inflight)}
@@ -0,0 +1,157 @@
+# app/services/trello_client.py
+import os
+import httpx
+
+from app.services.trello_rate_limiter import scheduler
+
+TRELLO_API_BASE = "https://api.trello.com/1"
+
+# Pool sizing / timeouts (tunable per deployment)
+TRELLO_HTTP_MAX_CONNECTIONS = int(os.getenv("TRELLO_HTTP_MAX_CONNECTIONS", 50))
+TRELLO_HTTP_MAX_KEEPALIVE = int(os.getenv("TRELLO_HTTP_MAX_KEEPALIVE", 20))
+TRELLO_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("TRELLO_HTTP_KEEPALIVE_EXPIRY", 30))
+TRELLO_HTTP_TIMEOUT = float(os.getenv("TRELLO_HTTP_TIMEOUT", 30))
+TRELLO_HTTP_CONNECT_TIMEOUT = float(os.getenv("TRELLO_HTTP_CONNECT_TIMEOUT", 10))
+TRELLO_HTTP_POOL_TIMEOUT = float(os.getenv("TRELLO_HTTP_POOL_TIMEOUT", 10))
+TRELLO_HTTP2 = os.getenv("TRELLO_HTTP2", "true").lower() in ("1", "true", "yes")
+
+_client = None
+# HTTP/2 actually negotiated by the current client (False after the h2 fallback)
+_http2_active = False
+
+_stats = {
+    "requests": 0,
+    "errors": 0,
+    "in_flight": 0,
+    "max_in_flight": 0,
+}
+
+
+# --------------------------------------------------
+# Client lifecycle
+# --------------------------------------------------
+def _build_client() -> httpx.AsyncClient:
+    global _http2_active
+    http2 = TRELLO_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("⚠️ 'h2' not installed, Trello client falling back to HTTP/1.1")
+            http2 = False
+
+    _http2_active = http2
+    return httpx.AsyncClient(
+        base_url=TRELLO_API_BASE,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=TRELLO_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=TRELLO_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=TRELLO_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            TRELLO_HTTP_TIMEOUT,
+            connect=TRELLO_HTTP_CONNECT_TIMEOUT,
+            pool=TRELLO_HTTP_POOL_TIMEOUT,
+        ),
+    )
+
+
+async def init_trello_client():
+    """
+    Create the shared Trello client. Called once from app startup.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+        print("✅ Trello HTTP client ready")
+    return _client
+
+
+async def close_trello_client():
+    """
+    Close the shared Trello client and its pooled connections.
+    """
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        print("✅ Trello HTTP client closed")
+    _client = None
+
+
+def get_trello_client() -> httpx.AsyncClient:
+    """
+    Return the shared client, creating it lazily when used outside the app
+    lifecycle (scripts, one-off jobs).
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+# --------------------------------------------------
+# Requests
+# --------------------------------------------------
+async def trello_request(method: str, path: str, **kwargs) -> httpx.Response:
+    """
+    Send a request to the Trello API over the shared pooled client.
+    `path` is relative to TRELLO_API_BASE, e.g. "/members/me/boards".
+    Every call goes through the rate-limit scheduler (per key / per token
+    budgets, 429 retries).
+    """
+    client = get_trello_client()
+    params = kwargs.get("params") or {}
+
+    async def _send():
+        _stats["requests"] += 1
+        _stats["in_flight"] += 1
+        _stats["max_in_flight"] = max(_stats["max_in_flight"], _stats["in_flight"])
+        try:
+            return await client.request(method, path, **kwargs)
+        except httpx.HTTPError:
+            _stats["errors"] += 1
+            raise
+        finally:
+            _stats["in_flight"] -= 1
+
+    return await scheduler.run(_send, key=params.get("key"), token=params.get("token"))
+
+
+async def trello_get(path: str, **kwargs) -> httpx.Response:
+    return await trello_request("GET", path, **kwargs)
+
+
+async def trello_post(path: str, **kwargs) -> httpx.Response:
+    return await trello_request("POST", path, **kwargs)
+
+
+# --------------------------------------------------
+# Pool stats
+# --------------------------------------------------
+def get_pool_stats() -> dict:
+    """
+    Snapshot of connection-pool usage, for sizing the limits above.
+    """
+    connections = []
+    if _client is not None and not _client.is_closed:
+        pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", None) or [])
+
+    idle = sum(1 for c in connections if c.is_idle())
+
+    return {
+        "client_open": _client is not None and not _client.is_closed,
+        "http2_requested": TRELLO_HTTP2,
+        "http2_enabled": _http2_active,
+        "limits": {
+            "max_connections": TRELLO_HTTP_MAX_CONNECTIONS,
+            "max_keepalive_connections": TRELLO_HTTP_MAX_KEEPALIVE,
+            "keepalive_expiry": TRELLO_HTTP_KEEPALIVE_EXPIRY,
+        },
+        "connections": len(connections),
+        "idle_connections": idle,
+        "active_connections": len(connections) - idle,
+        **_stats,
+        "rate_limit": scheduler.get_stats(),
+    }
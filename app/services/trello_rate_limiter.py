@@ -0,0 +1,191 @@
+# app/services/trello_rate_limiter.py
+import os
+import time
+import random
+import asyncio
+from collections import OrderedDict
+
+# Trello budgets: 300 req / 10 s per API key, 100 req / 10 s per token.
+# A full bucket allows burst + 10 * rate requests in any 10 s window,
+# so the defaults keep that sum at half of each limit.
+TRELLO_KEY_RATE = float(os.getenv("TRELLO_KEY_RATE", 15))          # requests / second
+TRELLO_KEY_BURST = float(os.getenv("TRELLO_KEY_BURST", 150))
+TRELLO_TOKEN_RATE = float(os.getenv("TRELLO_TOKEN_RATE", 5))       # requests / second
+TRELLO_TOKEN_BURST = float(os.getenv("TRELLO_TOKEN_BURST", 50))
+TRELLO_MAX_IN_FLIGHT = int(os.getenv("TRELLO_MAX_IN_FLIGHT", 40))
+
+TRELLO_MAX_RETRIES = int(os.getenv("TRELLO_MAX_RETRIES", 4))
+TRELLO_BACKOFF_BASE = float(os.getenv("TRELLO_BACKOFF_BASE", 0.5))  # seconds
+TRELLO_BACKOFF_MAX = float(os.getenv("TRELLO_BACKOFF_MAX", 20))
+
+# Idle per-token buckets are evicted beyond this many entries
+MAX_TOKEN_BUCKETS = 10_000
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """
+        Seconds to wait before one token is available (0 if available now).
+        """
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def drain(self, seconds: float):
+        """
+        Empty the bucket and hold it empty for `seconds` (used after a 429).
+        """
+        self.tokens = -seconds * self.rate
+        self.updated = time.monotonic()
+
+
+class TrelloScheduler:
+    """
+    Shared gate for every Trello call: caps in-flight requests and enforces
+    per-key and per-token budgets.
+    """
+
+    def __init__(self):
+        self._key_buckets = {}
+        self._token_buckets = OrderedDict()
+        self._in_flight = None
+        self.stats = {
+            "throttled_429": 0,
+            "retries": 0,
+            "bucket_waits": 0,
+            "bucket_wait_seconds": 0.0,
+            "gave_up": 0,
+        }
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._in_flight is None:
+            self._in_flight = asyncio.Semaphore(TRELLO_MAX_IN_FLIGHT)
+        return self._in_flight
+
+    def _buckets_for(self, key: str, token: str):
+        """
+        Returns (key_bucket, token_bucket); either may be None.
+        """
+        key_bucket = token_bucket = None
+
+        if key:
+            key_bucket = self._key_buckets.get(key)
+            if key_bucket is None:
+                key_bucket = self._key_buckets[key] = TokenBucket(TRELLO_KEY_RATE, TRELLO_KEY_BURST)
+
+        if token:
+            token_bucket = self._token_buckets.get(token)
+            if token_bucket is None:
+                token_bucket = self._token_buckets[token] = TokenBucket(TRELLO_TOKEN_RATE, TRELLO_TOKEN_BURST)
+                if len(self._token_buckets) > MAX_TOKEN_BUCKETS:
+                    self._token_buckets.popitem(last=False)
+            else:
+                self._token_buckets.move_to_end(token)
+
+        return key_bucket, token_bucket
+
+    @staticmethod
+    def _throttled_bucket(response, key_bucket, token_bucket):
+        """
+        The bucket a 429 applies to. Trello names the key limit in the error
+        body; anything else is treated as the per-token limit so one user's
+        429 does not stall everyone sharing the API key.
+        """
+        try:
+            body = response.text or ""
+        except Exception:
+            body = ""
+        if "API_KEY_LIMIT_EXCEEDED" in body or token_bucket is None:
+            return key_bucket
+        return token_bucket
+
+    async def _acquire(self, buckets):
+        while True:
+            wait = max((b.delay() for b in buckets), default=0.0)
+            if wait <= 0:
+                for b in buckets:
+                    b.take()
+                return
+            self.stats["bucket_waits"] += 1
+            self.stats["bucket_wait_seconds"] += wait
+            await asyncio.sleep(wait)
+
+    @staticmethod
+    def _retry_after(response) -> float:
+        value = response.headers.get("Retry-After")
+        if not value:
+            return 0.0
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return 0.0
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        # Full jitter exponential backoff
+        return random.uniform(0, min(TRELLO_BACKOFF_MAX, TRELLO_BACKOFF_BASE * (2 ** attempt)))
+
+    async def run(self, send, key: str = None, token: str = None):
+        """
+        Run `send()` (a coroutine factory returning an httpx.Response) under the
+        rate limits, retrying 429s with Retry-After / jittered backoff.
+        """
+        key_bucket, token_bucket = self._buckets_for(key, token)
+        buckets = [b for b in (key_bucket, token_bucket) if b is not None]
+        attempt = 0
+
+        while True:
+            await self._acquire(buckets)
+            async with self._semaphore():
+                response = await send()
+
+            if response.status_code != 429:
+                return response
+
+            self.stats["throttled_429"] += 1
+
+            if attempt >= TRELLO_MAX_RETRIES:
+                self.stats["gave_up"] += 1
+                print(f"❌ Trello rate limit: giving up after {attempt} retries")
+                return response
+
+            wait = self._retry_after(response) or self._backoff(attempt)
+            throttled = self._throttled_bucket(response, key_bucket, token_bucket)
+            if throttled is not None:
+                throttled.drain(wait)
+
+            attempt += 1
+            self.stats["retries"] += 1
+            print(f"⚠️ Trello 429, retrying in {wait:.2f}s (attempt {attempt})")
+            await asyncio.sleep(wait)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "tracked_tokens": len(self._token_buckets),
+            "max_in_flight": TRELLO_MAX_IN_FLIGHT,
+        }
+
+
+scheduler = TrelloScheduler()
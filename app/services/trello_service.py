@@ -5,6 +5,8 @@ import httpx
 from fastapi.responses import RedirectResponse
 from dotenv import load_dotenv
 from app.models.user_token_model import save_user_token, get_user_token
+from app.services.trello_client import trello_get, trello_post
+from app.services.board_cache import get_member_boards
 
 load_dotenv()
 
@@ -56,26 +58,15 @@ async def save_token(user_id: str, trello_token: str, db):
 # --------------------------------------------------
 # Fetch Boards (UI dropdown source)
 # --------------------------------------------------
-async def fetch_user_boards_from_trello(user_id: str, db):
+async def fetch_user_boards_from_trello(user_id: str, db, force_refresh: bool = False):
     """
-    Fetch all boards of the user using their Trello token.
+    Fetch all boards of the user using their Trello token (served from the board cache).
     """
     token = await get_user_token(user_id, db)
     if not token:
         raise ValueError("User not connected to Trello")
 
-    url = "https://api.trello.com/1/members/me/boards"
-    params = {
-        "key": TRELLO_API_KEY,
-        "token": token,
-        "fields": "id,name,url"
-    }
-
-    async with httpx.AsyncClient(timeout=30) as client:
-        res = await client.get(url, params=params)
-
-    if res.status_code != 200:
-        raise RuntimeError(res.text)
+    boards = await get_member_boards(token, force_refresh=force_refresh)
 
     return [
         {
@@ -83,7 +74,7 @@ async def fetch_user_boards_from_trello(user_id: str, db):
             "board_name": b["name"],
             "board_url": b["url"]
         }
-        for b in res.json()
+        for b in boards
     ]
 
 
@@ -119,79 +110,129 @@ def extract_board_id_from_url(url: str) -> str:
 
 
 # --------------------------------------------------
-# Get Board Name
+# Resolve Board (id + name)
 # --------------------------------------------------
-async def get_board_name(user_id: str, project_id: str, db=None) -> str:
+def _is_board_id(value: str) -> bool:
+    return bool(value) and len(value) == 24
+
+
+async def resolve_board(user_id: str, project_id: str, db=None) -> tuple:
     """
-    Fetch the board name using the user's token.
+    Resolve (board_id, board_name) for a project id or board name.
+    Served from board_user_map (kept fresh by webhooks and the board cache);
+    Trello is only called on a miss.
     """
     if not project_id or project_id == "undefined":
-        return "Untitled Project"
+        return project_id, "Untitled Project"
 
     if db is None:
-        print("❌ DB instance not provided to get_board_name")
-        return "Untitled Project"
+        print("❌ DB instance not provided to resolve_board")
+        return project_id, "Untitled Project"
+
+    # ------------------ Local lookup ------------------
+    if _is_board_id(project_id):
+        entry = await db["board_user_map"].find_one(
+            {"board_id": project_id},
+            {"_id": 0, "board_id": 1, "board_name": 1}
+        )
+    else:
+        entry = await db["board_user_map"].find_one(
+            {
+                "user_id": user_id,
+                "board_name": re.compile(f"^{re.escape(project_id.strip())}$", re.IGNORECASE)
+            },
+            {"_id": 0, "board_id": 1, "board_name": 1}
+        )
+
+    if entry and entry.get("board_name"):
+        return entry["board_id"], entry["board_name"]
 
+    # ------------------ Miss: ask Trello ------------------
     token = await get_user_token(user_id, db)
     if not token:
         print("❌ Trello token missing for user:", user_id)
-        return "Untitled Project"
+        return project_id, "Untitled Project"
+
+    try:
+        # Refreshes board_user_map for every board of this user
+        boards = await get_member_boards(token, force_refresh=True, db=db, user_id=user_id)
+        for b in boards:
+            if b["id"] == project_id or b["name"].strip().lower() == project_id.strip().lower():
+                return b["id"], b["name"]
+    except Exception as e:
+        print("❌ Exception while fetching boards:", e)
 
-    url = f"https://api.trello.com/1/boards/{project_id}"
+    if not _is_board_id(project_id):
+        return project_id, "Untitled Project"
+
+    # Board not in the member's list (e.g. shared via link): fetch it directly
     params = {"key": TRELLO_API_KEY, "token": token, "fields": "name"}
 
     try:
-        async with httpx.AsyncClient(timeout=15) as client:
-            res = await client.get(url, params=params)
+        res = await trello_get(f"/boards/{project_id}", params=params)
 
         if res.status_code == 200:
             name = res.json().get("name")
             if name:
-                return name
+                await db["board_user_map"].update_one(
+                    {"board_id": project_id},
+                    {"$set": {"board_name": name}, "$setOnInsert": {"user_id": user_id}},
+                    upsert=True
+                )
+                return project_id, name
 
         print(f"❌ Trello board fetch failed [{res.status_code}]: {res.text}")
 
     except Exception as e:
         print("❌ Exception while fetching board name:", e)
 
-    return "Untitled Project"
+    return project_id, "Untitled Project"
+
+
+# --------------------------------------------------
+# Get Board Name
+# --------------------------------------------------
+async def get_board_name(user_id: str, project_id: str, db=None) -> str:
+    """
+    Fetch the board name (local board_user_map first, Trello on a miss).
+    """
+    _, board_name = await resolve_board(user_id, project_id, db)
+    return board_name
 
 
 # --------------------------------------------------
 # Register Webhook
 # --------------------------------------------------
 async def register_trello_webhook(board_id: str, callback_url: str, token: str, key: str):
-    async with httpx.AsyncClient(timeout=15) as client:
+    # 1️⃣ Check existing webhooks
+    check_res = await trello_get(
+        f"/tokens/{token}/webhooks",
+        params={"key": key, "token": token}
+    )
+    check_res.raise_for_status()
+    existing_hooks = check_res.json()
+
+    # 2️⃣ Avoid duplicates
+    for hook in existing_hooks:
+        if hook.get("idModel") == board_id and hook.get("callbackURL") == callback_url:
+            print(f"Webhook already exists for board {board_id}")
+            return hook  # ✅ Skip creating
 
-        # 1️⃣ Check existing webhooks
-        check_res = await client.get(
-            f"https://api.trello.com/1/tokens/{token}/webhooks",
-            params={"key": key, "token": token}
+    # 3️⃣ Register webhook
+    try:
+        create_res = await trello_post(
+            "/webhooks",
+            params={"key": key, "token": token},
+            json={
+                "idModel": board_id,
+                "callbackURL": callback_url,
+                "description": "AutoDocGen Webhook"
+            }
         )
-        check_res.raise_for_status()
-        existing_hooks = check_res.json()
-
-        # 2️⃣ Avoid duplicates
-        for hook in existing_hooks:
-            if hook.get("idModel") == board_id and hook.get("callbackURL") == callback_url:
-                print(f"Webhook already exists for board {board_id}")
-                return hook  # ✅ Skip creating
-
-        # 3️⃣ Register webhook
-        try:
-            create_res = await client.post(
-                "https://api.trello.com/1/webhooks",
-                params={"key": key, "token": token},
-                json={
-                    "idModel": board_id,
-                    "callbackURL": callback_url,
-                    "description": "AutoDocGen Webhook"
-                }
-            )
-            create_res.raise_for_status()
-            print(f"Webhook registered for board {board_id}")
-            return create_res.json()
-        except httpx.HTTPStatusError as e:
-            print(f"❌ Failed to create webhook: {e.response.status_code}, {e.response.text}")
-            return None
+        create_res.raise_for_status()
+        print(f"Webhook registered for board {board_id}")
+        return create_res.json()
+    except httpx.HTTPStatusError as e:
+        print(f"❌ Failed to create webhook: {e.response.status_code}, {e.response.text}")
+        return None
 
@@ -0,0 +1,247 @@
+# app/services/webhook_queue.py
+import os
+import time
+import zlib
+import asyncio
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+
+EVENTS_COLLECTION = "webhook_events"
+
+WEBHOOK_CONSUMERS = int(os.getenv("WEBHOOK_CONSUMERS", 8))
+WEBHOOK_LEASE_SECONDS = int(os.getenv("WEBHOOK_LEASE_SECONDS", 60))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", 5))
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", 1))
+WEBHOOK_EVENT_RETENTION_HOURS = int(os.getenv("WEBHOOK_EVENT_RETENTION_HOURS", 72))  # processed events kept for replay
+# Fixed number of board partitions; consumers split them between themselves
+WEBHOOK_PARTITIONS = 64
+
+_wakeup = None
+# Pending "ack once written" tasks (kept referenced until they finish)
+_ack_tasks = set()
+
+_stats = {"enqueued": 0, "processed": 0, "retried": 0, "failed": 0, "replayed": 0, "total_processing_ms": 0.0}
+
+
+def _wakeup_event() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+def board_partition(board_id: str) -> int:
+    # Stable across processes (unlike hash())
+    return zlib.crc32((board_id or "").encode("utf-8")) % WEBHOOK_PARTITIONS
+
+
+def consumer_partitions(index: int, count: int) -> list:
+    return [p for p in range(WEBHOOK_PARTITIONS) if p % count == index]
+
+
+# --------------------------------------------------
+# Producer
+# --------------------------------------------------
+async def enqueue_webhook_event(db, payload: dict):
+    """
+    Durably record a webhook delivery. Only this insert happens before the
+    request is acknowledged.
+    """
+    action = payload.get("action") or {}
+    board_id = ((action.get("data") or {}).get("board") or {}).get("id")
+    await db[EVENTS_COLLECTION].insert_one({
+        "payload": payload,
+        "action_id": action.get("id"),
+        "action_type": action.get("type"),
+        "board_id": board_id,
+        "partition": board_partition(board_id),
+        "status": "pending",
+        "attempts": 0,
+        "received_at": datetime.utcnow(),
+    })
+    _stats["enqueued"] += 1
+    _wakeup_event().set()
+
+
+# --------------------------------------------------
+# Consumers
+# --------------------------------------------------
+async def _claim_event(db, partitions: list = None):
+    """
+    Oldest claimable event in `partitions` (all partitions if None).
+    """
+    now = datetime.utcnow()
+    query = {"$or": [
+        {"status": "pending", "available_at": {"$not": {"$gt": now}}},
+        {"status": "processing", "lease_until": {"$lt": now}},
+    ]}
+    if partitions is not None:
+        query["partition"] = {"$in": partitions}
+
+    return await db[EVENTS_COLLECTION].find_one_and_update(
+        query,
+        {
+            "$set": {"status": "processing", "lease_until": now + timedelta(seconds=WEBHOOK_LEASE_SECONDS)},
+            "$inc": {"attempts": 1},
+        },
+        sort=[("received_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _ack(db, event: dict, started: float):
+    await db[EVENTS_COLLECTION].update_one(
+        {"_id": event["_id"]},
+        {"$set": {"status": "done", "processed_at": datetime.utcnow()}, "$unset": {"lease_until": "", "error": ""}}
+    )
+    _stats["processed"] += 1
+    _stats["total_processing_ms"] += (time.perf_counter() - started) * 1000
+
+
+async def _nack(db, event: dict, error: Exception):
+    if event.get("attempts", 1) >= WEBHOOK_MAX_ATTEMPTS:
+        print(f"❌ Webhook event {event['_id']} failed permanently: {error}")
+        _stats["failed"] += 1
+        update = {"status": "failed", "processed_at": datetime.utcnow(), "error": str(error)}
+    else:
+        _stats["retried"] += 1
+        backoff = min(2 ** event.get("attempts", 1), 300)
+        update = {
+            "status": "pending",
+            "available_at": datetime.utcnow() + timedelta(seconds=backoff),
+            "error": str(error),
+        }
+
+    await db[EVENTS_COLLECTION].update_one(
+        {"_id": event["_id"]},
+        {"$set": update, "$unset": {"lease_until": ""}}
+    )
+
+
+async def _ack_when_written(db, event: dict, written, started: float):
+    try:
+        try:
+            await written
+        except Exception as e:
+            await _nack(db, event, e)
+            return
+        await _ack(db, event, started)
+    except Exception as e:
+        # Left in `processing`; re-delivered once its lease expires
+        print(f"❌ Webhook event {event['_id']} ack error: {e}")
+
+
+async def _handle_event(db, handler, event: dict):
+    started = time.perf_counter()
+    try:
+        # Re-deliveries must get past the in-memory action id dedupe
+        written = await handler(
+            event["payload"],
+            db=db,
+            redelivery=event.get("replay", False) or event.get("attempts", 1) > 1
+        )
+    except Exception as e:
+        await _nack(db, event, e)
+        return
+
+    if written is None:
+        await _ack(db, event, started)
+    else:
+        # Ack once the batched notification write lands; keep consuming meanwhile
+        task = asyncio.create_task(_ack_when_written(db, event, written, started))
+        _ack_tasks.add(task)
+        task.add_done_callback(_ack_tasks.discard)
+
+
+async def _consumer_loop(db, handler, index: int, count: int):
+    wakeup = _wakeup_event()
+    # Each board maps to one partition and each partition to one consumer,
+    # so a board's events are handled one at a time, oldest first
+    partitions = consumer_partitions(index, count)
+
+    while True:
+        try:
+            event = await _claim_event(db, partitions)
+        except Exception as e:
+            print(f"❌ Webhook consumer {index} claim error: {e}")
+            event = None
+
+        if not event:
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=WEBHOOK_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            await _handle_event(db, handler, event)
+        except Exception as e:
+            # Losing this consumer would stall its partitions until a restart;
+            # the event is re-delivered once its lease expires
+            print(f"❌ Webhook consumer {index} error on event {event['_id']}: {e}")
+
+
+def start_webhook_consumers(db, handler, count: int = None) -> list:
+    """
+    At-least-once consumers: `handler(payload, db=..., redelivery=...)` must be
+    idempotent and may return an awaitable that resolves once its writes are durable.
+    Events left in `processing` by a dead process are re-delivered when their lease expires.
+    Consumers own disjoint board partitions, so within a process each board's
+    events are processed in arrival order (a retried event waits out its
+    backoff without holding back newer ones).
+    """
+    count = min(count or WEBHOOK_CONSUMERS, WEBHOOK_PARTITIONS)
+    return [
+        asyncio.create_task(_consumer_loop(db, handler, i, count))
+        for i in range(count)
+    ]
+
+
+# --------------------------------------------------
+# Replay / metrics
+# --------------------------------------------------
+async def replay_webhook_events(db, since: datetime, until: datetime = None, board_id: str = None) -> int:
+    query = {"status": {"$in": ["done", "failed"]}, "received_at": {"$gte": since}}
+    if until:
+        query["received_at"]["$lte"] = until
+    if board_id:
+        query["board_id"] = board_id
+
+    result = await db[EVENTS_COLLECTION].update_many(
+        query,
+        {
+            "$set": {"status": "pending", "replay": True, "attempts": 0},
+            "$unset": {"processed_at": "", "available_at": "", "error": ""},
+        }
+    )
+    _stats["replayed"] += result.modified_count
+    _wakeup_event().set()
+    return result.modified_count
+
+
+async def get_webhook_queue_stats(db) -> dict:
+    counts = {
+        row["_id"]: row["count"]
+        async for row in db[EVENTS_COLLECTION].aggregate([
+            {"$match": {"status": {"$in": ["pending", "processing", "failed"]}}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ])
+    }
+
+    oldest = await db[EVENTS_COLLECTION].find_one(
+        {"status": {"$in": ["pending", "processing"]}},
+        {"received_at": 1},
+        sort=[("received_at", 1)]
+    )
+    lag = (datetime.utcnow() - oldest["received_at"]).total_seconds() if oldest else 0.0
+
+    return {
+        **{k: v for k, v in _stats.items() if k != "total_processing_ms"},
+        "pending": counts.get("pending", 0),
+        "processing": counts.get("processing", 0),
+        "failed_total": counts.get("failed", 0),
+        "acks_pending": len(_ack_tasks),
+        "lag_seconds": round(lag, 2),
+        "avg_processing_ms": round(_stats["total_processing_ms"] / _stats["processed"], 2) if _stats["processed"] else 0.0,
+    }
@@ -0,0 +1,212 @@
+# app/services/webhook_registry.py
+import os
+import asyncio
+from datetime import datetime
+from pymongo import UpdateOne
+
+from app.models.user_token_model import get_all_user_tokens
+from app.services.trello_client import trello_get, trello_post
+from app.services.board_cache import get_member_boards
+
+TRELLO_API_KEY = os.getenv("TRELLO_API_KEY")
+BASE_URL = os.getenv("BASE_URL")
+TRELLO_CALLBACK_URL = os.getenv("TRELLO_CALLBACK_URL") or f"{BASE_URL}/pm"
+
+WEBHOOK_RECONCILE_CONCURRENCY = int(os.getenv("WEBHOOK_RECONCILE_CONCURRENCY", 8))
+# Force a Trello webhook listing for every token, even when the local registry
+# already covers all of a user's boards (catches hooks disabled on Trello's side)
+WEBHOOK_FULL_RECONCILE = os.getenv("WEBHOOK_FULL_RECONCILE", "false").lower() in ("1", "true", "yes")
+
+REGISTRY_COLLECTION = "trello_webhooks"
+
+_status = {
+    "state": "idle",
+    "total_users": 0,
+    "processed_users": 0,
+    "failed_users": 0,
+    "webhooks_registered": 0,
+    "webhooks_existing": 0,
+    "started_at": None,
+    "finished_at": None,
+}
+
+
+def get_reconcile_status() -> dict:
+    return dict(_status)
+
+
+# --------------------------------------------------
+# Per-user reconciliation
+# --------------------------------------------------
+async def map_user_boards(db, user_id: str, boards: list):
+    """
+    Point every board at its user in board_user_map (single bulk write).
+    """
+    if not boards:
+        return
+
+    await db["board_user_map"].bulk_write(
+        [
+            UpdateOne(
+                {"board_id": b["id"]},
+                {"$set": {
+                    "user_id": user_id,
+                    "board_name": b["name"],
+                    "board_desc": b.get("desc", "")
+                }},
+                upsert=True
+            )
+            for b in boards
+        ],
+        ordered=False
+    )
+
+
+async def reconcile_user_webhooks(db, user_id: str, token: str, boards: list = None) -> dict:
+    """
+    Make sure every board of this user has our webhook.
+    Uses one boards listing per token, and at most one webhook listing per token
+    (skipped when the local registry already covers every board).
+    Callers that already listed and mapped the boards pass them as `boards`.
+    """
+    if boards is None:
+        boards = await get_member_boards(token)
+        await map_user_boards(db, user_id, boards)
+
+    if not boards:
+        return {"registered": 0, "existing": 0}
+
+    # ------------------ What does the registry already know? ------------------
+    board_ids = [b["id"] for b in boards]
+    known = {
+        doc["board_id"]
+        async for doc in db[REGISTRY_COLLECTION].find(
+            {"board_id": {"$in": board_ids}, "callback_url": TRELLO_CALLBACK_URL},
+            {"_id": 0, "board_id": 1}
+        )
+    }
+
+    missing = [b for b in board_ids if b not in known]
+    if not missing and not WEBHOOK_FULL_RECONCILE:
+        return {"registered": 0, "existing": len(board_ids)}
+
+    # ------------------ One webhook listing for the whole token ------------------
+    hooks_res = await trello_get(
+        f"/tokens/{token}/webhooks",
+        params={"key": TRELLO_API_KEY, "token": token}
+    )
+    hooks_res.raise_for_status()
+    existing_hooks = {
+        hook.get("idModel"): hook
+        for hook in hooks_res.json()
+        if hook.get("callbackURL") == TRELLO_CALLBACK_URL
+    }
+
+    registered = 0
+    ops = []
+    now = datetime.utcnow()
+
+    for board_id in board_ids:
+        hook = existing_hooks.get(board_id)
+
+        if hook is None:
+            create_res = await trello_post(
+                "/webhooks",
+                params={"key": TRELLO_API_KEY, "token": token},
+                json={
+                    "idModel": board_id,
+                    "callbackURL": TRELLO_CALLBACK_URL,
+                    "description": "AutoDocGen Webhook"
+                }
+            )
+            if create_res.status_code != 200:
+                print(
+                    f"❌ Failed to create webhook for board {board_id}: "
+                    f"{create_res.status_code}, {create_res.text}"
+                )
+                continue
+            hook = create_res.json()
+            registered += 1
+            print(f"✅ Webhook registered for board {board_id}")
+
+        ops.append(UpdateOne(
+            {"board_id": board_id, "callback_url": TRELLO_CALLBACK_URL},
+            {"$set": {
+                "user_id": user_id,
+                "webhook_id": hook.get("id"),
+                "active": hook.get("active", True),
+                "updated_at": now
+            }},
+            upsert=True
+        ))
+
+    if ops:
+        await db[REGISTRY_COLLECTION].bulk_write(ops, ordered=False)
+
+    return {"registered": registered, "existing": len(ops) - registered}
+
+
+# --------------------------------------------------
+# Background reconciler
+# --------------------------------------------------
+async def reconcile_all_webhooks(db):
+    """
+    Reconcile webhooks for every connected user with bounded concurrency.
+    Meant to run as a background task once the server is accepting traffic.
+    """
+    _status.update({
+        "state": "running",
+        "total_users": 0,
+        "processed_users": 0,
+        "failed_users": 0,
+        "webhooks_registered": 0,
+        "webhooks_existing": 0,
+        "started_at": datetime.utcnow(),
+        "finished_at": None,
+    })
+
+    try:
+        users = [u for u in await get_all_user_tokens(db) if u.get("trello_token")]
+    except Exception as e:
+        _status["state"] = "failed"
+        _status["finished_at"] = datetime.utcnow()
+        print(f"❌ Webhook reconcile could not load user tokens: {e}")
+        return
+
+    _status["total_users"] = len(users)
+    semaphore = asyncio.Semaphore(WEBHOOK_RECONCILE_CONCURRENCY)
+
+    async def _run(user):
+        async with semaphore:
+            try:
+                result = await reconcile_user_webhooks(db, user.get("user_id"), user["trello_token"])
+                _status["webhooks_registered"] += result["registered"]
+                _status["webhooks_existing"] += result["existing"]
+            except Exception as e:
+                _status["failed_users"] += 1
+                print(f"❌ Webhook reconcile failed for user {user.get('user_id')}: {e}")
+            finally:
+                _status["processed_users"] += 1
+
+    try:
+        await asyncio.gather(*(_run(u) for u in users))
+        _status["state"] = "done"
+    except BaseException:
+        # Cancelled (shutdown) or an unexpected error outside the per-user handler
+        _status["state"] = "failed"
+        raise
+    finally:
+        _status["finished_at"] = datetime.utcnow()
+
+    print(
+        f"✅ Webhook reconcile finished: {_status['processed_users']} users, "
+        f"{_status['webhooks_registered']} registered, {_status['failed_users']} failed"
+    )
+
+
+def start_webhook_reconciler(db) -> asyncio.Task:
+    """
+    Schedule reconcile_all_webhooks in the background and return its task.
+    """
+    _status["state"] = "scheduled"
+    return asyncio.create_task(reconcile_all_webhooks(db))
@@ -1,120 +1,307 @@
 from app.graph.document_graph import workflow, WorkflowState
 from app.models.user_token_model import get_user_token
-from app.services.trello_service import get_board_name
+from app.services.trello_service import resolve_board
 from app.services.cleaner import clean_generated_doc
+from app.services.single_flight import single_flight, flight_key
+from app.services.event_bus import publish
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
 from datetime import datetime
+import asyncio
+import math
 import re
 import os
 
+# Graph nodes whose LLM output is document text (map-step summaries are not)
+STREAMED_NODES = ("doc_agent", "section_agent")
 
-async def execute_workflow(user_id: str, project_id: str, data: dict = None, db=None):
+# How a new output is merged into the previous version:
+# "append" adds only headings the document does not have yet,
+# "replace" also rewrites sections whose heading already exists
+MERGE_MODES = ("append", "replace")
+
+# Attempts at saving a version when concurrent saves race for the number
+SAVE_MAX_ATTEMPTS = 3
+
+# Optional whole-number request fields (0 / missing = default)
+INT_OPTIONS = ("pm_token_budget", "section_group_size")
+
+# A "## " heading line (not "###")
+_HEADING_RE = re.compile(r'^##(?!#)[ \t]*(.+?)[ \t]*$', flags=re.MULTILINE)
+
+
+def _number_option(data: dict, field: str, cast):
+    """
+    Optional non-negative number from the request (0 when missing).
+    Raises ValueError for anything else.
+    """
+    value = data.get(field)
+    if value is None or value == "":
+        return 0
+    if isinstance(value, bool):
+        raise ValueError(field)
+    try:
+        number = cast(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(field)
+    if not math.isfinite(number) or number < 0:
+        raise ValueError(field)
+    return number
+
+
+def _flight_key(user_id: str, project_id: str, data: dict) -> str:
+    """
+    Requests that would generate the same document share a key
+    (llm_timeout and the entry point do not change the output).
+    """
+    return flight_key(
+        user_id,
+        project_id,
+        str(data.get("template", "")).strip(),
+        data.get("pdf_headings") or [],
+        data.get("selected_headings") or [],
+        data.get("generation_mode") or "",
+        *(_key_number(data, field) for field in INT_OPTIONS),
+        data.get("merge") or "append"
+    )
+
+
+def _key_number(data: dict, field: str):
+    # Invalid values are rejected by _prepare_workflow; key on them as sent
+    try:
+        return _number_option(data, field, int)
+    except ValueError:
+        return repr(data.get(field))
+
+
+async def _prepare_workflow(user_id: str, project_id: str, data: dict, db):
+    """
+    Validate the request and build the graph input.
+    Returns (error_response, None) or (None, context).
+    """
     if db is None:
         raise RuntimeError("Database instance not provided")
 
-    docs_collection = db["generated_docs"]
-
     # -------------------- Fetch Trello token --------------------
     token = await get_user_token(user_id, db)
     if not token:
         return {
             "status": "error",
             "message": "User not connected to Trello"
-        }
+        }, None
 
     pdf_headings = data.get("pdf_headings", []) if data else []
     selected_headings = data.get("selected_headings", []) if data else []
-    template_name = str(data.get("template", "")).strip()
+    template_name = str(data.get("template", "")).strip() if data else ""
 
     if not template_name:
         return {
             "status": "error",
             "message": "Missing template name"
-        }
+        }, None
+
+    merge = data.get("merge") or "append"
+    if merge not in MERGE_MODES:
+        return {
+            "status": "error",
+            "message": f"Unknown merge mode '{merge}' (expected one of {', '.join(MERGE_MODES)})"
+        }, None
+
+    try:
+        timeout = _number_option(data, "llm_timeout", float)
+    except ValueError:
+        return {
+            "status": "error",
+            "message": "'llm_timeout' must be a non-negative number of seconds"
+        }, None
+
+    int_options = {}
+    for field in INT_OPTIONS:
+        try:
+            int_options[field] = _number_option(data, field, int)
+        except ValueError:
+            return {
+                "status": "error",
+                "message": f"'{field}' must be a non-negative whole number"
+            }, None
 
-    # -------------------- Get Board Name --------------------
-    board_name = await get_board_name(user_id, project_id, db)
+    # -------------------- Resolve Board (local map, Trello on miss) --------------------
+    board_id, board_name = await resolve_board(user_id, project_id, db)
 
     # -------------------- Prepare WorkflowState --------------------
     input_state = WorkflowState(
-        project_id=project_id,
+        project_id=board_id,
         project_name=board_name,
         user_trello_key=os.getenv("TRELLO_API_KEY"),
         user_trello_token=token,
         pm_data={},
+        cleaned_pm_data="",
+        pm_token_budget=int_options["pm_token_budget"],
+        pm_token_stats={},
         uploaded_pdf_bytes=b"",
         pdf_headings=pdf_headings,
         selected_headings=selected_headings,
-        generated_docs=""
+        generated_docs="",
+        template_name=template_name,
+        bypass_cache=bool(data.get("bypass_cache", False)),
+        cache_hit=False,
+        generation_mode=data.get("generation_mode", ""),
+        section_group_size=int_options["section_group_size"],
+        sections=[],
+        generation_error=""
     )
 
-    # -------------------- Run AI Workflow --------------------
-    result = await workflow.ainvoke(input_state)
-    raw_doc = result.get("generated_docs", "")
+    config = {"configurable": {"db": db, "llm_timeout": timeout or None}}
 
-    formatted_doc = clean_generated_doc(str(raw_doc), board_name)
+    return None, {
+        "input_state": input_state,
+        "config": config,
+        "template_name": template_name,
+        "board_name": board_name,
+        "merge": merge,
+    }
+
+
+def _split_sections(doc: str) -> list:
+    """
+    [(heading, text)] for each "## " section, without the "---" separators
+    that appended sections are preceded by.
+    """
+    matches = list(_HEADING_RE.finditer(doc))
+    sections = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(doc)
+        text = re.sub(r'\n-{3,}\s*$', "", doc[match.start():end].rstrip()).strip()
+        sections.append((match.group(1), text))
+    return sections
 
-    # -------------------- Merge with previous version (if exists) --------------------
-    latest_entry = await docs_collection.find_one(
-        {
-            "user_id": user_id,
-            "project_id": project_id,
-            "template_name": template_name
-        },
-        sort=[("version", -1)]
-    )
 
-    if latest_entry:
-        existing_doc = latest_entry.get("generated_docs", "")
-        existing_headings = set(
-            re.findall(r'##\s*(.+)', existing_doc, flags=re.IGNORECASE)
+def _replace_sections(existing_doc: str, new_doc: str) -> str:
+    """
+    Rewrite sections of `existing_doc` in place with same-heading sections of
+    `new_doc`; headings it does not have yet are appended.
+    """
+    merged = existing_doc
+    content_to_add = []
+
+    for heading, text in _split_sections(new_doc):
+        pattern = re.compile(
+            rf'^##(?!#)[ \t]*{re.escape(heading)}[ \t]*$.*?(?=\n+(?:-{{3,}}\n+)?##(?!#)|\Z)',
+            flags=re.MULTILINE | re.DOTALL
         )
+        merged, count = pattern.subn(lambda _: text, merged, count=1)
+        if not count:
+            content_to_add.append(text)
+
+    if content_to_add:
+        merged = merged.strip() + "\n\n---\n" + "\n\n".join(content_to_add)
+    return merged
+
 
-        new_sections = re.findall(
-            r'(##\s*.+?)(?=\n##|\Z)',
-            formatted_doc,
-            flags=re.DOTALL
+def _merge_with_previous(latest_entry, formatted_doc: str, merge: str) -> str:
+    """
+    The new document merged into the previous version (see MERGE_MODES).
+    """
+    if not latest_entry:
+        return formatted_doc
+
+    existing_doc = latest_entry.get("generated_docs", "")
+    if merge == "replace":
+        return _replace_sections(existing_doc, formatted_doc)
+
+    existing_headings = set(
+        re.findall(r'##\s*(.+)', existing_doc, flags=re.IGNORECASE)
+    )
+
+    new_sections = re.findall(
+        r'(##\s*.+?)(?=\n##|\Z)',
+        formatted_doc,
+        flags=re.DOTALL
+    )
+
+    content_to_add = []
+
+    for section in new_sections:
+        match = re.match(r'##\s*(.+)', section)
+        if match:
+            heading = match.group(1).strip()
+            if heading not in existing_headings:
+                content_to_add.append(section.strip())
+
+    if content_to_add:
+        return (
+            existing_doc.strip()
+            + "\n\n---\n"
+            + "\n\n".join(content_to_add)
         )
+    return existing_doc
+
 
-        content_to_add = []
-
-        for section in new_sections:
-            match = re.match(r'##\s*(.+)', section)
-            if match:
-                heading = match.group(1).strip()
-                if heading not in existing_headings:
-                    content_to_add.append(section.strip())
-
-        if content_to_add:
-            formatted_doc = (
-                existing_doc.strip()
-                + "\n\n---\n"
-                + "\n\n".join(content_to_add)
-            )
-        else:
-            formatted_doc = existing_doc
-
-    # -------------------- Safety fallback --------------------
-    if not formatted_doc.strip():
-        formatted_doc = "No content generated."
-
-    # -------------------- Versioning --------------------
-    version_count = await docs_collection.count_documents({
+async def _save_generated_doc(
+    db,
+    user_id: str,
+    project_id: str,
+    template_name: str,
+    board_name: str,
+    raw_doc: str,
+    merge: str = "append"
+) -> dict:
+    """
+    Clean the raw LLM output, merge it with the previous version and store it
+    as a new version. Nothing is stored (or published) when the merged
+    document is identical to the previous version. Version numbers are
+    unique per (user, board, template); a save that loses the race re-merges
+    onto the winner.
+    """
+    docs_collection = db["generated_docs"]
+    doc_query = {
         "user_id": user_id,
         "project_id": project_id,
         "template_name": template_name
-    })
+    }
 
-    version = version_count + 1
+    cleaned_doc = clean_generated_doc(str(raw_doc), board_name)
 
-    # -------------------- Save as NEW VERSION --------------------
-    await docs_collection.insert_one({
-        "user_id": user_id,
+    for attempt in range(1, SAVE_MAX_ATTEMPTS + 1):
+        # -------------------- Merge with previous version (if exists) --------------------
+        latest_entry = await docs_collection.find_one(doc_query, sort=[("version", -1)])
+        formatted_doc = _merge_with_previous(latest_entry, cleaned_doc, merge)
+
+        if latest_entry and formatted_doc.strip() == latest_entry.get("generated_docs", "").strip():
+            return {
+                "status": "success",
+                "template_name": template_name,
+                "version": latest_entry.get("version"),
+                "generated_docs": latest_entry.get("generated_docs", ""),
+                "unchanged": True
+            }
+
+        # -------------------- Safety fallback --------------------
+        if not formatted_doc.strip():
+            formatted_doc = "No content generated."
+
+        # -------------------- Save as NEW VERSION --------------------
+        version = (latest_entry.get("version") or 0) + 1 if latest_entry else 1
+        try:
+            await docs_collection.insert_one({
+                **doc_query,
+                "version": version,
+                "generated_docs": formatted_doc,
+                "size": len(formatted_doc.encode("utf-8")),
+                "board_name": board_name,
+                "created_at": datetime.utcnow()
+            })
+            break
+        except DuplicateKeyError:
+            # A concurrent save took this version number; merge onto it instead
+            if attempt == SAVE_MAX_ATTEMPTS:
+                raise
+
+    await publish(db, user_id, "document_ready", {
         "project_id": project_id,
         "template_name": template_name,
-        "version": version,
-        "generated_docs": formatted_doc,
         "board_name": board_name,
-        "created_at": datetime.utcnow()
+        "version": version
     })
 
     return {
@@ -123,3 +310,231 @@ async def execute_workflow(user_id: str, project_id: str, data: dict = None, db=
         "version": version,
         "generated_docs": formatted_doc
     }
+
+
+async def copy_doc_as_new_version(db, doc: dict) -> dict:
+    """
+    Store a copy of a saved document as the latest version of its series
+    (numbered from the latest version, not from the copied one).
+    """
+    docs_collection = db["generated_docs"]
+    doc_query = {
+        "user_id": doc.get("user_id"),
+        "project_id": doc.get("project_id"),
+        "template_name": doc.get("template_name")
+    }
+
+    for attempt in range(1, SAVE_MAX_ATTEMPTS + 1):
+        latest_entry = await docs_collection.find_one(doc_query, sort=[("version", -1)])
+        new_doc = {
+            **doc,
+            "_id": ObjectId(),
+            "version": (latest_entry.get("version") or 0) + 1 if latest_entry else 1,
+            "created_at": datetime.utcnow()
+        }
+        try:
+            await docs_collection.insert_one(new_doc)
+            return new_doc
+        except DuplicateKeyError:
+            # A concurrent save took this version number; take the next one
+            if attempt == SAVE_MAX_ATTEMPTS:
+                raise
+
+
+async def execute_workflow(user_id: str, project_id: str, data: dict = None, db=None):
+    """
+    Run the pipeline and save a new version. Identical concurrent requests
+    (see _flight_key), streamed or not, share a single run.
+    """
+    if db is None:
+        raise RuntimeError("Database instance not provided")
+
+    data = data or {}
+
+    # A forced regeneration must not be answered with someone else's run
+    if data.get("bypass_cache"):
+        return await _execute_workflow(user_id, project_id, data, db)
+
+    key = _flight_key(user_id, project_id, data)
+    return await single_flight(db, key, lambda: _execute_workflow(user_id, project_id, data, db))
+
+
+async def _execute_workflow(user_id: str, project_id: str, data: dict, db):
+    error, ctx = await _prepare_workflow(user_id, project_id, data, db)
+    if error:
+        return error
+
+    # -------------------- Run AI Workflow --------------------
+    result = await workflow.ainvoke(ctx["input_state"], config=ctx["config"])
+    if result.get("generation_error"):
+        return {"status": "error", "message": result["generation_error"]}
+    raw_doc = result.get("generated_docs", "")
+
+    saved = await _save_generated_doc(
+        db,
+        user_id,
+        project_id,
+        ctx["template_name"],
+        ctx["board_name"],
+        raw_doc,
+        merge=ctx["merge"]
+    )
+    saved["cached"] = bool(result.get("cache_hit"))
+    saved["pm_token_stats"] = result.get("pm_token_stats", {})
+    return saved
+
+
+async def stream_workflow(user_id: str, project_id: str, data: dict = None, db=None):
+    """
+    Same pipeline as execute_workflow, yielding progress events as it goes:
+    pm_data, section (new heading seen), chunk (LLM text), section_done
+    (fan-out mode), done / error.
+    In section mode, chunk and section events carry the section index since
+    sections are generated concurrently and their tokens interleave.
+    The final document is persisted exactly like execute_workflow.
+
+    Coalesced with identical runs like execute_workflow (this also covers
+    queued jobs and auto-regeneration). A caller that joins another run
+    gets no progress events, only its final done / error.
+    """
+    if db is None:
+        raise RuntimeError("Database instance not provided")
+
+    data = data or {}
+
+    if data.get("bypass_cache"):
+        async for item in _stream_workflow(user_id, project_id, data, db):
+            yield item
+        return
+
+    events = asyncio.Queue()
+
+    async def lead():
+        # Runs only if this caller leads the flight; joiners never see these events
+        result = None
+        async for item in _stream_workflow(user_id, project_id, data, db):
+            events.put_nowait(item)
+            if item["event"] in ("done", "error"):
+                result = item["data"]
+        return result
+
+    flight = asyncio.ensure_future(single_flight(db, _flight_key(user_id, project_id, data), lead))
+
+    while True:
+        getter = asyncio.ensure_future(events.get())
+        try:
+            await asyncio.wait({getter, flight}, return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            # Caller went away; the shared flight itself keeps going
+            getter.cancel()
+            raise
+        if not getter.done():
+            getter.cancel()
+            break
+        item = getter.result()
+        yield item
+        if item["event"] in ("done", "error"):
+            return
+
+    # Joined another identical run: only its result is available
+    try:
+        result = flight.result()
+    except Exception as e:
+        yield {"event": "error", "data": {"status": "error", "message": str(e)}}
+        return
+
+    if not result or result.get("status") != "success":
+        yield {"event": "error", "data": result or {"status": "error", "message": "Generation failed"}}
+    else:
+        yield {"event": "done", "data": {**result, "joined": True}}
+
+
+async def _stream_workflow(user_id: str, project_id: str, data: dict, db):
+    error, ctx = await _prepare_workflow(user_id, project_id, data, db)
+    if error:
+        yield {"event": "error", "data": error}
+        return
+
+    yield {"event": "start", "data": {"board_name": ctx["board_name"], "template_name": ctx["template_name"]}}
+
+    raw_doc = ""
+    streamed = {}   # section index (None in single mode) -> text so far
+    cache_hit = False
+    pm_token_stats = {}
+    generation_error = ""
+    seen_headings = set()
+
+    try:
+        async for mode, chunk in workflow.astream(
+            ctx["input_state"],
+            config=ctx["config"],
+            stream_mode=["updates", "messages"]
+        ):
+            if mode == "messages":
+                message, metadata = chunk
+                if metadata.get("langgraph_node") not in STREAMED_NODES:
+                    continue
+                text = getattr(message, "content", "")
+                if not text or not isinstance(text, str):
+                    continue
+
+                index = metadata.get("section_index")
+                streamed[index] = streamed.get(index, "") + text
+                yield {"event": "chunk", "data": {"text": text, "section": index}}
+
+                # Announce each heading once its line is complete
+                for heading in re.findall(r'^##\s*(.+)\n', streamed[index], flags=re.MULTILINE):
+                    heading = heading.strip()
+                    if heading not in seen_headings:
+                        seen_headings.add(heading)
+                        yield {"event": "section", "data": {"heading": heading, "section": index}}
+
+            elif mode == "updates":
+                for node, update in (chunk or {}).items():
+                    if not isinstance(update, dict):
+                        continue
+                    if node == "pm_agent" and update.get("pm_data"):
+                        yield {"event": "pm_data", "data": {
+                            "node": node,
+                            "cards": len(update["pm_data"].get("cards", []))
+                        }}
+                    if update.get("pm_token_stats"):
+                        pm_token_stats = update["pm_token_stats"]
+                        yield {"event": "pm_tokens", "data": pm_token_stats}
+                    for section in update.get("sections") or []:
+                        yield {"event": "section_done", "data": {
+                            "index": section["index"],
+                            "headings": section["headings"],
+                            "ok": section.get("ok", True),
+                            "error": section.get("error"),
+                            "content": section["content"]
+                        }}
+                    if update.get("generated_docs"):
+                        raw_doc = update["generated_docs"]
+                    if update.get("cache_hit"):
+                        cache_hit = True
+                    if update.get("generation_error"):
+                        generation_error = update["generation_error"]
+
+    except Exception as e:
+        print(f"❌ Streaming workflow failed: {e}")
+        yield {"event": "error", "data": {"status": "error", "message": str(e)}}
+        return
+
+    if generation_error:
+        yield {"event": "error", "data": {"status": "error", "message": generation_error}}
+        return
+
+    result = await _save_generated_doc(
+        db,
+        user_id,
+        project_id,
+        ctx["template_name"],
+        ctx["board_name"],
+        # Partial text of failed sections is never saved
+        raw_doc or streamed.get(None, ""),
+        merge=ctx["merge"]
+    )
+    result["cached"] = cache_hit
+    result["pm_token_stats"] = pm_token_stats
+    yield {"event": "done", "data": result}
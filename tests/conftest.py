@@ -0,0 +1,5 @@
+import os
+
+# Modules check these at import time; tests never reach Trello
+os.environ.setdefault("TRELLO_API_KEY", "test-key")
+os.environ.setdefault("BASE_URL", "http://localhost")
@@ -0,0 +1,178 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from pymongo import DeleteOne  # noqa: E402
+
+from app.services import board_mirror as bm  # noqa: E402
+
+
+# --------------------------------------------------
+# Minimal in-memory cards collection for the writes _card_ops builds
+# --------------------------------------------------
+def _get(doc, path):
+    for part in path.split("."):
+        doc = doc.get(part) if isinstance(doc, dict) else None
+    return doc
+
+
+def _matches(doc, query):
+    for path, cond in query.items():
+        value = _get(doc, path)
+        if isinstance(cond, dict) and "$ne" in cond:
+            if cond["$ne"] in (value or []):
+                return False
+        elif isinstance(cond, dict) and "$not" in cond:
+            if value is not None and value > cond["$not"]["$gt"]:
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+def _apply(doc, update, inserted):
+    for path, value in {**update.get("$set", {}), **(update.get("$setOnInsert", {}) if inserted else {})}.items():
+        *parents, leaf = path.split(".")
+        target = doc
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = value
+    for field, push in update.get("$push", {}).items():
+        doc[field] = (doc.get(field, []) + push["$each"])[push["$slice"]:]
+
+
+class FakeCards:
+    def __init__(self, docs=()):
+        self.docs = [dict(d) for d in docs]
+
+    async def bulk_write(self, ops, ordered=True):
+        for op in ops:
+            found = [d for d in self.docs if _matches(d, op._filter)]
+            if isinstance(op, DeleteOne):
+                self.docs = [d for d in self.docs if d not in found[:1]]
+            elif found:
+                _apply(found[0], op._doc, inserted=False)
+            elif op._upsert:
+                doc = {k: v for k, v in op._filter.items() if not isinstance(v, dict)}
+                _apply(doc, op._doc, inserted=True)
+                self.docs.append(doc)
+
+
+class FakeState:
+    def __init__(self, doc):
+        self.doc = doc
+
+    async def find_one(self, query):
+        return self.doc
+
+    async def update_one(self, query, update):
+        cursor = query.get("synced_through", {}).get("$lt")
+        if cursor is None or self.doc.get("synced_through", "") < cursor:
+            self.doc.update(update["$set"])
+
+
+def _db(cards=(), state=None):
+    state = {"board_id": "b", "lists": [], "synced_through": "2026-01-01T00:00:00.000Z"} if state is None else state
+    return {bm.CARDS_COLLECTION: FakeCards(cards), bm.STATE_COLLECTION: FakeState(state)}
+
+
+def _action(action_type, date, action_id=None, **data):
+    return {"id": action_id or date, "type": action_type, "date": date,
+            "data": {"board": {"id": "b"}, **data}}
+
+
+def _card(db):
+    return db[bm.CARDS_COLLECTION].docs[0]
+
+
+CARD = {"board_id": "b", "card_id": "c1", "name": "Original", "idList": "l1"}
+
+
+# --------------------------------------------------
+# Ordering and duplicates
+# --------------------------------------------------
+def test_a_late_update_does_not_undo_a_newer_one():
+    db = _db([CARD])
+    newer = _action("updateCard", "2026-01-02T00:00:00.000Z", card={"id": "c1", "name": "Newer"},
+                    listAfter={"id": "l3"})
+    older = _action("updateCard", "2026-01-01T12:00:00.000Z", card={"id": "c1", "name": "Older", "desc": "d"},
+                    listAfter={"id": "l2"})
+
+    asyncio.run(bm.apply_actions(db, "b", [newer]))
+    asyncio.run(bm.apply_actions(db, "b", [older]))
+
+    card = _card(db)
+    assert (card["name"], card["idList"]) == ("Newer", "l3")
+    # Fields the newer action never touched still take the older change
+    assert card["desc"] == "d"
+
+
+def test_replayed_create_does_not_reset_an_existing_card():
+    db = _db([CARD])
+    update = _action("updateCard", "2026-01-02T00:00:00.000Z", card={"id": "c1", "name": "Renamed"})
+    create = _action("createCard", "2026-01-01T00:00:00.000Z", card={"id": "c1", "name": "Original"},
+                     list={"id": "l1"})
+
+    asyncio.run(bm.apply_actions(db, "b", [update, create]))
+
+    assert len(db[bm.CARDS_COLLECTION].docs) == 1
+    assert _card(db)["name"] == "Renamed"
+
+
+def test_create_inserts_a_missing_card():
+    db = _db()
+    create = _action("createCard", "2026-01-01T00:00:00.000Z", card={"id": "c1", "name": "New"}, list={"id": "l1"})
+
+    asyncio.run(bm.apply_actions(db, "b", [create]))
+
+    assert (_card(db)["name"], _card(db)["idList"]) == ("New", "l1")
+
+
+def test_redelivered_comment_is_stored_once():
+    db = _db([CARD])
+    comment = _action("commentCard", "2026-01-02T00:00:00.000Z", action_id="a1", card={"id": "c1"}, text="hi")
+
+    for _ in range(3):
+        asyncio.run(bm.apply_actions(db, "b", [comment]))
+
+    assert _card(db)["comments"] == ["hi"]
+
+
+# --------------------------------------------------
+# Delta cursor
+# --------------------------------------------------
+def test_webhooks_do_not_advance_the_delta_cursor():
+    db = _db([CARD])
+    action = _action("updateCard", "2026-03-01T00:00:00.000Z", card={"id": "c1", "name": "x"})
+
+    asyncio.run(bm.apply_webhook_action(db, action))
+
+    assert db[bm.STATE_COLLECTION].doc["synced_through"] == "2026-01-01T00:00:00.000Z"
+
+
+def test_delta_sync_fetches_since_the_cursor_and_advances_it(monkeypatch):
+    db = _db([CARD])
+    requested = []
+    feed = [  # newest first, like Trello
+        _action("updateCard", "2026-02-02T00:00:00.000Z", card={"id": "c1", "name": "Second"}),
+        _action("updateCard", "2026-02-01T00:00:00.000Z", card={"id": "c1", "name": "First"}),
+    ]
+
+    class Response:
+        status_code = 200
+
+        def json(self):
+            return feed
+
+    async def trello_get(path, params):
+        requested.append(params["since"])
+        return Response()
+
+    monkeypatch.setattr(bm, "trello_get", trello_get)
+    asyncio.run(bm.delta_sync_board(db, "b", "key", "token"))
+
+    assert requested == ["2026-01-01T00:00:00.000Z"]
+    assert _card(db)["name"] == "Second"
+    assert db[bm.STATE_COLLECTION].doc["synced_through"] == "2026-02-02T00:00:00.000Z"
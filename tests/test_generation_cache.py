@@ -0,0 +1,51 @@
+import pytest
+
+from app.services.generation_cache import compute_cache_key
+from app.services.pm_serializer import serialize_pm_data
+
+BASE = dict(
+    cleaned_pm_data="## To Do (1)\n- Login page",
+    pdf_headings=["Intro", "Scope"],
+    selected_headings=["Intro"],
+    template_name="SRS",
+    prompt_version="abc123",
+    model_name="gemini-2.5-flash",
+)
+
+
+def _key(**overrides):
+    return compute_cache_key(**{**BASE, **overrides})
+
+
+def test_key_is_stable():
+    assert _key() == _key()
+
+
+def test_template_name_is_case_and_whitespace_insensitive():
+    assert _key(template_name="  srs ") == _key()
+
+
+@pytest.mark.parametrize("field, value", [
+    ("cleaned_pm_data", "## To Do (1)\n- Signup page"),
+    ("pdf_headings", ["Intro"]),
+    ("selected_headings", ["Scope"]),
+    ("template_name", "SDD"),
+    ("prompt_version", "def456"),
+    ("model_name", "gemini-2.5-pro"),
+])
+def test_every_input_changes_the_key(field, value):
+    assert _key(**{field: value}) != _key()
+
+
+def test_token_budget_changes_the_key():
+    pm_data = {
+        "lists": [{"name": "To Do"}],
+        "cards": [
+            {"name": f"Card {i}", "list_name": "To Do", "desc": "word " * 100}
+            for i in range(20)
+        ],
+    }
+    roomy, _ = serialize_pm_data(pm_data, 100_000)
+    tight, _ = serialize_pm_data(pm_data, 200)
+
+    assert _key(cleaned_pm_data=roomy) != _key(cleaned_pm_data=tight)
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from pymongo.errors import OperationFailure  # noqa: E402
+
+from app.services import index_registry as ir  # noqa: E402
+
+
+class FakeCollection:
+    def __init__(self, error=None):
+        self.error = error
+
+    async def create_index(self, keys, **options):
+        if self.error:
+            raise self.error
+
+
+class FakeDb:
+    def __init__(self, create_error=None, command_error=None):
+        self.collection = FakeCollection(create_error)
+        self.command_error = command_error
+        self.commands = []
+
+    def __getitem__(self, name):
+        return self.collection
+
+    async def command(self, command):
+        self.commands.append(command)
+        if self.command_error:
+            raise self.command_error
+
+
+TTL_OPTIONS = {"expireAfterSeconds": 3600}
+CONFLICT = OperationFailure("IndexOptionsConflict", code=85)
+
+
+def _ensure(db, options):
+    return asyncio.run(ir._ensure_index(db, "notifications", [("created_at", 1)], options))
+
+
+def test_new_index_is_ok():
+    assert _ensure(FakeDb(), TTL_OPTIONS) == "ok"
+
+
+def test_changed_ttl_is_updated_in_place():
+    db = FakeDb(create_error=CONFLICT)
+
+    assert _ensure(db, TTL_OPTIONS) == "ttl_updated"
+    assert db.commands == [{
+        "collMod": "notifications",
+        "index": {"keyPattern": {"created_at": 1}, "expireAfterSeconds": 3600},
+    }]
+
+
+def test_failed_ttl_update_is_reported_not_raised():
+    db = FakeDb(create_error=CONFLICT, command_error=OperationFailure("InvalidOptions", code=72))
+    assert _ensure(db, TTL_OPTIONS) == "failed"
+
+
+def test_conflict_without_ttl_fails_without_collmod():
+    db = FakeDb(create_error=CONFLICT)
+
+    assert _ensure(db, {"unique": True}) == "failed"
+    assert db.commands == []
+
+
+def test_version_index_is_unique():
+    version_keys = [("user_id", 1), ("project_id", 1), ("template_name", 1), ("version", -1)]
+    options = [o for c, k, o in ir.INDEXES if c == "generated_docs" and k == version_keys]
+
+    assert options == [{"unique": True}]
+
+
+# --------------------------------------------------
+# Duplicate versions blocking the unique index
+# --------------------------------------------------
+class FakeVersionedDocs:
+    def __init__(self, versions):
+        self.docs = [
+            {"_id": i, "user_id": "u", "project_id": "b", "template_name": "SRS", "version": v, "created_at": i}
+            for i, v in enumerate(versions)
+        ]
+        self.create_calls = 0
+
+    async def create_index(self, keys, **options):
+        self.create_calls += 1
+        versions = [d["version"] for d in self.docs]
+        if len(set(versions)) != len(versions):
+            raise OperationFailure("E11000 duplicate key error", code=11000)
+
+    def aggregate(self, pipeline):
+        versions = [d["version"] for d in self.docs]
+        groups = [{"_id": {"user_id": "u", "project_id": "b", "template_name": "SRS"}}]
+        return FakeCursor(groups if len(set(versions)) != len(versions) else [])
+
+    def find(self, query, projection):
+        return FakeCursor(sorted(self.docs, key=lambda d: (d["version"], d["created_at"])))
+
+    async def bulk_write(self, ops, ordered=True):
+        by_id = {d["_id"]: d for d in self.docs}
+        for op in ops:
+            by_id[op._filter["_id"]].update(op._doc["$set"])
+
+
+class FakeCursor:
+    def __init__(self, items):
+        self.items = items
+
+    def sort(self, keys):
+        return self
+
+    async def to_list(self, length):
+        return list(self.items)
+
+
+def test_duplicate_versions_are_renumbered_then_the_index_is_built():
+    docs = FakeVersionedDocs([1, 2, 2, 3])
+    db = {"generated_docs": docs}
+
+    status = asyncio.run(ir._ensure_index(db, "generated_docs", ir.DOC_VERSION_KEYS, {"unique": True}))
+
+    assert status == "ok"
+    assert docs.create_calls == 2
+    # Same order, consecutive numbers
+    assert [(d["_id"], d["version"]) for d in docs.docs] == [(0, 1), (1, 2), (2, 3), (3, 4)]
+
+
+def test_duplicates_without_a_repair_are_reported():
+    db = FakeDb(create_error=OperationFailure("E11000 duplicate key error", code=11000))
+    assert _ensure(db, {"unique": True}) == "failed"
@@ -0,0 +1,208 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("langgraph")
+
+from app.services import job_queue  # noqa: E402
+
+
+# --------------------------------------------------
+# Minimal in-memory collection for the queries job_queue issues
+# --------------------------------------------------
+def _matches(doc: dict, query: dict) -> bool:
+    for field, cond in query.items():
+        if field == "$or":
+            if not any(_matches(doc, sub) for sub in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = doc.get(field)
+            for op, operand in cond.items():
+                if value is None:
+                    return False
+                if op == "$lt" and not value < operand:
+                    return False
+                if op == "$gte" and not value >= operand:
+                    return False
+        elif doc.get(field) != cond:
+            return False
+    return True
+
+
+def _apply(doc: dict, update: dict):
+    doc.update(update.get("$set", {}))
+    for field, amount in update.get("$inc", {}).items():
+        doc[field] = doc.get(field, 0) + amount
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def find_one_and_update(self, query, update, sort=None, return_document=None):
+        found = [d for d in self.docs if _matches(d, query)]
+        if sort:
+            field, direction = sort[0]
+            found.sort(key=lambda d: d[field], reverse=direction < 0)
+        if not found:
+            return None
+        _apply(found[0], update)
+        return dict(found[0])
+
+    async def update_one(self, query, update):
+        found = [d for d in self.docs if _matches(d, query)]
+        if found:
+            _apply(found[0], update)
+        return SimpleNamespace(matched_count=len(found[:1]))
+
+    async def update_many(self, query, update):
+        found = [d for d in self.docs if _matches(d, query)]
+        for doc in found:
+            _apply(doc, update)
+        return SimpleNamespace(matched_count=len(found))
+
+
+def _db(*docs):
+    return {job_queue.JOBS_COLLECTION: FakeCollection(list(docs))}
+
+
+def _job(job_id, **fields):
+    return {"_id": job_id, "status": "queued", "attempts": 0, "created_at": datetime(2026, 1, 1), **fields}
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+# --------------------------------------------------
+# Claiming
+# --------------------------------------------------
+def test_claim_takes_oldest_queued_job_with_a_fresh_claim_id():
+    db = _db(_job("b", created_at=datetime(2026, 1, 2)), _job("a"))
+
+    first = _run(job_queue._claim_job(db))
+    second = _run(job_queue._claim_job(db))
+
+    assert (first["_id"], second["_id"]) == ("a", "b")
+    assert first["status"] == "running" and first["attempts"] == 1
+    assert first["claim_id"] and first["claim_id"] != second["claim_id"]
+
+
+def test_running_job_with_live_lease_is_not_reclaimed():
+    lease = datetime.utcnow() + timedelta(seconds=60)
+    db = _db(_job("a", status="running", attempts=1, claim_id="old", lease_until=lease))
+
+    assert _run(job_queue._claim_job(db)) is None
+
+
+def test_expired_lease_is_reclaimed_and_old_claim_loses_writes():
+    expired = datetime.utcnow() - timedelta(seconds=1)
+    stale = _job("a", status="running", attempts=1, claim_id="old", lease_until=expired)
+    db = _db(stale)
+
+    reclaimed = _run(job_queue._claim_job(db))
+    assert reclaimed["_id"] == "a"
+    assert reclaimed["attempts"] == 2
+
+    # The original worker comes back (e.g. after a long GC pause or partition)
+    assert _run(job_queue._update_job(db, {"_id": "a", "claim_id": "old"}, {"status": "succeeded"})) is False
+    assert _run(job_queue._update_job(db, reclaimed, {"status": "succeeded"})) is True
+    assert db[job_queue.JOBS_COLLECTION].docs[0]["status"] == "succeeded"
+
+
+def test_exhausted_jobs_are_not_reclaimed_but_failed():
+    expired = datetime.utcnow() - timedelta(seconds=1)
+    db = _db(_job("a", status="running", attempts=job_queue.JOB_MAX_ATTEMPTS, claim_id="x", lease_until=expired))
+
+    assert _run(job_queue._claim_job(db)) is None
+    _run(job_queue._fail_exhausted_jobs(db))
+    assert db[job_queue.JOBS_COLLECTION].docs[0]["status"] == "failed"
+
+
+# --------------------------------------------------
+# Heartbeat
+# --------------------------------------------------
+def test_heartbeat_renews_the_lease_without_progress_events(monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_LEASE_SECONDS", 0.03)
+    start = datetime.utcnow()
+    db = _db(_job("a", status="running", attempts=1, claim_id="c", lease_until=start))
+
+    async def silent_job(db, job):
+        await asyncio.sleep(0.1)
+
+    monkeypatch.setattr(job_queue, "_process_job", silent_job)
+    _run(job_queue._run_job(db, {"_id": "a", "claim_id": "c"}))
+
+    assert db[job_queue.JOBS_COLLECTION].docs[0]["lease_until"] > start + timedelta(seconds=0.05)
+
+
+# --------------------------------------------------
+# Lost claims and write errors
+# --------------------------------------------------
+def test_run_stops_once_the_claim_is_lost(monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_LEASE_SECONDS", 0.03)
+    # Another worker took the job over
+    db = _db(_job("a", status="running", attempts=2, claim_id="theirs"))
+    finished = []
+
+    async def long_job(db, job):
+        await asyncio.sleep(1)
+        finished.append(job["_id"])
+
+    monkeypatch.setattr(job_queue, "_process_job", long_job)
+    _run(asyncio.wait_for(job_queue._run_job(db, {"_id": "a", "claim_id": "mine"}), timeout=0.5))
+
+    assert finished == []
+
+
+def test_progress_write_on_a_lost_claim_stops_the_stream(monkeypatch):
+    db = _db(_job("a", status="running", attempts=1, claim_id="mine"))
+    seen = []
+
+    async def stream_workflow(user_id, project_id, data, db):
+        for event in ("start", "pm_data", "pm_tokens", "done"):
+            if event == "pm_data":
+                db[job_queue.JOBS_COLLECTION].docs[0]["claim_id"] = "theirs"
+            seen.append(event)
+            yield {"event": event, "data": {}}
+
+    monkeypatch.setattr(job_queue, "stream_workflow", stream_workflow)
+    _run(job_queue._process_job(db, {"_id": "a", "claim_id": "mine", "user_id": "u", "project_id": "b"}))
+
+    assert seen == ["start", "pm_data"]
+    assert db[job_queue.JOBS_COLLECTION].docs[0]["status"] == "running"
+
+
+def test_worker_survives_job_errors(monkeypatch):
+    jobs = [{"_id": "a"}, {"_id": "b"}]
+    ran = []
+
+    async def claim(db):
+        return jobs.pop(0) if jobs else None
+
+    async def run_job(db, job):
+        ran.append(job["_id"])
+        raise RuntimeError("primary stepped down")
+
+    async def sweep(db):
+        pass
+
+    monkeypatch.setattr(job_queue, "_claim_job", claim)
+    monkeypatch.setattr(job_queue, "_run_job", run_job)
+    monkeypatch.setattr(job_queue, "_fail_exhausted_jobs", sweep)
+    monkeypatch.setattr(job_queue, "JOB_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(job_queue, "_wakeup", None)
+
+    async def main():
+        worker = asyncio.create_task(job_queue._worker_loop(None, 0))
+        await asyncio.sleep(0.05)
+        alive = not worker.done()
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+        return alive
+
+    assert _run(main())
+    assert ran == ["a", "b"]
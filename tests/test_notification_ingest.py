@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from pymongo.errors import BulkWriteError  # noqa: E402
+
+from app.services import notification_ingest as ni  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(ni, "_seen_actions", ni.OrderedDict())
+    monkeypatch.setattr(ni, "_buffer", [])
+    monkeypatch.setattr(ni, "_buffer_db", None)
+    monkeypatch.setattr(ni, "_flush_lock", None)
+
+
+class FakeNotifications:
+    def __init__(self, fail_with=None):
+        self.fail_with = fail_with
+        self.batches = []
+
+    async def insert_many(self, docs, ordered=True):
+        # Like pymongo, ids are assigned to the documents before sending
+        for i, doc in enumerate(docs):
+            doc.setdefault("_id", f"oid-{len(self.batches)}-{i}")
+        self.batches.append(list(docs))
+        if self.fail_with:
+            raise self.fail_with
+        return type("Result", (), {"inserted_ids": [doc["_id"] for doc in docs]})()
+
+
+def _ingest(collection, *action_ids):
+    async def main():
+        db = {"notifications": collection}
+        futures = [await ni.enqueue_notification(db, {"action_id": a}) for a in action_ids]
+        await ni.flush_notifications()
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    return asyncio.run(main())
+
+
+# --------------------------------------------------
+# seen_action
+# --------------------------------------------------
+def test_checking_does_not_mark():
+    assert ni.seen_action("a") is False
+    assert ni.seen_action("a") is False
+
+
+def test_marked_ids_are_seen_and_oldest_are_evicted(monkeypatch):
+    monkeypatch.setattr(ni, "SEEN_ACTIONS_MAX", 3)
+    for action_id in ("a", "b", "c", "d"):
+        ni.mark_action_seen(action_id)
+
+    assert not ni.seen_action("a")
+    assert all(ni.seen_action(a) for a in ("b", "c", "d"))
+
+
+def test_re_marking_refreshes_an_id(monkeypatch):
+    monkeypatch.setattr(ni, "SEEN_ACTIONS_MAX", 2)
+    ni.mark_action_seen("a")
+    ni.mark_action_seen("b")
+    ni.mark_action_seen("a")
+    ni.mark_action_seen("c")
+
+    assert ni.seen_action("a")
+    assert not ni.seen_action("b")
+
+
+def test_empty_ids_are_never_seen():
+    ni.mark_action_seen(None)
+    assert ni.seen_action(None) is False
+    assert len(ni._seen_actions) == 0
+
+
+# --------------------------------------------------
+# Marked only after the write
+# --------------------------------------------------
+def test_written_actions_are_marked_seen():
+    _ingest(FakeNotifications(), "a", "b")
+    assert ni.seen_action("a") and ni.seen_action("b")
+
+
+def test_failed_write_leaves_actions_unseen_for_the_retry():
+    results = _ingest(FakeNotifications(fail_with=RuntimeError("primary stepped down")), "a")
+
+    assert isinstance(results[0], RuntimeError)
+    assert not ni.seen_action("a")
+
+
+def test_duplicate_key_errors_count_as_written():
+    duplicate = BulkWriteError({"writeErrors": [{"index": 0, "code": 11000}], "nInserted": 1})
+    results = _ingest(FakeNotifications(fail_with=duplicate), "a", "b")
+
+    assert not any(isinstance(r, Exception) for r in results)
+    assert ni.seen_action("a") and ni.seen_action("b")
+
+
+def test_written_resolves_to_the_inserted_id_or_none_for_duplicates():
+    duplicate = BulkWriteError({"writeErrors": [{"index": 1, "code": 11000}], "nInserted": 1})
+    results = _ingest(FakeNotifications(fail_with=duplicate), "fresh", "again")
+
+    assert results == ["oid-0-0", None]
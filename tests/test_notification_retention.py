@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip("pymongo")
+
+from app.services import notification_retention as nr  # noqa: E402
+from app.services.notification_retention import trim_raw_event  # noqa: E402
+
+ACTION = {
+    "id": "a1",
+    "type": "updateCard",
+    "date": "2026-01-01T00:00:00.000Z",
+    "idMemberCreator": "m1",
+    "memberCreator": {"id": "m1", "fullName": "Ada", "username": "ada", "avatarUrl": "https://…", "initials": "A"},
+    "limits": {"reactions": {"perAction": {"status": "ok"}}},
+    "display": {"translationKey": "action_move_card_from_list_to_list", "entities": {}},
+    "data": {
+        "card": {"id": "c1", "name": "Login", "idShort": 7, "desc": "long body", "pos": 1024},
+        "board": {"id": "b1", "name": "Board", "prefs": {"background": "blue"}},
+        "listBefore": {"id": "l1", "name": "To Do"},
+        "listAfter": {"id": "l2", "name": "Doing"},
+        "old": {"idList": "l1", "desc": "a very long previous description"},
+        "unknownNested": {"huge": "payload"},
+    },
+}
+
+
+def test_keeps_ids_names_and_what_changed():
+    trimmed = trim_raw_event(ACTION)
+
+    assert trimmed == {
+        "id": "a1",
+        "type": "updateCard",
+        "date": "2026-01-01T00:00:00.000Z",
+        "idMemberCreator": "m1",
+        "memberCreator": {"id": "m1", "fullName": "Ada", "username": "ada"},
+        "data": {
+            "card": {"id": "c1", "name": "Login", "idShort": 7},
+            "board": {"id": "b1", "name": "Board"},
+            "listBefore": {"id": "l1", "name": "To Do"},
+            "listAfter": {"id": "l2", "name": "Doing"},
+            "old_fields": ["desc", "idList"],
+        },
+    }
+
+
+def test_comment_text_is_capped(monkeypatch):
+    monkeypatch.setattr(nr, "NOTIFICATION_COMMENT_MAX_CHARS", 5)
+    trimmed = trim_raw_event({"type": "commentCard", "data": {"text": "0123456789"}})
+
+    assert trimmed["data"]["text"] == "01234"
+
+
+def test_tolerates_missing_and_malformed_parts():
+    assert trim_raw_event(None) == {"data": {}}
+    assert trim_raw_event({"data": {"card": "not-a-dict", "old": None}}) == {"data": {}}
@@ -0,0 +1,104 @@
+import pytest
+
+from app.services.pm_serializer import (
+    chunk_pm_data,
+    estimate_tokens,
+    serialize_pm_data,
+)
+
+
+def _board(cards_per_list=10, desc="word " * 60, lists=("To Do", "Done")):
+    return {
+        "lists": [{"name": name} for name in lists],
+        "cards": [
+            {
+                "name": f"{name} card {i}",
+                "list_name": name,
+                "desc": desc,
+                "comments": ["looks good", "ship it"],
+                "checklists": [{"name": "QA", "items": [{"name": "test", "state": "complete"}]}],
+            }
+            for name in lists
+            for i in range(cards_per_list)
+        ],
+    }
+
+
+# --------------------------------------------------
+# serialize_pm_data
+# --------------------------------------------------
+def test_small_board_keeps_full_detail():
+    text, stats = serialize_pm_data(_board(cards_per_list=2), 100_000)
+
+    assert stats["detail_level"] == 0
+    assert stats["max_cards_per_list"] is None
+    assert "> ship it" in text
+    assert "QA: test ✓" in text
+
+
+@pytest.mark.parametrize("budget", [2000, 600, 150, 40])
+def test_output_fits_budget(budget):
+    text, stats = serialize_pm_data(_board(cards_per_list=30), budget)
+
+    assert stats["budget"] == budget
+    assert stats["tokens"] == estimate_tokens(text)
+    # Names-only with one card per list is the floor; above it the budget holds
+    if stats["max_cards_per_list"] != 1:
+        assert stats["tokens"] <= budget
+
+
+def test_tighter_budget_drops_detail_first_then_cards():
+    _, roomy = serialize_pm_data(_board(cards_per_list=30), 100_000)
+    _, tight = serialize_pm_data(_board(cards_per_list=30), 150)
+
+    assert roomy["detail_level"] == 0
+    assert tight["detail_level"] == 3
+    assert tight["max_cards_per_list"] is not None
+
+
+def test_capped_lists_report_hidden_cards():
+    text, stats = serialize_pm_data(_board(cards_per_list=30), 150)
+
+    hidden = 30 - stats["max_cards_per_list"]
+    assert f"- … {hidden} more cards" in text
+
+
+def test_duplicate_descriptions_are_written_once():
+    text, _ = serialize_pm_data(_board(cards_per_list=3, desc="Shared template text"), 100_000)
+
+    assert text.count("Shared template text") == 1
+    assert "(same description as 'To Do card 0')" in text
+
+
+# --------------------------------------------------
+# chunk_pm_data
+# --------------------------------------------------
+def test_chunks_split_large_lists_and_respect_size():
+    chunks = chunk_pm_data(_board(cards_per_list=20), 300)
+
+    assert [c["list_name"] for c in chunks] == sorted(
+        [c["list_name"] for c in chunks], key=["To Do", "Done"].index
+    )
+    todo_parts = [c["part"] for c in chunks if c["list_name"] == "To Do"]
+    assert todo_parts == list(range(1, len(todo_parts) + 1))
+    assert len(todo_parts) > 1
+    # A chunk only exceeds the target when a single card does
+    assert all(estimate_tokens(c["text"]) <= 300 for c in chunks)
+
+
+def test_every_card_lands_in_exactly_one_chunk():
+    board = _board(cards_per_list=20)
+    chunks = chunk_pm_data(board, 300)
+    text = "\n".join(c["text"] for c in chunks)
+
+    for card in board["cards"]:
+        assert text.count(f"- {card['name']}\n") == 1
+
+
+def test_duplicate_descriptions_do_not_reference_other_chunks():
+    chunks = chunk_pm_data(_board(cards_per_list=20, desc="Shared template text " * 10), 200)
+    assert len(chunks) > 2
+
+    # Each chunk is summarized alone, so it must carry the text it refers to
+    for chunk in chunks:
+        assert "  Shared template text" in chunk["text"]
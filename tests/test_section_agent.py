@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("langgraph")
+
+from app.graph.nodes.section_agent import _ordered_groups, merge_sections_node  # noqa: E402
+
+
+def test_groups_follow_template_order():
+    groups = _ordered_groups(["Intro", "Scope", "Design"], ["Design", "Intro"], 1)
+    assert groups == [["Intro"], ["Design"]]
+
+
+def test_unknown_headings_go_last_in_selection_order():
+    groups = _ordered_groups(["Intro"], ["Extra B", "Intro", "Extra A"], 2)
+    assert groups == [["Intro", "Extra B"], ["Extra A"]]
+
+
+def test_group_size_below_one_is_treated_as_one():
+    assert _ordered_groups(["A", "B"], ["A", "B"], 0) == [["A"], ["B"]]
+
+
+def test_merge_skips_failed_sections():
+    merged = merge_sections_node({"sections": [
+        {"index": 1, "content": "## Scope\n\nbody", "ok": True, "cache_hit": True},
+        {"index": 0, "content": "", "ok": False, "error": "timeout", "cache_hit": False},
+        {"index": 2, "content": "## Design\n\nbody", "ok": True, "cache_hit": True},
+    ]})
+
+    assert merged["generated_docs"] == "## Scope\n\nbody\n\n## Design\n\nbody"
+    assert merged["cache_hit"] is False
+    assert not merged.get("generation_error")
+
+
+def test_merge_fails_the_run_when_every_section_failed():
+    merged = merge_sections_node({"sections": [
+        {"index": 0, "content": "", "ok": False, "error": "timeout", "cache_hit": False},
+        {"index": 1, "content": "", "ok": False, "error": "rate limited", "cache_hit": False},
+    ]})
+
+    assert merged["generated_docs"] == ""
+    assert "All 2 sections failed" in merged["generation_error"]
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from app.services import trello_rate_limiter as rl
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rl.time, "monotonic", fake)
+    return fake
+
+
+def _requests_in_window(bucket, clock, window=10.0, step=0.001):
+    """Greedy client: take a token whenever one is available during `window` seconds."""
+    sent = 0
+    end = clock.now + window
+    while clock.now < end:
+        if bucket.delay() == 0:
+            bucket.take()
+            sent += 1
+        else:
+            clock.now += step
+    return sent
+
+
+@pytest.mark.parametrize("rate, burst, limit", [
+    (rl.TRELLO_KEY_RATE, rl.TRELLO_KEY_BURST, 300),
+    (rl.TRELLO_TOKEN_RATE, rl.TRELLO_TOKEN_BURST, 100),
+])
+def test_default_buckets_stay_under_trello_10s_limits(clock, rate, burst, limit):
+    assert burst + 10 * rate <= limit
+
+    bucket = rl.TokenBucket(rate, burst)
+    sent = _requests_in_window(bucket, clock)
+
+    assert sent <= limit
+    assert sent == pytest.approx(burst + 10 * rate, abs=1)
+
+
+def test_drain_holds_bucket_empty(clock):
+    bucket = rl.TokenBucket(rate=5, capacity=50)
+    bucket.drain(2.0)
+
+    clock.now += 1.9
+    assert bucket.delay() > 0
+
+    clock.now += 0.4
+    assert bucket.delay() == 0
+
+
+class FakeResponse:
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+
+def _advance_on_sleep(monkeypatch, clock):
+    async def fake_sleep(seconds):
+        # Real sleeps always overshoot a little; without it float rounding can stall the clock
+        clock.now += seconds + 1e-6
+    monkeypatch.setattr(rl.asyncio, "sleep", fake_sleep)
+
+
+def _record_drains(monkeypatch):
+    drained = []
+    original = rl.TokenBucket.drain
+
+    def drain(self, seconds):
+        drained.append(self)
+        original(self, seconds)
+
+    monkeypatch.setattr(rl.TokenBucket, "drain", drain)
+    return drained
+
+
+def test_token_429_only_drains_token_bucket(clock, monkeypatch):
+    _advance_on_sleep(monkeypatch, clock)
+    drained = _record_drains(monkeypatch)
+    scheduler = rl.TrelloScheduler()
+    responses = [FakeResponse(429, headers={"Retry-After": "5"}), FakeResponse(200)]
+
+    async def send():
+        return responses.pop(0)
+
+    result = asyncio.run(scheduler.run(send, key="k", token="user-a"))
+    assert result.status_code == 200
+
+    key_bucket, token_bucket = scheduler._buckets_for("k", "user-a")
+    assert drained == [token_bucket]
+
+
+def test_key_limit_429_drains_key_bucket(clock, monkeypatch):
+    _advance_on_sleep(monkeypatch, clock)
+    drained = _record_drains(monkeypatch)
+    scheduler = rl.TrelloScheduler()
+    responses = [FakeResponse(429, text='{"error": "API_KEY_LIMIT_EXCEEDED"}'), FakeResponse(200)]
+
+    async def send():
+        return responses.pop(0)
+
+    asyncio.run(scheduler.run(send, key="k", token="user-a"))
+
+    key_bucket, _ = scheduler._buckets_for("k", "user-a")
+    assert drained == [key_bucket]
+
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("motor")
+
+from app.routes import trello_webhook  # noqa: E402
+
+DOC = {
+    "user_id": "u1",
+    "board_id": "b1",
+    "board_name": "Board",
+    "card_id": "c1",
+    "action_type": "createCard",
+    "message": "Card 'Login' created in 'To Do'",
+    "created_at": datetime(2026, 1, 1),
+    "action_id": "a1",
+}
+
+
+@pytest.fixture
+def published(monkeypatch):
+    events = []
+
+    async def publish(db, user_id, event, data):
+        events.append((user_id, event, data))
+
+    monkeypatch.setattr(trello_webhook, "publish", publish)
+    return events
+
+
+def test_fresh_insert_is_published_after_the_write_with_its_id(published):
+    async def main():
+        written = asyncio.get_running_loop().create_future()
+        pending = asyncio.ensure_future(trello_webhook._publish_when_written(None, written, DOC))
+        await asyncio.sleep(0)
+        assert published == []          # nothing pushed before the insert lands
+        written.set_result("oid-1")
+        await pending
+
+    asyncio.run(main())
+
+    assert len(published) == 1
+    user_id, event, data = published[0]
+    assert (user_id, event) == ("u1", "notification")
+    assert data["_id"] == "oid-1"
+    assert data["action_id"] == "a1"
+    assert data["created_at"] == "2026-01-01T00:00:00"
+
+
+def test_duplicate_redelivery_is_not_republished(published):
+    async def main():
+        written = asyncio.get_running_loop().create_future()
+        written.set_result(None)
+        await trello_webhook._publish_when_written(None, written, DOC)
+
+    asyncio.run(main())
+    assert published == []
+
+
+def test_failed_write_is_not_published_and_propagates(published):
+    async def main():
+        written = asyncio.get_running_loop().create_future()
+        written.set_exception(RuntimeError("write failed"))
+        await trello_webhook._publish_when_written(None, written, DOC)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
+    assert published == []
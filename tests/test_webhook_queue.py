@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from app.services import webhook_queue as wq  # noqa: E402
+
+
+def test_board_partition_is_stable_and_in_range():
+    assert wq.board_partition("board-1") == wq.board_partition("board-1")
+    assert all(0 <= wq.board_partition(f"b{i}") < wq.WEBHOOK_PARTITIONS for i in range(200))
+    assert 0 <= wq.board_partition(None) < wq.WEBHOOK_PARTITIONS
+
+
+@pytest.mark.parametrize("count", [1, 3, 8, wq.WEBHOOK_PARTITIONS])
+def test_consumers_own_disjoint_partitions_covering_all(count):
+    owned = [wq.consumer_partitions(i, count) for i in range(count)]
+    flat = [p for partitions in owned for p in partitions]
+
+    assert sorted(flat) == list(range(wq.WEBHOOK_PARTITIONS))
+    assert all(owned)
+
+
+def test_consumer_count_is_capped_at_partitions():
+    async def main():
+        tasks = wq.start_webhook_consumers(None, None, count=wq.WEBHOOK_PARTITIONS + 10)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return len(tasks)
+
+    assert asyncio.run(main()) == wq.WEBHOOK_PARTITIONS
+
+
+def test_board_events_are_handled_in_order_and_ack_tasks_are_tracked(monkeypatch):
+    board_a = "a" * 8
+    partition = wq.board_partition(board_a)
+    queue = [
+        {"_id": i, "partition": partition, "attempts": 1, "payload": {"n": i}}
+        for i in range(5)
+    ]
+    handled, acked, writes = [], [], []
+
+    async def claim(db, partitions):
+        assert partition in partitions
+        return queue.pop(0) if queue else None
+
+    async def ack(db, event, started):
+        acked.append(event["_id"])
+
+    async def handler(payload, db, redelivery):
+        handled.append(payload["n"])
+        written = asyncio.get_running_loop().create_future()
+        writes.append(written)
+        return written
+
+    monkeypatch.setattr(wq, "_claim_event", claim)
+    monkeypatch.setattr(wq, "_ack", ack)
+    monkeypatch.setattr(wq, "WEBHOOK_POLL_INTERVAL", 0.01)
+
+    async def main():
+        consumer = asyncio.create_task(wq._consumer_loop(None, handler, 0, 1))
+        await asyncio.sleep(0.05)
+        pending_acks = len(wq._ack_tasks)
+
+        for written in writes:
+            written.set_result("oid")
+        await asyncio.sleep(0.01)
+
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        return pending_acks
+
+    pending_acks = asyncio.run(main())
+
+    assert handled == [0, 1, 2, 3, 4]
+    assert pending_acks == 5
+    assert acked == [0, 1, 2, 3, 4]
+    assert len(wq._ack_tasks) == 0
+
+
+def test_consumer_survives_queue_write_errors(monkeypatch):
+    queue = [{"_id": i, "partition": 0, "attempts": 1, "payload": {"n": i}} for i in range(3)]
+    handled = []
+
+    async def claim(db, partitions):
+        return queue.pop(0) if queue else None
+
+    async def failing_write(db, event, *args):
+        raise RuntimeError("primary stepped down")
+
+    async def handler(payload, db, redelivery):
+        handled.append(payload["n"])
+        if payload["n"] == 0:
+            raise ValueError("bad payload")      # nack fails
+        if payload["n"] == 1:
+            return None                          # ack fails
+        written = asyncio.get_running_loop().create_future()
+        written.set_result("oid")                # ack fails in the ack task
+        return written
+
+    monkeypatch.setattr(wq, "_claim_event", claim)
+    monkeypatch.setattr(wq, "_ack", failing_write)
+    monkeypatch.setattr(wq, "_nack", failing_write)
+    monkeypatch.setattr(wq, "WEBHOOK_POLL_INTERVAL", 0.01)
+    # The wakeup event binds to the loop it is first awaited in
+    monkeypatch.setattr(wq, "_wakeup", None)
+
+    async def main():
+        consumer = asyncio.create_task(wq._consumer_loop(None, handler, 0, 1))
+        await asyncio.sleep(0.05)
+        alive = not consumer.done()
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        return alive
+
+    assert asyncio.run(main())
+    assert handled == [0, 1, 2]
+    assert len(wq._ack_tasks) == 0
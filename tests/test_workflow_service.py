@@ -0,0 +1,312 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from app.services import workflow_service as ws  # noqa: E402
+
+DATA = {
+    "template": "SRS",
+    "pdf_headings": ["Intro", "Scope"],
+    "selected_headings": ["Intro"],
+}
+
+
+# --------------------------------------------------
+# Flight key
+# --------------------------------------------------
+@pytest.mark.parametrize("field, value", [
+    ("template", "SDD"),
+    ("pdf_headings", ["Intro"]),
+    ("selected_headings", ["Scope"]),
+    ("generation_mode", "sections"),
+    ("pm_token_budget", 5000),
+    ("section_group_size", 2),
+])
+def test_generation_fields_change_the_flight_key(field, value):
+    assert ws._flight_key("u", "b", {**DATA, field: value}) != ws._flight_key("u", "b", DATA)
+
+
+def test_flight_key_ignores_non_generation_fields_and_blank_defaults():
+    same = {**DATA, "template": " SRS ", "llm_timeout": 30, "async": True, "pm_token_budget": None}
+    assert ws._flight_key("u", "b", same) == ws._flight_key("u", "b", DATA)
+
+
+# --------------------------------------------------
+# Stream coalescing
+# --------------------------------------------------
+@pytest.fixture
+def local_flight(monkeypatch):
+    """In-process single_flight (the Mongo lease is not under test here)."""
+    inflight = {}
+
+    async def single_flight(db, key, factory):
+        if key not in inflight:
+            inflight[key] = asyncio.ensure_future(factory())
+        return await asyncio.shield(inflight[key])
+
+    monkeypatch.setattr(ws, "single_flight", single_flight)
+
+
+@pytest.fixture
+def fake_pipeline(monkeypatch):
+    runs = []
+
+    async def _stream_workflow(user_id, project_id, data, db):
+        runs.append(data)
+        yield {"event": "start", "data": {}}
+        await asyncio.sleep(0.01)
+        yield {"event": "chunk", "data": {"text": "## Intro\n", "section": None}}
+        await asyncio.sleep(0.01)
+        yield {"event": "done", "data": {"status": "success", "version": 1}}
+
+    monkeypatch.setattr(ws, "_stream_workflow", _stream_workflow)
+    return runs
+
+
+async def _collect(data):
+    return [item async for item in ws.stream_workflow("u", "b", data, db=object())]
+
+
+def test_identical_streams_share_one_run(local_flight, fake_pipeline):
+    async def main():
+        return await asyncio.gather(_collect(DATA), _collect(dict(DATA)))
+
+    leader, joiner = asyncio.run(main())
+
+    assert len(fake_pipeline) == 1
+    assert [e["event"] for e in leader] == ["start", "chunk", "done"]
+    assert joiner == [{"event": "done", "data": {"status": "success", "version": 1, "joined": True}}]
+
+
+def test_different_generation_settings_do_not_share(local_flight, fake_pipeline):
+    async def main():
+        return await asyncio.gather(_collect(DATA), _collect({**DATA, "generation_mode": "sections"}))
+
+    first, second = asyncio.run(main())
+
+    assert len(fake_pipeline) == 2
+    assert first[-1]["event"] == second[-1]["event"] == "done"
+
+
+def test_bypass_cache_streams_are_never_coalesced(local_flight, fake_pipeline):
+    async def main():
+        forced = {**DATA, "bypass_cache": True}
+        return await asyncio.gather(_collect(forced), _collect(forced))
+
+    asyncio.run(main())
+    assert len(fake_pipeline) == 2
+
+
+# --------------------------------------------------
+# Merging into the previous version
+# --------------------------------------------------
+OLD_DOC = "## Intro\n\nold intro\n\n## Scope\n\nold scope\n\n---\n## Risks\n\nold risks"
+
+
+def test_split_sections_drops_separators():
+    assert ws._split_sections(OLD_DOC) == [
+        ("Intro", "## Intro\n\nold intro"),
+        ("Scope", "## Scope\n\nold scope"),
+        ("Risks", "## Risks\n\nold risks"),
+    ]
+
+
+def test_replace_rewrites_existing_sections_in_place_and_appends_new_ones():
+    merged = ws._replace_sections(OLD_DOC, "## Scope\n\nnew scope\n\n## Glossary\n\nterms")
+
+    assert merged == (
+        "## Intro\n\nold intro\n\n## Scope\n\nnew scope\n\n---\n## Risks\n\nold risks"
+        "\n\n---\n## Glossary\n\nterms"
+    )
+
+
+def test_replace_keeps_the_separator_before_a_replaced_section():
+    merged = ws._replace_sections(OLD_DOC, "## Risks\n\nnew risks")
+    assert merged.endswith("old scope\n\n---\n## Risks\n\nnew risks")
+
+
+class FakeDocs:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+
+    async def find_one(self, query, sort=None):
+        found = [d for d in self.docs if all(d.get(k) == v for k, v in query.items())]
+        return max(found, key=lambda d: d["version"]) if found else None
+
+    async def insert_one(self, doc):
+        self.docs.append(doc)
+
+
+@pytest.fixture
+def published(monkeypatch):
+    events = []
+
+    async def publish(db, user_id, event, data):
+        events.append((event, data))
+
+    monkeypatch.setattr(ws, "publish", publish)
+    return events
+
+
+def _save(db, raw_doc, merge="append"):
+    return asyncio.run(ws._save_generated_doc(db, "u", "b", "SRS", "Board", raw_doc, merge=merge))
+
+
+def _previous(doc):
+    return {"user_id": "u", "project_id": "b", "template_name": "SRS", "version": 1, "generated_docs": doc}
+
+
+def test_replace_mode_saves_regenerated_sections(published):
+    previous = ws.clean_generated_doc("## Intro\n\nold intro", "Board")
+    db = {"generated_docs": FakeDocs([_previous(previous)])}
+
+    saved = _save(db, "## Intro\n\nnew intro", merge="replace")
+
+    assert saved["version"] == 2
+    assert "new intro" in saved["generated_docs"] and "old intro" not in saved["generated_docs"]
+    assert [e for e, _ in published] == ["document_ready"]
+
+
+def test_unchanged_document_is_not_saved_or_published(published):
+    previous = ws.clean_generated_doc("## Intro\n\nsame intro", "Board")
+    db = {"generated_docs": FakeDocs([_previous(previous)])}
+
+    for merge in ws.MERGE_MODES:
+        saved = _save(db, "## Intro\n\nsame intro", merge=merge)
+        assert saved["unchanged"] is True
+        assert saved["version"] == 1
+
+    assert len(db["generated_docs"].docs) == 1
+    assert published == []
+
+
+def test_losing_a_version_race_re_merges_onto_the_winner(published):
+    from pymongo.errors import DuplicateKeyError
+
+    class RacingDocs(FakeDocs):
+        async def insert_one(self, doc):
+            if not getattr(self, "raced", False):
+                # Another worker saves version 2 between our read and our insert
+                self.raced = True
+                self.docs.append({**doc, "generated_docs": ws.clean_generated_doc("## Scope\n\ntheirs", "Board")})
+                raise DuplicateKeyError("E11000 duplicate key")
+            self.docs.append(doc)
+
+    previous = ws.clean_generated_doc("## Intro\n\nintro", "Board")
+    db = {"generated_docs": RacingDocs([_previous(previous)])}
+
+    saved = _save(db, "## Risks\n\nours")
+
+    assert saved["version"] == 3
+    assert "theirs" in saved["generated_docs"] and "ours" in saved["generated_docs"]
+    assert [d["version"] for d in db["generated_docs"].docs] == [1, 2, 3]
+
+
+def test_copying_an_old_version_is_numbered_after_the_latest():
+    db = {"generated_docs": FakeDocs([_previous("v1"), {**_previous("v2"), "version": 2}])}
+
+    copy = asyncio.run(ws.copy_doc_as_new_version(db, _previous("v1")))
+
+    assert copy["version"] == 3 and copy["generated_docs"] == "v1"
+    assert [d["version"] for d in db["generated_docs"].docs] == [1, 2, 3]
+
+
+# --------------------------------------------------
+# Every section failed
+# --------------------------------------------------
+@pytest.fixture
+def failed_sections(monkeypatch):
+    saves = []
+
+    async def prepare(user_id, project_id, data, db):
+        return None, {"input_state": {}, "config": {}, "template_name": "SRS", "board_name": "Board", "merge": "append"}
+
+    async def save(*args, **kwargs):
+        saves.append(args)
+        return {"status": "success"}
+
+    class Workflow:
+        async def ainvoke(self, state, config):
+            return {"generated_docs": "", "generation_error": "All 2 sections failed: timeout"}
+
+        async def astream(self, state, config, stream_mode):
+            yield "updates", {"merge_sections": {"generated_docs": "", "generation_error": "All 2 sections failed: timeout"}}
+
+    monkeypatch.setattr(ws, "_prepare_workflow", prepare)
+    monkeypatch.setattr(ws, "_save_generated_doc", save)
+    monkeypatch.setattr(ws, "workflow", Workflow())
+    return saves
+
+
+def test_execute_reports_an_error_when_every_section_failed(failed_sections):
+    result = asyncio.run(ws._execute_workflow("u", "b", DATA, db=object()))
+
+    assert result == {"status": "error", "message": "All 2 sections failed: timeout"}
+    assert failed_sections == []
+
+
+def test_stream_reports_an_error_when_every_section_failed(failed_sections):
+    async def main():
+        return [item async for item in ws._stream_workflow("u", "b", DATA, db=object())]
+
+    events = asyncio.run(main())
+
+    assert events[-1] == {"event": "error", "data": {"status": "error", "message": "All 2 sections failed: timeout"}}
+    assert failed_sections == []
+
+
+# --------------------------------------------------
+# Request validation
+# --------------------------------------------------
+@pytest.fixture
+def connected(monkeypatch):
+    async def get_user_token(user_id, db):
+        return "token"
+
+    async def resolve_board(user_id, project_id, db):
+        return project_id, "Board"
+
+    monkeypatch.setattr(ws, "get_user_token", get_user_token)
+    monkeypatch.setattr(ws, "resolve_board", resolve_board)
+
+
+def _prepare(data):
+    return asyncio.run(ws._prepare_workflow("u", "b", data, db=object()))
+
+
+@pytest.mark.parametrize("value", ["soon", -5, True, [30], float("nan")])
+def test_invalid_llm_timeout_is_a_request_error(connected, value):
+    error, ctx = _prepare({**DATA, "llm_timeout": value})
+
+    assert ctx is None
+    assert error["status"] == "error" and "llm_timeout" in error["message"]
+
+
+def test_llm_timeout_is_parsed_for_the_graph(connected):
+    _, ctx = _prepare({**DATA, "llm_timeout": "45"})
+    assert ctx["config"]["configurable"]["llm_timeout"] == 45.0
+
+    _, ctx = _prepare(DATA)
+    assert ctx["config"]["configurable"]["llm_timeout"] is None
+
+
+@pytest.mark.parametrize("field", ws.INT_OPTIONS)
+@pytest.mark.parametrize("value", ["lots", "2.5", -1, {"n": 1}])
+def test_invalid_whole_number_options_are_request_errors(connected, field, value):
+    data = {**DATA, field: value}
+
+    # Keying the flight must not fail before validation can answer
+    ws._flight_key("u", "b", data)
+    error, ctx = _prepare(data)
+
+    assert ctx is None
+    assert error["status"] == "error" and field in error["message"]
+
+
+def test_whole_number_options_are_parsed(connected):
+    _, ctx = _prepare({**DATA, "pm_token_budget": "5000", "section_group_size": 2})
+
+    assert ctx["input_state"]["pm_token_budget"] == 5000
+    assert ctx["input_state"]["section_group_size"] == 2